@@ -0,0 +1,196 @@
+"""Account store: accounts.json plus an append-only change log.
+
+accounts.json is the base snapshot (username -> record). add_user.py appends
+changes to accounts.json.log instead of rewriting it, one JSON object per line:
+
+  {"op": "put", "user": "<name>", "rec": {...}}
+  {"op": "del", "user": "<name>"}
+
+AccountStore keeps a username -> record dict in memory and, on refresh, applies
+only the log lines written since the last one, so adding a user costs one
+appended line rather than a rewrite and full re-parse of every account.
+Lookups never wait for a refresh. `add_user.py --compact` folds the log back
+into accounts.json; readers notice the new base and reload it once.
+"""
+import os, json, time, threading
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import fcntl  # optional: serializes writers with --compact (POSIX only)
+except ImportError:
+    fcntl = None
+
+LOG_SUFFIX = ".log"
+RECHECK_SECONDS = 1.0
+
+def log_path(path: str) -> str:
+    return path + LOG_SUFFIX
+
+def _stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+class _WriteLock:
+    """Exclusive lock shared by every writer of one accounts file."""
+
+    def __init__(self, path: str):
+        self.path = path + ".lock"
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+def _apply(index: Dict[str, dict], line: bytes) -> bool:
+    try:
+        entry = json.loads(line)
+        user = str(entry["user"])
+        if entry["op"] == "put":
+            index[user] = entry["rec"]
+        elif entry["op"] == "del":
+            index.pop(user, None)
+        else:
+            return False
+    except (ValueError, KeyError, TypeError):
+        return False
+    return True
+
+def read_all(path: str) -> Dict[str, dict]:
+    """Base snapshot with the whole log applied."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        index = {}
+    try:
+        with open(log_path(path), "rb") as f:
+            for line in f:
+                if line.endswith(b"\n"):
+                    _apply(index, line)
+    except FileNotFoundError:
+        pass
+    return index
+
+def append(path: str, entries: Iterable[dict]) -> int:
+    """Append change records with a single write; returns how many were written."""
+    lines = [json.dumps(e, separators=(",", ":"), sort_keys=True) + "\n" for e in entries]
+    if not lines:
+        return 0
+    data = "".join(lines).encode("utf-8")
+    with _WriteLock(path):
+        fd = os.open(log_path(path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    return len(lines)
+
+def put(username: str, rec: dict) -> dict:
+    return {"op": "put", "user": username, "rec": rec}
+
+def delete(username: str) -> dict:
+    return {"op": "del", "user": username}
+
+def compact(path: str) -> int:
+    """Rewrite accounts.json with the log applied and start an empty log."""
+    with _WriteLock(path):
+        index = read_all(path)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        with open(log_path(path) + ".tmp", "wb"):
+            pass
+        os.replace(log_path(path) + ".tmp", log_path(path))
+    return len(index)
+
+class AccountStore:
+    """In-memory index over accounts.json and its log, refreshed incrementally."""
+
+    def __init__(self, path: str, recheck_seconds: float=RECHECK_SECONDS):
+        self.path = path
+        self.recheck_seconds = recheck_seconds
+        self.stats = {"reloads": 0, "applied": 0, "bad_lines": 0}
+        self._index: Optional[Dict[str, dict]] = None
+        self._base: Optional[Tuple[int, int, int]] = None
+        self._log_ino: Optional[int] = None
+        self._offset = 0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._index or ())
+
+    def get(self, username: str) -> Optional[dict]:
+        self.refresh()
+        return (self._index or {}).get(username)
+
+    def items(self):
+        self.refresh()
+        return list((self._index or {}).items())
+
+    def refresh(self, force: bool=False):
+        if not force and time.monotonic() - self._checked < self.recheck_seconds:
+            return
+        # Only the first load blocks; later lookups use the current index
+        # while one thread applies changes.
+        if not self._lock.acquire(blocking=self._index is None or force):
+            return
+        try:
+            self._checked = time.monotonic()
+            base = _stamp(self.path)
+            log = _stamp(log_path(self.path))
+            rotated = log is not None and self._log_ino is not None and (log[0] != self._log_ino or log[2] < self._offset)
+            if self._index is None or base != self._base or rotated:
+                self._reload(base)
+            elif log is not None and log[2] > self._offset:
+                self._tail(self._index)
+        except ValueError as e:
+            # e.g. accounts.json saved half-edited; retried on the next refresh
+            print(f"[accounts] {self.path}: {e}; keeping the current accounts")
+        finally:
+            self._lock.release()
+
+    def _reload(self, base):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            index = {}
+        self._base = base
+        self._log_ino, self._offset = None, 0
+        self._tail(index)
+        self._index = index   # swapped in whole; readers never see a half-built dict
+        self.stats["reloads"] += 1
+
+    def _tail(self, index: Dict[str, dict]):
+        try:
+            with open(log_path(self.path), "rb") as f:
+                self._log_ino = os.fstat(f.fileno()).st_ino
+                f.seek(self._offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+        end = chunk.rfind(b"\n") + 1   # a line still being written is picked up next time
+        for line in chunk[:end].splitlines():
+            if _apply(index, line):
+                self.stats["applied"] += 1
+            elif line.strip():
+                self.stats["bad_lines"] += 1
+        self._offset += end
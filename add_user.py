@@ -1,10 +1,25 @@
 #!/usr/bin/env python3
-"""Add/update users in accounts.json with PBKDF2 hashes.
+"""Add/update users with PBKDF2 hashes.
 Usage:
   python add_user.py accounts.json username password "/index.html" "/rt/*" "/station_status.html"
 If you omit routes, it will default to ["*"].
+
+Bulk import (CSV with a username,password[,routes][,region] header, or
+JSONL/NDJSON with username, password and optional routes/filters per line):
+  python add_user.py accounts.json --import staff.csv --routes "/index.html" "/rt/*" --jobs 8
+Other maintenance:
+  python add_user.py accounts.json --delete username
+  python add_user.py accounts.json --compact
+
+Single-user changes and --delete rewrite accounts.json (folding in any
+pending log). --import only appends to accounts.json.log, which a running
+server applies without reloading every account; run --compact before
+committing or deploying, since nothing else reads the log.
 """
-import sys, json, os, base64, hashlib
+import sys, json, os, time, csv, base64, hashlib, argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import account_store
 
 def b64u(b: bytes) -> str:
     return base64.urlsafe_b64encode(b).decode("ascii").rstrip("=")
@@ -21,18 +36,87 @@ def pbkdf2_hash(password: str, salt: bytes | None=None, iterations: int=200_000,
         "dklen": dklen,
     }
 
+def _split_routes(value) -> list:
+    if isinstance(value, list):
+        return [str(r) for r in value if str(r)]
+    return [r for r in str(value or "").replace(";", " ").split() if r]
+
+def read_rows(path: str) -> list:
+    """(line, username, password, routes, filters) for each user in a CSV or JSONL file."""
+    rows = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for n, line in enumerate(f, 1):
+                if line.strip():
+                    obj = json.loads(line)
+                    rows.append((n, obj.get("username"), obj.get("password"),
+                                 _split_routes(obj.get("routes")), obj.get("filters")))
+        else:
+            for n, row in enumerate(csv.DictReader(f), 2):
+                region = (row.get("region") or "").strip()
+                rows.append((n, row.get("username"), row.get("password"),
+                             _split_routes(row.get("routes")), {"region": region} if region else None))
+    return rows
+
+def bulk_import(path: str, source: str, default_routes: list, jobs: int) -> int:
+    rows = read_rows(source)
+    errors = []
+    for n, username, password, routes, filters in rows:
+        if not str(username or "").strip() or not password:
+            errors.append(f"{source}:{n}: username and password are required")
+        elif not (routes or default_routes):
+            errors.append(f"{source}:{n}: no routes (add a routes column or pass --routes)")
+        elif filters is not None and not isinstance(filters, dict):
+            errors.append(f"{source}:{n}: filters must be an object")
+    if errors:
+        # nothing is written unless every row is usable
+        print("\n".join(errors[:20]), file=sys.stderr)
+        if len(errors) > 20:
+            print(f"... and {len(errors) - 20} more", file=sys.stderr)
+        sys.exit(1)
+    t0 = time.monotonic()
+    passwords = [str(password) for _, _, password, _, _ in rows]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        hashes = list(pool.map(pbkdf2_hash, passwords, chunksize=max(1, len(passwords) // (jobs * 4))))
+    entries = []
+    for (n, username, password, routes, filters), hashed in zip(rows, hashes):
+        rec = {**hashed, "routes": routes or default_routes}
+        if filters:
+            rec["filters"] = filters
+        entries.append(account_store.put(str(username).strip(), rec))
+    written = account_store.append(path, entries)
+    print(f"Imported {written} users from {source} in {time.monotonic() - t0:.1f}s ({jobs} jobs)")
+    return written
+
 def main():
-    if len(sys.argv) < 4:
+    ap = argparse.ArgumentParser(usage=__doc__.strip().splitlines()[2].strip())
+    ap.add_argument("path", help="accounts.json")
+    ap.add_argument("args", nargs="*", help="username password [routes...]")
+    ap.add_argument("--import", dest="source", help="CSV or JSONL file of users to add/update")
+    ap.add_argument("--routes", nargs="+", default=[], help="routes for imported users without their own")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="hashing processes for --import")
+    ap.add_argument("--delete", metavar="USERNAME", help="remove a user")
+    ap.add_argument("--compact", action="store_true", help="fold accounts.json.log into accounts.json")
+    opts = ap.parse_args()
+
+    if opts.source:
+        bulk_import(opts.path, opts.source, opts.routes, max(1, opts.jobs))
+    elif opts.delete:
+        account_store.append(opts.path, [account_store.delete(opts.delete)])
+        opts.compact = True   # revocations must reach accounts.json itself
+        print(f"Deleted {opts.delete}")
+    elif len(opts.args) >= 2:
+        username, password = opts.args[0], opts.args[1]
+        routes = opts.args[2:] or ["*"]
+        account_store.append(opts.path, [account_store.put(username, {**pbkdf2_hash(password), "routes": routes})])
+        opts.compact = True
+        print(f"Updated {username} with routes: {routes}")
+    elif not opts.compact:
         print(__doc__.strip())
         sys.exit(1)
-    path, username, password = sys.argv[1], sys.argv[2], sys.argv[3]
-    routes = sys.argv[4:] or ["*"]
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    data[username] = {**pbkdf2_hash(password), "routes": routes}
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-    print(f"Updated {username} with routes: {routes}")
+    if opts.compact:
+        n = account_store.compact(opts.path)
+        print(f"Compacted {opts.path}: {n} users")
 
 if __name__ == "__main__":
     main()
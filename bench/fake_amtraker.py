@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""Local stand-in for the amtraker v3 API, with fault injection.
+
+Usage:
+  python bench/fake_amtraker.py [--port 8911] [--trains 250] [--latency 0] [--error-rate 0]
+  python bench/fake_amtraker.py --replay bench/recordings
+  python bench/fake_amtraker.py --record bench/recordings [--count 20]   (needs network, once)
+  AMTRAK_UPSTREAM_BASE=http://127.0.0.1:8911/v3 python server.py
+
+Serves /v3/trains (train number -> [train]), /v3/stations (code -> station)
+and /v3/stale in amtraker's shapes. Trains advance every --tick seconds, so
+consecutive polls see new payloads.
+
+With --replay DIR, payloads come from recorded files instead: DIR/<endpoint>.json,
+or a sequence DIR/<endpoint>-000.json, -001.json, ... that is stepped through
+(and wrapped) once per tick. Endpoints without recordings fall back to the
+synthetic network.
+
+Faults can be changed while running:
+  GET /_fault?latency=5&jitter=1&error_rate=0.5&down=1   (omitted keys keep their value)
+  GET /_stats                                            request/error counters
+latency delays every response, error_rate answers that fraction with 503,
+and down=1 drops connections without a response.
+"""
+import os, json, time, glob, random, argparse, threading
+from urllib.request import Request, urlopen
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STOPS_FILE = os.path.join(BASE_DIR, "public", "data", "stops.json")
+
+ROUTES = ("Acela", "Northeast Regional", "Keystone Service", "Empire Service", "Pacific Surfliner",
+          "Lake Shore Limited", "California Zephyr", "Coast Starlight", "Southwest Chief", "Cardinal")
+FALLBACK_STATIONS = {
+    "BOS": ("Boston South Station", 42.352, -71.055), "NYP": ("New York Penn Station", 40.750, -73.993),
+    "PHL": ("Philadelphia 30th Street", 39.956, -75.182), "WAS": ("Washington Union Station", 38.897, -77.006),
+    "ALB": ("Albany-Rensselaer", 42.641, -73.741), "HAR": ("Harrisburg", 40.262, -76.878),
+    "CHI": ("Chicago Union Station", 41.879, -87.640), "DEN": ("Denver Union Station", 39.753, -105.000),
+    "LAX": ("Los Angeles Union Station", 34.056, -118.236), "SAN": ("San Diego Santa Fe Depot", 32.716, -117.170),
+    "EMY": ("Emeryville", 37.840, -122.292), "SEA": ("Seattle King Street", 47.598, -122.330),
+}
+
+def load_stations() -> dict:
+    """code -> (name, lat, lon), from public/data/stops.json when it has coordinates."""
+    try:
+        with open(STOPS_FILE, "r", encoding="utf-8") as f:
+            stops = json.load(f)
+        out = {code: (s.get("n") or code, float(s["lat"]), float(s["lon"]))
+               for code, s in stops.items() if isinstance(s, dict) and s.get("lat") and s.get("lon")}
+        if len(out) >= 10:
+            return out
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return dict(FALLBACK_STATIONS)
+
+class FakeAmtraker:
+    """Deterministic (seeded) synthetic network; state advances once per tick."""
+
+    def __init__(self, n_trains: int, tick: float, seed: int=1):
+        self.tick = tick
+        self.stations = load_stations()
+        rng = random.Random(seed)
+        codes = sorted(self.stations)
+        self.trains = []
+        for i in range(n_trains):
+            stops = rng.sample(codes, min(len(codes), rng.randint(3, 12)))
+            self.trains.append({"num": str(rng.randint(1, 2999)), "route": rng.choice(ROUTES), "stops": stops,
+                                "start": rng.randint(0, 6 * 3600), "leg": rng.randint(1200, 5400)})
+        self._lock = threading.Lock()
+        self._cache = (None, None)
+
+    def _step(self) -> int:
+        return int(time.time() // self.tick) if self.tick > 0 else 0
+
+    def _iso(self, t: float) -> str:
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t)) + "-05:00"
+
+    def trains_payload(self) -> bytes:
+        step = self._step()
+        with self._lock:
+            if self._cache[0] == step:
+                return self._cache[1]
+        now = step * self.tick if self.tick > 0 else time.time()
+        day = now - (now % 86400)
+        out = {}
+        for i, t in enumerate(self.trains):
+            t0 = day + t["start"]
+            elapsed = max(0.0, now - t0)
+            leg = min(int(elapsed // t["leg"]), len(t["stops"]) - 1)
+            frac = min(1.0, (elapsed % t["leg"]) / t["leg"]) if leg < len(t["stops"]) - 1 else 0.0
+            a = self.stations[t["stops"][leg]]
+            b = self.stations[t["stops"][min(leg + 1, len(t["stops"]) - 1)]]
+            stations = []
+            for j, code in enumerate(t["stops"]):
+                sch = t0 + j * t["leg"]
+                stations.append({"name": self.stations[code][0], "code": code, "tz": "America/New_York", "bus": False,
+                                 "schArr": self._iso(sch), "schDep": self._iso(sch + 120),
+                                 "arr": self._iso(sch + 60 * (i % 7)), "dep": self._iso(sch + 120 + 60 * (i % 7)),
+                                 "arrCmnt": "", "depCmnt": "", "platform": "",
+                                 "status": "Departed" if j < leg else ("Station" if j == leg and frac == 0 else "Enroute")})
+            out.setdefault(t["num"], []).append({
+                "routeName": t["route"], "trainNum": t["num"], "trainNumRaw": t["num"],
+                "trainID": f"{t['num']}-{time.localtime(day).tm_mday}", "provider": "Amtrak", "providerShort": "AMTK",
+                "lat": round(a[1] + (b[1] - a[1]) * frac, 5), "lon": round(a[2] + (b[2] - a[2]) * frac, 5),
+                "trainTimely": "On Time" if i % 7 == 0 else f"{i % 7} Minutes Late",
+                "stations": stations, "heading": "N", "eventCode": t["stops"][leg], "eventTZ": "America/New_York",
+                "eventName": a[0], "origCode": t["stops"][0], "origName": self.stations[t["stops"][0]][0],
+                "destCode": t["stops"][-1], "destName": self.stations[t["stops"][-1]][0],
+                "trainState": "Active" if elapsed > 0 else "Predeparture", "velocity": 0 if frac == 0 else 79.0,
+                "statusMsg": " ", "createdAt": self._iso(t0), "updatedAt": self._iso(now), "lastValTS": self._iso(now),
+                "objectID": i,
+            })
+        body = json.dumps(out).encode("utf-8")
+        with self._lock:
+            self._cache = (step, body)
+        return body
+
+    def stations_payload(self) -> bytes:
+        return json.dumps({code: {"name": name, "code": code, "tz": "America/New_York", "lat": lat, "lon": lon,
+                                  "hasAddress": False, "address1": "", "address2": "", "city": "", "state": "", "zip": 0,
+                                  "trains": []}
+                           for code, (name, lat, lon) in self.stations.items()}).encode("utf-8")
+
+    def stale_payload(self) -> bytes:
+        return json.dumps({"avgLastUpdate": 0, "activeTrains": len(self.trains), "stale": False}).encode("utf-8")
+
+    def payload(self, endpoint: str):
+        build = {"trains": self.trains_payload, "stations": self.stations_payload, "stale": self.stale_payload}.get(endpoint)
+        return build() if build is not None else None
+
+ENDPOINTS = ("trains", "stations", "stale")
+
+class Replay:
+    """Recorded payloads, stepped once per tick; see the module docstring for the layout."""
+
+    def __init__(self, directory: str, tick: float, fallback: FakeAmtraker):
+        self.tick = tick
+        self.fallback = fallback
+        self.frames = {}
+        for name in ENDPOINTS:
+            paths = sorted(glob.glob(os.path.join(directory, f"{name}-*.json"))) or \
+                    [p for p in [os.path.join(directory, f"{name}.json")] if os.path.exists(p)]
+            if paths:
+                self.frames[name] = [open(p, "rb").read() for p in paths]
+        if not self.frames:
+            raise SystemExit(f"{directory}: no recorded payloads ({', '.join(ENDPOINTS)})")
+
+    def payload(self, endpoint: str):
+        frames = self.frames.get(endpoint)
+        if frames is None:
+            return self.fallback.payload(endpoint)
+        step = int(time.time() // self.tick) if self.tick > 0 else 0
+        return frames[step % len(frames)]
+
+def record(base: str, out_dir: str, count: int, interval: float):
+    """Save `count` snapshots of every endpoint, `interval` seconds apart, for --replay."""
+    os.makedirs(out_dir, exist_ok=True)
+    for i in range(count):
+        for name in ENDPOINTS:
+            with urlopen(Request(f"{base}/{name}", headers={"Accept": "application/json"}), timeout=30) as resp:
+                body = resp.read()
+            json.loads(body)   # refuse to record an error page
+            with open(os.path.join(out_dir, f"{name}-{i:03d}.json"), "wb") as f:
+                f.write(body)
+        print(f"recorded set {i + 1}/{count}")
+        if i + 1 < count:
+            time.sleep(interval)
+
+class Faults:
+    def __init__(self, latency: float=0.0, jitter: float=0.0, error_rate: float=0.0, down: bool=False):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.down = down
+        self.stats = {"requests": 0, "errors": 0, "dropped": 0, "by_path": {}}
+        self.lock = threading.Lock()
+
+    def update(self, qs: dict):
+        for key in ("latency", "jitter", "error_rate"):
+            if key in qs:
+                setattr(self, key, float(qs[key][0]))
+        if "down" in qs:
+            self.down = qs["down"][0] not in ("0", "", "false")
+
+    def describe(self) -> dict:
+        return {"latency": self.latency, "jitter": self.jitter, "error_rate": self.error_rate, "down": self.down}
+
+def make_handler(source, faults: Faults):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def send(self, status: int, body: bytes):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            u = urlparse(self.path)
+            if u.path == "/_fault":
+                faults.update(parse_qs(u.query))
+                return self.send(200, json.dumps(faults.describe()).encode("utf-8"))
+            if u.path == "/_stats":
+                with faults.lock:
+                    return self.send(200, json.dumps(dict(faults.stats, faults=faults.describe())).encode("utf-8"))
+
+            with faults.lock:
+                faults.stats["requests"] += 1
+                faults.stats["by_path"][u.path] = faults.stats["by_path"].get(u.path, 0) + 1
+            delay = faults.latency + random.uniform(0, faults.jitter)
+            if delay > 0:
+                time.sleep(delay)
+            if faults.down:
+                with faults.lock:
+                    faults.stats["dropped"] += 1
+                self.close_connection = True
+                return
+            if random.random() < faults.error_rate:
+                with faults.lock:
+                    faults.stats["errors"] += 1
+                return self.send(503, b'{"error":"injected"}')
+
+            body = source.payload(u.path[len("/v3/"):]) if u.path.startswith("/v3/") else None
+            if body is None:
+                return self.send(404, b'{"error":"not_found"}')
+            return self.send(200, body)
+    return Handler
+
+def serve(host: str="127.0.0.1", port: int=8911, trains: int=250, tick: float=15.0,
+          replay: str=None, **faults) -> ThreadingHTTPServer:
+    """Start the fake in a background thread; .faults can be changed directly, .source serves payloads."""
+    f = Faults(**faults)
+    source = FakeAmtraker(trains, tick)
+    if replay:
+        source = Replay(replay, tick, source)
+    srv = ThreadingHTTPServer((host, port), make_handler(source, f))
+    srv.daemon_threads = True
+    srv.faults = f
+    srv.source = source
+    threading.Thread(target=srv.serve_forever, name="fake-amtraker", daemon=True).start()
+    return srv
+
+def main():
+    ap = argparse.ArgumentParser(description="Fake amtraker v3 upstream with fault injection.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8911)
+    ap.add_argument("--trains", type=int, default=250, help="synthetic trains in /v3/trains")
+    ap.add_argument("--tick", type=float, default=15.0, help="seconds between train movements")
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    ap.add_argument("--jitter", type=float, default=0.0, help="extra random latency, 0..jitter seconds")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    ap.add_argument("--down", action="store_true", help="start with connections being dropped")
+    ap.add_argument("--replay", metavar="DIR", help="serve recorded payloads from DIR")
+    ap.add_argument("--record", metavar="DIR", help="record payloads from --upstream into DIR and exit")
+    ap.add_argument("--upstream", default="https://api-v3.amtraker.com/v3", help="base URL for --record")
+    ap.add_argument("--count", type=int, default=10, help="snapshots per endpoint for --record")
+    ap.add_argument("--interval", type=float, default=15.0, help="seconds between --record snapshots")
+    args = ap.parse_args()
+    if args.record:
+        return record(args.upstream, args.record, args.count, args.interval)
+    srv = serve(args.host, args.port, args.trains, args.tick, args.replay, latency=args.latency, jitter=args.jitter,
+                error_rate=args.error_rate, down=args.down)
+    source = f"replaying {args.replay}" if args.replay else f"{args.trains} trains"
+    print(f"Fake amtraker on http://{args.host}:{args.port}/v3 ({source}); faults via /_fault")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+if __name__ == "__main__":
+    main()
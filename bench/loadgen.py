@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""Load test server.py against the local fake upstream and compare with a baseline.
+
+Usage:
+  python bench/loadgen.py [--scenario board,pages,login,mixed] [--duration 20] [--concurrency N]
+                          [--server-args="--workers 2 --async"] [--replay bench/recordings]
+                          [--latency 0.2] [--error-rate 0.05]
+                          [--out results.json] [--save-baseline bench/baselines/default.json]
+                          [--compare bench/baselines/default.json] [--tolerance 0.25]
+
+For each run it starts bench/fake_amtraker.py in-process and server.py as a
+subprocess on free local ports, with a throwaway cache dir, so nothing
+touches the network and nothing is left behind. Every virtual user logs in
+through /auth/login and then loops over its scenario's weighted request mix:
+
+  board   realtime polling: /rt/trains, per-train, per-station, /rt/board
+  pages   page loads: HTML, JS and /data/*.json
+  login   a login burst; every request is a POST /auth/login
+  mixed   board + pages, with an occasional re-login
+
+Per scenario the report has throughput, p50/p95/p99/max latency (overall
+and per request type), error counts, peak and final server RSS (the whole
+process tree under --workers), and the number of upstream calls. The
+report is written as JSON. --compare exits 1 when a scenario regressed
+past --tolerance relative to the baseline file.
+
+The load generator runs in the same box as the server; compare runs from
+the same machine and settings only.
+
+Pass --server-args with "=" (--server-args="--async"): argparse reads a
+separate value that starts with a dash as another option.
+"""
+import os, sys, json, time, random, shlex, socket, argparse, platform, tempfile, threading, subprocess
+import http.client
+from typing import Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+import fake_amtraker
+
+DEFAULT_USER = ("alexjs", "12345")
+SERVER_START_SECONDS = 60
+MAX_BACKOFF_SECONDS = 2.0   # cap on honouring Retry-After, so a run still ends on time
+
+# name -> (default concurrency, [(weight, request kind, path template)])
+SCENARIOS = {
+    "board": (50, [
+        (6, "trains", "/rt/trains"),
+        (2, "train", "/rt/trains/{train}"),
+        (2, "station", "/rt/stations/{station}/trains"),
+        (2, "board", "/rt/board?station={station}"),
+    ]),
+    "pages": (20, [
+        (2, "html", "/index.html"),
+        (1, "html", "/station_detail.html"),
+        (1, "html", "/train_details.html"),
+        (2, "js", "/app.js"),
+        (1, "js", "/station_detail.js"),
+        (1, "js", "/train_details.js"),
+        (2, "data", "/data/stops.json"),
+        (1, "data", "/data/tripmap.json"),
+        (1, "data", "/data/services_by_date.json"),
+    ]),
+    "login": (20, [
+        (1, "login", None),
+    ]),
+    "mixed": (50, [
+        (6, "trains", "/rt/trains"),
+        (2, "train", "/rt/trains/{train}"),
+        (2, "station", "/rt/stations/{station}/trains"),
+        (2, "board", "/rt/board?station={station}"),
+        (1, "html", "/index.html"),
+        (1, "js", "/app.js"),
+        (1, "data", "/data/stops.json"),
+        (0.1, "login", None),
+    ]),
+}
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+def tree_rss_kb(pid: int) -> int:
+    """VmRSS of pid plus all of its descendants (Linux /proc)."""
+    total, todo = 0, [pid]
+    while todo:
+        p = todo.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+            for task in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{task}/children") as f:
+                    todo.extend(int(c) for c in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+class Server:
+    """server.py in a subprocess, pointed at the fake upstream."""
+
+    def __init__(self, upstream: str, extra_args: List[str], cache_dir: str):
+        self.port = free_port()
+        self.log_path = os.path.join(cache_dir, "server.log")
+        env = dict(os.environ, AMTRAK_UPSTREAM_BASE=upstream, AMTRAK_CACHE_DIR=cache_dir,
+                   AMTRAK_SESSION_DB=os.path.join(cache_dir, "sessions.db"), PYTHONUNBUFFERED="1")
+        self._log = open(self.log_path, "wb")
+        self.proc = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "server.py"), "--host", "127.0.0.1",
+                                      "--port", str(self.port)] + extra_args,
+                                     cwd=BASE_DIR, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, user: Tuple[str, str]):
+        deadline = time.time() + SERVER_START_SECONDS
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                break
+            try:
+                cookie = login(self.port, user)
+                status, _, _ = request(http.client.HTTPConnection("127.0.0.1", self.port, timeout=30), "/rt/trains", cookie)
+                if status == 200:
+                    return
+            except (OSError, http.client.HTTPException, LoginFailed):
+                pass
+            time.sleep(0.25)
+        self.stop()
+        with open(self.log_path, "rb") as f:
+            sys.stderr.write(f.read()[-4000:].decode("utf-8", "replace"))
+        raise SystemExit("server did not become ready")
+
+    def rss_kb(self) -> int:
+        return tree_rss_kb(self.proc.pid)
+
+    def stop(self):
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        self._log.close()
+
+class LoginFailed(RuntimeError):
+    def __init__(self, status: int, retry_after: float):
+        super().__init__(f"login failed: HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+def request(conn: http.client.HTTPConnection, path: str, cookie: str, method: str="GET",
+            body: Optional[bytes]=None) -> Tuple[int, int, http.client.HTTPResponse]:
+    headers = {"Cookie": cookie, "Accept-Encoding": "gzip"}
+    if body is not None:
+        headers["Content-Type"] = "application/json"
+    conn.request(method, path, body=body, headers=headers)
+    resp = conn.getresponse()
+    data = resp.read()
+    return resp.status, len(data), resp
+
+def login(port: int, user: Tuple[str, str], conn: Optional[http.client.HTTPConnection]=None) -> str:
+    conn = conn or http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    body = json.dumps({"username": user[0], "password": user[1]}).encode("utf-8")
+    status, _, resp = request(conn, "/auth/login", "", "POST", body)
+    set_cookie = resp.getheader("Set-Cookie") or ""
+    if status != 200 or not set_cookie:
+        try:
+            retry_after = float(resp.getheader("Retry-After") or 0)
+        except ValueError:
+            retry_after = 0.0
+        raise LoginFailed(status, retry_after)
+    return set_cookie.split(";")[0]
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, int] = {}
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, seconds: float, status, nbytes: int):
+        with self._lock:
+            self.samples.setdefault(kind, []).append(seconds)
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            self.bytes += nbytes
+
+def virtual_user(port: int, user: Tuple[str, str], mix, names: dict, deadline: float, rec: Recorder, seed: int):
+    rng = random.Random(seed)
+    weights = [w for w, _, _ in mix]
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    cookie = None
+    while time.time() < deadline:
+        _, kind, template = rng.choices(mix, weights)[0]
+        t0 = time.perf_counter()
+        backoff = 0.0
+        try:
+            if kind == "login" or cookie is None:
+                kind = "login"
+                cookie = login(port, user, conn)
+                status, nbytes = 200, 0
+            else:
+                path = template.format(train=rng.choice(names["trains"]), station=rng.choice(names["stations"]))
+                status, nbytes, resp = request(conn, path, cookie)
+                if status in (429, 503):
+                    backoff = float(resp.getheader("Retry-After") or 0)
+        except LoginFailed as e:
+            # Like a browser: admission control (503/429) means wait, then retry.
+            status, nbytes, backoff = e.status, 0, e.retry_after
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            status, nbytes = type(e).__name__, 0
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        rec.add(kind, time.perf_counter() - t0, status, nbytes)
+        if backoff > 0:
+            time.sleep(min(backoff, MAX_BACKOFF_SECONDS, max(0.0, deadline - time.time())))
+    conn.close()
+
+def summarize(values: List[float]) -> dict:
+    v = sorted(values)
+    ms = lambda x: round(x * 1000, 2)
+    return {"count": len(v), "p50_ms": ms(percentile(v, 50)), "p95_ms": ms(percentile(v, 95)),
+            "p99_ms": ms(percentile(v, 99)), "max_ms": ms(v[-1] if v else 0.0)}
+
+def run_scenario(name: str, args, names: dict, fake) -> dict:
+    default_concurrency, mix = SCENARIOS[name]
+    concurrency = args.concurrency or default_concurrency
+    with tempfile.TemporaryDirectory(prefix="amtrak-bench-") as cache_dir:
+        server = Server(f"http://127.0.0.1:{fake.server_port}/v3", shlex.split(args.server_args), cache_dir)
+        try:
+            server.wait_ready(tuple(args.user))
+            time.sleep(args.warmup)
+            upstream_before = fake.faults.stats["requests"]
+            rec = Recorder()
+            rss_peak = 0
+            deadline = time.time() + args.duration
+            users = [threading.Thread(target=virtual_user, daemon=True,
+                                      args=(server.port, tuple(args.user), mix, names, deadline, rec, args.seed + i))
+                     for i in range(concurrency)]
+            started = time.time()
+            for t in users:
+                t.start()
+            while any(t.is_alive() for t in users):
+                rss_peak = max(rss_peak, server.rss_kb())
+                time.sleep(0.5)
+            elapsed = time.time() - started
+            rss_end = server.rss_kb()
+            upstream_calls = fake.faults.stats["requests"] - upstream_before
+        finally:
+            server.stop()
+    everything = [x for v in rec.samples.values() for x in v]
+    errors = sum(n for s, n in rec.statuses.items() if not (s.isdigit() and int(s) < 400))
+    return dict(summarize(everything), **{
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "rps": round(len(everything) / elapsed, 1) if elapsed else 0.0,
+        "errors": errors,
+        "error_rate": round(errors / len(everything), 4) if everything else 0.0,
+        "statuses": rec.statuses,
+        "bytes_out": rec.bytes,
+        "rss_peak_mb": round(rss_peak / 1024, 1),
+        "rss_end_mb": round(rss_end / 1024, 1),
+        "upstream_calls": upstream_calls,
+        "by_kind": {kind: summarize(v) for kind, v in sorted(rec.samples.items())},
+    })
+
+# metric -> (direction, absolute slack); "up" means larger is worse
+COMPARED = {
+    "rps": ("down", 0.0),
+    "p50_ms": ("up", 1.0),
+    "p95_ms": ("up", 2.0),
+    "p99_ms": ("up", 5.0),
+    "rss_peak_mb": ("up", 5.0),
+    "upstream_calls": ("up", 2),
+}
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regression messages for scenarios present in both reports."""
+    problems = []
+    for name, cur in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for metric, (direction, slack) in COMPARED.items():
+            b, c = base.get(metric), cur.get(metric)
+            if b is None or c is None:
+                continue
+            if direction == "up" and c > b * (1 + tolerance) + slack:
+                problems.append(f"{name}.{metric}: {c} > baseline {b} (+{tolerance:.0%})")
+            if direction == "down" and c < b * (1 - tolerance) - slack:
+                problems.append(f"{name}.{metric}: {c} < baseline {b} (-{tolerance:.0%})")
+        if cur["error_rate"] > base.get("error_rate", 0.0) + 0.01:
+            problems.append(f"{name}.error_rate: {cur['error_rate']} > baseline {base.get('error_rate', 0.0)} + 0.01")
+    return problems
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def main():
+    ap = argparse.ArgumentParser(description="Load test server.py against a local fake upstream.")
+    ap.add_argument("--scenario", default="board,pages,login,mixed", help="comma-separated: " + ",".join(SCENARIOS))
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds of load per scenario")
+    ap.add_argument("--warmup", type=float, default=2.0, help="seconds between server start and load")
+    ap.add_argument("--concurrency", type=int, help="virtual users (default: per scenario)")
+    ap.add_argument("--user", nargs=2, default=list(DEFAULT_USER), metavar=("USER", "PASSWORD"))
+    ap.add_argument("--server-args", default="", help='extra server.py arguments; use the = form, e.g. --server-args="--async"')
+    ap.add_argument("--replay", metavar="DIR", help="serve recorded upstream payloads (see fake_amtraker.py)")
+    ap.add_argument("--trains", type=int, default=250, help="synthetic trains when not replaying")
+    ap.add_argument("--tick", type=float, default=15.0, help="seconds between upstream payload changes")
+    ap.add_argument("--latency", type=float, default=0.0, help="upstream latency, seconds")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls answered 503")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="write the JSON report here")
+    ap.add_argument("--save-baseline", metavar="FILE", help="also write the report as a baseline")
+    ap.add_argument("--compare", metavar="FILE", help="baseline to compare with; exit 1 on regression")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = ap.parse_args()
+
+    scenarios = [s.strip() for s in args.scenario.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        ap.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    fake = fake_amtraker.serve("127.0.0.1", free_port(), args.trains, args.tick, args.replay,
+                               latency=args.latency, error_rate=args.error_rate)
+    trains_payload = json.loads(fake.source.payload("trains"))
+    names = {
+        "trains": sorted(trains_payload) or ["1"],
+        "stations": sorted({st.get("code") for group in trains_payload.values() for t in group
+                            for st in (t.get("stations") or ()) if isinstance(st, dict) and st.get("code")}) or ["NYP"],
+    }
+
+    report = {
+        "meta": {"git": git_revision(), "python": platform.python_version(), "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "args": {k: v for k, v in vars(args).items() if k not in ("out", "save_baseline", "compare")}},
+        "scenarios": {},
+    }
+    for name in scenarios:
+        print(f"[{name}] running {args.duration:g}s ...", flush=True)
+        res = report["scenarios"][name] = run_scenario(name, args, names, fake)
+        print(f"[{name}] {res['rps']} req/s  p50 {res['p50_ms']}ms  p95 {res['p95_ms']}ms  p99 {res['p99_ms']}ms  "
+              f"errors {res['errors']}  rss {res['rss_peak_mb']}MB  upstream {res['upstream_calls']}", flush=True)
+    fake.shutdown()
+
+    text = json.dumps(report, indent=2, sort_keys=True) + "\n"
+    for path in (args.out, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            print(f"wrote {path}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            sys.exit(1)
+        print(f"no regressions against {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""Build public/data/*.json from a GTFS feed (zip file or unpacked directory).
+
+Usage:
+  python build_gtfs.py feed.zip [public/data] [--start YYYYMMDD [--days 180]] [--jobs N] [--force]
+
+Outputs and the GTFS files each one is built from:
+  stops.json             stops.txt                     code -> {n, lat, lon}
+  tripmap.json           trips.txt, routes.txt         tripId -> {svc, rs, rl, ts, hd, dir}
+  services_by_date.json  calendar.txt, calendar_dates  YYYYMMDD -> [service_id, ...]
+  stop_events.json       stop_times.txt                code -> [[arr, dep, tripId], ...]
+
+Every file is read row by row; stop_times.txt is never held in memory, only
+the packed (arr, dep, trip) columns of the output. Each output records the
+fingerprints of its inputs in a state file, and is skipped when they are
+unchanged. Without --start, services_by_date covers the feed's own calendar
+rather than a window around today, so an unchanged feed is never rebuilt just
+because the date moved on. Stale outputs are rebuilt in parallel worker processes and written
+atomically, so a running server never reads a half-written file.
+"""
+import os, io, csv, json, zipfile, hashlib, argparse
+from array import array
+from datetime import date, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUT = os.path.join(BASE_DIR, "public", "data")
+DEFAULT_STATE = os.path.join(os.environ.get("AMTRAK_CACHE_DIR") or os.path.join(BASE_DIR, ".cache"), "gtfs_build.json")
+DEFAULT_DAYS = 180
+MISSING = -1
+
+# output -> GTFS files it depends on (optional files may be absent from the feed)
+OUTPUTS = {
+    "stops.json": ("stops.txt",),
+    "tripmap.json": ("trips.txt", "routes.txt"),
+    "services_by_date.json": ("calendar.txt", "calendar_dates.txt"),
+    "stop_events.json": ("stop_times.txt",),
+}
+
+class Feed:
+    """Row-streaming reader over a GTFS zip or directory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._zip = zipfile.ZipFile(path) if os.path.isfile(path) else None
+        if self._zip is not None:
+            # Feeds are sometimes zipped with a top-level folder; index by base name.
+            self._names = {os.path.basename(i.filename): i for i in self._zip.infolist() if not i.is_dir()}
+
+    def has(self, name: str) -> bool:
+        if self._zip is not None:
+            return name in self._names
+        return os.path.isfile(os.path.join(self.path, name))
+
+    def fingerprint(self, name: str) -> Optional[str]:
+        """Cheap content fingerprint: the zip's CRC32 + size, or sha256 of a plain file."""
+        if not self.has(name):
+            return None
+        if self._zip is not None:
+            info = self._names[name]
+            return f"crc32:{info.CRC:08x}:{info.file_size}"
+        with open(os.path.join(self.path, name), "rb") as f:
+            return "sha256:" + hashlib.file_digest(f, "sha256").hexdigest()
+
+    def rows(self, name: str) -> Iterator[Dict[str, str]]:
+        if not self.has(name):
+            return
+        if self._zip is not None:
+            raw = self._zip.open(self._names[name])
+        else:
+            raw = open(os.path.join(self.path, name), "rb")
+        with io.TextIOWrapper(raw, encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                yield {k.strip(): (v or "").strip() for k, v in row.items() if k is not None}
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+def parse_gtfs_time(s: str) -> Optional[int]:
+    """'25:10:00' -> 90600 seconds after service-day midnight; '' -> None."""
+    if not s:
+        return None
+    h, m, sec = s.split(":")
+    return int(h) * 3600 + int(m) * 60 + int(sec)
+
+def _dump(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+def _write_atomic(path: str, chunks) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp, path)
+
+def _write_object(path: str, items) -> None:
+    """Stream a {key: value} JSON object without building the whole string."""
+    def chunks():
+        yield "{"
+        for i, (k, v) in enumerate(items):
+            yield ("," if i else "") + _dump(str(k)) + ":" + _dump(v)
+        yield "}"
+    _write_atomic(path, chunks())
+
+def build_stops(feed: Feed, out_path: str, **_) -> int:
+    n = 0
+    def items():
+        nonlocal n
+        for r in feed.rows("stops.txt"):
+            if r.get("location_type") not in (None, "", "0"):
+                continue   # stations/entrances/nodes; boards are keyed by stop
+            n += 1
+            yield r["stop_id"], {"n": r.get("stop_name", ""), "lat": r.get("stop_lat", ""), "lon": r.get("stop_lon", "")}
+    _write_object(out_path, items())
+    return n
+
+def build_tripmap(feed: Feed, out_path: str, **_) -> int:
+    routes = {r["route_id"]: (r.get("route_short_name", ""), r.get("route_long_name", ""))
+              for r in feed.rows("routes.txt")}
+    n = 0
+    def items():
+        nonlocal n
+        for r in feed.rows("trips.txt"):
+            rs, rl = routes.get(r.get("route_id", ""), ("", ""))
+            n += 1
+            yield r["trip_id"], {"svc": r.get("service_id", ""), "rs": rs, "rl": rl,
+                                 "ts": r.get("trip_short_name", ""), "hd": r.get("trip_headsign", ""),
+                                 "dir": r.get("direction_id", "")}
+    _write_object(out_path, items())
+    return n
+
+def _ymd(s: str) -> date:
+    return datetime.strptime(s, "%Y%m%d").date()
+
+def feed_window(feed: Feed) -> Optional[tuple]:
+    """(first, last) date covered by calendar.txt and calendar_dates.txt, or None."""
+    dates = []
+    for r in feed.rows("calendar.txt"):
+        dates += (_ymd(r["start_date"]), _ymd(r["end_date"]))
+    dates += [_ymd(r["date"]) for r in feed.rows("calendar_dates.txt")]
+    return (min(dates), max(dates)) if dates else None
+
+def build_services(feed: Feed, out_path: str, start: Optional[str], days: int, **_) -> int:
+    """Active service_ids for each date in [start, start + days], or the whole feed without start."""
+    if start is not None:
+        first = _ymd(start)
+        last = first + timedelta(days=days)
+    else:
+        window = feed_window(feed)
+        if window is None:
+            _write_object(out_path, ())
+            return 0
+        first, last = window
+        days = (last - first).days
+    weekdays = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+    by_date: Dict[date, List[str]] = {first + timedelta(days=i): [] for i in range(days + 1)}
+    for r in feed.rows("calendar.txt"):
+        lo, hi = max(_ymd(r["start_date"]), first), min(_ymd(r["end_date"]), last)
+        runs = [r.get(w) == "1" for w in weekdays]
+        d = lo
+        while d <= hi:
+            if runs[d.weekday()]:
+                by_date[d].append(r["service_id"])
+            d += timedelta(days=1)
+    for r in feed.rows("calendar_dates.txt"):
+        d = _ymd(r["date"])
+        if d not in by_date:
+            continue
+        svc, active = r["service_id"], by_date[d]
+        if r.get("exception_type") == "1" and svc not in active:
+            active.append(svc)
+        elif r.get("exception_type") == "2" and svc in active:
+            active.remove(svc)
+    _write_object(out_path, ((d.strftime("%Y%m%d"), svcs) for d, svcs in by_date.items()))
+    return len(by_date)
+
+def build_stop_events(feed: Feed, out_path: str, **_) -> int:
+    # Per station, a flat int32 column of (arr, dep, trip index) triples: ~12
+    # bytes per stop time instead of a list of Python objects per row.
+    trip_ids: List[str] = []
+    trip_index: Dict[str, int] = {}
+    events: Dict[str, array] = {}
+    n = 0
+    for r in feed.rows("stop_times.txt"):
+        arr = parse_gtfs_time(r.get("arrival_time", ""))
+        dep = parse_gtfs_time(r.get("departure_time", ""))
+        if arr is None and dep is None:
+            continue   # untimed intermediate stop
+        tid = r["trip_id"]
+        ti = trip_index.get(tid)
+        if ti is None:
+            ti = trip_index[tid] = len(trip_ids)
+            trip_ids.append(tid)
+        col = events.get(r["stop_id"])
+        if col is None:
+            col = events[r["stop_id"]] = array("i")
+        col.extend((arr if arr is not None else dep, dep if dep is not None else arr, ti))
+        n += 1
+    def items():
+        for st, col in events.items():
+            yield st, [[col[i], col[i + 1], trip_ids[col[i + 2]]] for i in range(0, len(col), 3)]
+    _write_object(out_path, items())
+    return n
+
+BUILDERS = {
+    "stops.json": build_stops,
+    "tripmap.json": build_tripmap,
+    "services_by_date.json": build_services,
+    "stop_events.json": build_stop_events,
+}
+
+def _run(feed_path: str, name: str, out_dir: str, params: dict) -> int:
+    feed = Feed(feed_path)
+    try:
+        return BUILDERS[name](feed, os.path.join(out_dir, name), **params)
+    finally:
+        feed.close()
+
+def _output_stamp(path: str) -> Optional[List[int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def build(feed_path: str, out_dir: str, state_path: str=DEFAULT_STATE, start: Optional[str]=None,
+          days: int=DEFAULT_DAYS, jobs: Optional[int]=None, force: bool=False) -> Dict[str, Optional[int]]:
+    """Rebuild stale outputs; returns {output: rows written, or None if skipped}."""
+    feed = Feed(feed_path)
+    try:
+        inputs = {name: {f: feed.fingerprint(f) for f in files} for name, files in OUTPUTS.items()}
+    finally:
+        feed.close()
+    params = {"services_by_date.json": {"start": start, "days": days if start else None}}
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+
+    results: Dict[str, Optional[int]] = {}
+    stale = []
+    for name in OUTPUTS:
+        key = {"inputs": inputs[name], "params": params.get(name, {})}
+        prev = state.get(name) or {}
+        unchanged = ({"inputs": prev.get("inputs"), "params": prev.get("params", {})} == key
+                     and prev.get("output") == _output_stamp(os.path.join(out_dir, name)))
+        if unchanged and not force:
+            results[name] = None
+        else:
+            stale.append(name)
+
+    if stale:
+        os.makedirs(out_dir, exist_ok=True)
+        workers = max(1, min(jobs or os.cpu_count() or 1, len(stale)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {name: pool.submit(_run, feed_path, name, out_dir, params.get(name, {})) for name in stale}
+            for name, fut in futures.items():
+                results[name] = fut.result()
+                state[name] = {"inputs": inputs[name], "params": params.get(name, {}),
+                               "output": _output_stamp(os.path.join(out_dir, name))}
+        os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+        with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(state_path + ".tmp", state_path)
+    return {name: results[name] for name in OUTPUTS}
+
+def main():
+    ap = argparse.ArgumentParser(description="Build public/data/*.json from a GTFS feed.")
+    ap.add_argument("feed", help="GTFS .zip or unpacked directory")
+    ap.add_argument("out_dir", nargs="?", default=DEFAULT_OUT)
+    ap.add_argument("--start", help="first service date, YYYYMMDD (default: the feed's first calendar date)")
+    ap.add_argument("--days", type=int, default=DEFAULT_DAYS, help=f"days of services_by_date after --start (default: {DEFAULT_DAYS}); "
+                                                           "ignored without --start, which covers the whole feed calendar")
+    ap.add_argument("--jobs", type=int, help="worker processes (default: CPU count)")
+    ap.add_argument("--state", default=DEFAULT_STATE, help="input-fingerprint state file")
+    ap.add_argument("--force", action="store_true", help="rebuild even if inputs are unchanged")
+    args = ap.parse_args()
+    if args.start:
+        _ymd(args.start)   # validate early, before forking workers
+    results = build(args.feed, args.out_dir, args.state, args.start, args.days, args.jobs, args.force)
+    for name, n in results.items():
+        print(f"{name}: " + ("unchanged" if n is None else f"{n} rows"))
+
+if __name__ == "__main__":
+    main()
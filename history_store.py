@@ -0,0 +1,473 @@
+"""Compressed, time-indexed history of realtime /trains snapshots.
+
+Snapshots go into segment files in one directory, a new segment every
+SEGMENT_SECONDS (or SEGMENT_MAX_BYTES), named by the segment's UTC start:
+
+  20261018T140000.hseg   frames, appended as snapshots arrive
+  20261018T140000.hidx   the segment's index, written when it is sealed
+
+Each frame is a FRAME header (magic, kind, unix time, length) followed by a
+zlib-compressed JSON body. A segment opens with keyframes holding every
+train; every later snapshot is written as deltas against the previous one.
+Both are split into BUCKETS frames by train number, so reading one train
+only inflates its bucket's frames. A delta body is:
+
+  {"put": {key: train}, "patch": {key: patch}, "gone": [key]}
+  patch = {"s": {field: value}, "d": [removed field], "st": {stop index: stop}}
+
+amtraker rewrites timestamps on every train each poll, so deltas are taken
+per field (and per stop) rather than per train.
+
+A segment's index maps train number -> frames that touch it, and station
+code -> train key -> [first seen, last change, route, stop], so train queries
+inflate only that train's frames and station queries read only indexes.
+Segments without an index file (the one being written, or one left by a
+crash) are indexed by scanning them, incrementally.
+"""
+import os, json, time, zlib, struct, calendar, threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+SEGMENT_SUFFIX = ".hseg"
+INDEX_SUFFIX = ".hidx"
+SEGMENT_SECONDS = 3600
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+BUCKETS = 16
+COMPRESS_LEVEL = 6
+INDEX_CACHE = 64   # segment indexes a reader keeps in memory
+
+FRAME = struct.Struct("<4sBdI")  # magic, kind, unix time, body length
+FRAME_MAGIC = b"HFR1"
+KEYFRAME, DELTA = 0, 1
+STOP_FIELDS = ("code", "schArr", "schDep", "arr", "dep", "status", "platform", "arrCmnt", "depCmnt")
+
+_MISSING = object()
+
+def train_key(t: dict) -> str:
+    return f"{t.get('trainNum', '')}|{t.get('trainID', '')}"
+
+def _num(key: str) -> str:
+    return key.split("|", 1)[0]
+
+def _bucket(num: str) -> int:
+    return zlib.crc32(num.encode("utf-8")) % BUCKETS
+
+def _segment_name(start: int) -> str:
+    return time.strftime("%Y%m%dT%H%M%S", time.gmtime(start)) + SEGMENT_SUFFIX
+
+def _segment_start(name: str) -> float:
+    return float(calendar.timegm(time.strptime(name[:15], "%Y%m%dT%H%M%S")))
+
+def _index_path(seg_path: str) -> str:
+    return seg_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+
+def list_segments(directory: str) -> List[str]:
+    """Segment file names, oldest first."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(n for n in names if n.endswith(SEGMENT_SUFFIX) and len(n) == 15 + len(SEGMENT_SUFFIX))
+
+# ---- deltas ----
+def diff(prev: dict, cur: dict) -> dict:
+    """Patch turning prev into cur; see the module docstring."""
+    patch = {}
+    s = {k: v for k, v in cur.items() if k != "stations" and prev.get(k, _MISSING) != v}
+    d = [k for k in prev if k not in cur]
+    old, new = prev.get("stations"), cur.get("stations", _MISSING)
+    if new is not _MISSING and old != new:
+        if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+            patch["st"] = {str(i): b for i, (a, b) in enumerate(zip(old, new)) if a != b}
+        else:
+            s["stations"] = new
+    if s:
+        patch["s"] = s
+    if d:
+        patch["d"] = d
+    return patch
+
+def apply_patch(prev: dict, patch: dict) -> dict:
+    t = dict(prev)
+    for k in patch.get("d", ()):
+        t.pop(k, None)
+    t.update(patch.get("s", ()))
+    st = patch.get("st")
+    if st:
+        stations = list(t.get("stations") or ())
+        for i, stop in st.items():
+            stations[int(i)] = stop
+        t["stations"] = stations
+    return t
+
+# ---- frames ----
+def _encode(kind: int, ts: float, body: dict) -> bytes:
+    data = zlib.compress(json.dumps(body, separators=(",", ":")).encode("utf-8"), COMPRESS_LEVEL)
+    return FRAME.pack(FRAME_MAGIC, kind, ts, len(data)) + data
+
+def _read_frames(f, offset: int) -> Iterator[Tuple[int, float, int, bytes]]:
+    """(kind, time, offset, compressed body) for each complete frame from offset on."""
+    f.seek(offset)
+    while True:
+        head = f.read(FRAME.size)
+        if len(head) < FRAME.size:
+            return
+        magic, kind, ts, n = FRAME.unpack(head)
+        if magic != FRAME_MAGIC:
+            return
+        data = f.read(n)
+        if len(data) < n:
+            return   # still being written; picked up on the next scan
+        yield kind, ts, offset, data
+        offset += FRAME.size + n
+
+def _changes(kind: int, data: bytes, state: Dict[str, dict], num: Optional[str]=None) -> Dict[str, Optional[dict]]:
+    """Trains a frame sets (None for removed ones), optionally only those numbered num."""
+    body = json.loads(zlib.decompress(data))
+    keep = (lambda key: True) if num is None else (lambda key: _num(key) == num)
+    if kind == KEYFRAME:
+        return {k: t for k, t in body["trains"].items() if keep(k)}
+    changed = {k: t for k, t in (body.get("put") or {}).items() if keep(k)}
+    for k, patch in (body.get("patch") or {}).items():
+        prev = state.get(k)
+        if prev is not None and keep(k):
+            changed[k] = apply_patch(prev, patch)
+    for k in body.get("gone") or ():
+        if keep(k):
+            changed[k] = None
+    return changed
+
+class SegmentIndex:
+    """What one segment holds; built while writing or by scanning the file."""
+
+    def __init__(self, start: float):
+        self.start = start
+        self.end = start
+        self.size = 0                                   # bytes of complete frames indexed
+        self.frames: List[Tuple[float, int]] = []       # (time, offset)
+        self.trains: Dict[str, List[int]] = {}          # train number -> frame numbers
+        self.stations: Dict[str, Dict[str, list]] = {}  # code -> key -> [first, changed, route, stop]
+        self.state: Optional[Dict[str, dict]] = {}      # current trains; None once sealed
+
+    def add(self, ts: float, offset: int, size: int, changed: Dict[str, Optional[dict]]):
+        i = len(self.frames)
+        self.frames.append((ts, offset))
+        self.size = offset + size
+        self.end = max(self.end, ts)
+        for key, t in changed.items():
+            frames = self.trains.setdefault(_num(key), [])
+            if not frames or frames[-1] != i:
+                frames.append(i)
+            if t is None:
+                self.state.pop(key, None)
+                continue
+            self.state[key] = t
+            for stop in t.get("stations") or ():
+                if not isinstance(stop, dict):
+                    continue
+                code = str(stop.get("code") or "").upper()
+                if not code:
+                    continue
+                compact = {k: stop[k] for k in STOP_FIELDS if k in stop}
+                seen = self.stations.setdefault(code, {})
+                entry = seen.get(key)
+                if entry is None:
+                    seen[key] = [ts, ts, t.get("routeName"), compact]
+                elif entry[3] != compact:
+                    entry[1], entry[3] = ts, compact
+
+    def scan(self, path: str):
+        """Index frames appended to path since the last scan."""
+        with open(path, "rb") as f:
+            for kind, ts, offset, data in _read_frames(f, self.size):
+                try:
+                    changed = _changes(kind, data, self.state)
+                except (zlib.error, ValueError, KeyError, TypeError):
+                    return
+                self.add(ts, offset, FRAME.size + len(data), changed)
+
+    def dump(self) -> bytes:
+        return zlib.compress(json.dumps({"start": self.start, "end": self.end, "size": self.size, "frames": self.frames,
+                                         "trains": self.trains, "stations": self.stations},
+                                        separators=(",", ":")).encode("utf-8"), COMPRESS_LEVEL)
+
+    @classmethod
+    def load(cls, data: bytes) -> "SegmentIndex":
+        obj = json.loads(zlib.decompress(data))
+        index = cls(obj["start"])
+        index.end, index.size = obj["end"], obj["size"]
+        index.frames = [tuple(fr) for fr in obj["frames"]]
+        index.trains, index.stations = obj["trains"], obj["stations"]
+        index.state = None
+        return index
+
+def _write_index(seg_path: str, index: SegmentIndex):
+    tmp = _index_path(seg_path) + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(index.dump())
+    os.replace(tmp, _index_path(seg_path))
+
+class HistoryRecorder:
+    """Appends /trains snapshots to the current segment, rotating and pruning.
+
+    submit() only hands the snapshot to the recorder thread. If snapshots
+    arrive faster than they are written, only the newest pending one is kept
+    and the next delta covers both.
+    """
+
+    def __init__(self, directory: str, retention_seconds: float, max_bytes: int,
+                 segment_seconds: float=SEGMENT_SECONDS, segment_max_bytes: int=SEGMENT_MAX_BYTES):
+        self.directory = directory
+        self.retention_seconds = retention_seconds
+        self.max_bytes = max_bytes
+        self.segment_seconds = segment_seconds
+        self.segment_max_bytes = segment_max_bytes
+        self.stats = {"snapshots": 0, "frames": 0, "bytes": 0, "merged": 0, "segments_removed": 0, "failures": 0}
+        self._path: Optional[str] = None
+        self._f = None
+        self._index: Optional[SegmentIndex] = None
+        self._pending = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, ts: float, groups: Dict[str, List[dict]]):
+        """Queue a snapshot given as train number -> [trains]."""
+        with self._cond:
+            if self._pending is not None:
+                self.stats["merged"] += 1
+            self._pending = (ts, groups)
+            self._cond.notify()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="rt-history", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self._seal_orphans()
+        except OSError as e:
+            print(f"[history] {self.directory}: {e}")
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                ts, groups = self._pending
+                self._pending = None
+            try:
+                self.record(ts, {train_key(t): t for group in groups.values() for t in group if isinstance(t, dict)})
+            except Exception as e:
+                self.stats["failures"] += 1
+                print(f"[history] recording failed: {e}")
+                self._close()   # the next snapshot starts a fresh segment
+
+    def record(self, ts: float, trains: Dict[str, dict]):
+        self.stats["snapshots"] += 1
+        if (self._f is None or ts - self._index.start >= self.segment_seconds
+                or self._index.size >= self.segment_max_bytes):
+            self._rotate(ts)
+            keyframes: List[Dict[str, dict]] = [{} for _ in range(BUCKETS)]
+            for key, t in trains.items():
+                keyframes[_bucket(_num(key))][key] = t
+            for bucket in keyframes:
+                if bucket:
+                    self._append(KEYFRAME, ts, {"trains": bucket}, bucket)
+            return
+        state = self._index.state
+        deltas: Dict[int, Tuple[dict, dict]] = {}   # bucket -> (body, changed)
+        def delta(key: str) -> Tuple[dict, dict]:
+            b = _bucket(_num(key))
+            if b not in deltas:
+                deltas[b] = ({"put": {}, "patch": {}, "gone": []}, {})
+            return deltas[b]
+        for key, t in trains.items():
+            prev = state.get(key)
+            if prev is None:
+                body, changed = delta(key)
+                body["put"][key] = changed[key] = t
+            elif prev is not t and prev != t:
+                body, changed = delta(key)
+                body["patch"][key] = diff(prev, t)
+                changed[key] = t
+        for key in state:
+            if key not in trains:
+                body, changed = delta(key)
+                body["gone"].append(key)
+                changed[key] = None
+        for b in sorted(deltas):
+            body, changed = deltas[b]
+            self._append(DELTA, ts, {k: v for k, v in body.items() if v}, changed)
+
+    def _append(self, kind: int, ts: float, body: dict, changed: Dict[str, Optional[dict]]):
+        data = _encode(kind, ts, body)
+        offset = self._index.size
+        self._f.write(data)
+        self._f.flush()
+        self._index.add(ts, offset, len(data), changed)
+        self.stats["frames"] += 1
+        self.stats["bytes"] += len(data)
+
+    def _rotate(self, ts: float):
+        self._close()
+        os.makedirs(self.directory, exist_ok=True)
+        start = int(ts)
+        while os.path.exists(os.path.join(self.directory, _segment_name(start))):
+            start += 1
+        self._path = os.path.join(self.directory, _segment_name(start))
+        self._f = open(self._path, "ab")
+        self._index = SegmentIndex(ts)
+        self._prune(ts)
+
+    def _close(self):
+        """Seal the current segment: close it and write its index."""
+        if self._f is None:
+            return
+        f, self._f = self._f, None
+        try:
+            f.close()
+            _write_index(self._path, self._index)
+        except OSError as e:
+            print(f"[history] sealing {self._path}: {e}")
+
+    def _seal_orphans(self):
+        """Index segments a previous run left unsealed."""
+        for name in list_segments(self.directory):
+            path = os.path.join(self.directory, name)
+            if path != self._path and not os.path.exists(_index_path(path)):
+                index = SegmentIndex(_segment_start(name))
+                index.scan(path)
+                _write_index(path, index)
+
+    def _prune(self, now: float):
+        """Drop the oldest sealed segments past retention or over max_bytes."""
+        names = list_segments(self.directory)
+        sizes = {}
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                sizes[name] = os.path.getsize(path) + (os.path.getsize(_index_path(path)) if os.path.exists(_index_path(path)) else 0)
+            except OSError:
+                sizes[name] = 0
+        total = sum(sizes.values())
+        for i, name in enumerate(names[:-1]):   # never the segment just opened
+            if _segment_start(names[i + 1]) >= now - self.retention_seconds and total <= self.max_bytes:
+                break
+            path = os.path.join(self.directory, name)
+            for p in (path, _index_path(path)):
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+            total -= sizes[name]
+            self.stats["segments_removed"] += 1
+
+    def status(self) -> dict:
+        return dict(self.stats, segment=os.path.basename(self._path) if self._f is not None else None,
+                    segment_bytes=self._index.size if self._f is not None else 0)
+
+def _emit_state(ts: float, state: Dict[str, dict], last: Dict[str, Optional[dict]]):
+    for key, t in state.items():
+        if last.get(key, _MISSING) != t:
+            last[key] = t
+            yield ts, key, t
+
+class HistoryReader:
+    """Queries over a history directory; safe to use from any process."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._indexes: "OrderedDict[str, SegmentIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"index_loads": 0, "frames_read": 0}
+
+    def segments(self, t0: float, t1: float) -> List[str]:
+        """Paths of the segments that may hold frames in [t0, t1], oldest first."""
+        names = list_segments(self.directory)
+        out = []
+        for i, name in enumerate(names):
+            end = _segment_start(names[i + 1]) if i + 1 < len(names) else float("inf")
+            if _segment_start(name) <= t1 and end >= t0:
+                out.append(os.path.join(self.directory, name))
+        return out
+
+    def index(self, path: str) -> Optional[SegmentIndex]:
+        with self._lock:
+            index = self._indexes.get(path)
+            try:
+                if index is None or index.state is not None:
+                    try:
+                        with open(_index_path(path), "rb") as f:
+                            index = SegmentIndex.load(f.read())
+                        self.stats["index_loads"] += 1
+                    except FileNotFoundError:
+                        # Unsealed: extend what was scanned so far.
+                        if index is None:
+                            index = SegmentIndex(_segment_start(os.path.basename(path)))
+                        index.scan(path)
+            except (OSError, zlib.error, ValueError, KeyError):
+                self._indexes.pop(path, None)
+                return None
+            self._indexes[path] = index
+            self._indexes.move_to_end(path)
+            while len(self._indexes) > INDEX_CACHE:
+                self._indexes.popitem(last=False)
+            return index
+
+    def train(self, num: str, t0: float, t1: float) -> Iterator[Tuple[float, str, Optional[dict]]]:
+        """(time, train key, train) for each train numbered num as of t0, then each
+        time it changed within [t0, t1]; train is None when it dropped out of the feed."""
+        last: Dict[str, Optional[dict]] = {}
+        started = False   # state as of t0 has been emitted
+        for path in self.segments(t0, t1):
+            index = self.index(path)
+            frames = index.trains.get(num) if index is not None else None
+            if not frames:
+                continue
+            state: Dict[str, dict] = {}
+            try:
+                with open(path, "rb") as f:
+                    for i in frames:
+                        ts, offset = index.frames[i]
+                        if ts > t1:
+                            break
+                        if ts >= t0 and not started:
+                            started = True
+                            yield from _emit_state(t0, state, last)
+                        frame = next(_read_frames(f, offset), None)
+                        if frame is None:
+                            break
+                        self.stats["frames_read"] += 1
+                        for key, t in _changes(frame[0], frame[3], state, num).items():
+                            if t is None:
+                                state.pop(key, None)
+                            else:
+                                state[key] = t
+                            # A keyframe repeats trains that did not change
+                            # across the segment boundary.
+                            if ts >= t0 and last.get(key, _MISSING) != t:
+                                last[key] = t
+                                yield ts, key, t
+                if not started and state:
+                    # Nothing changed between t0 and the end of this segment
+                    # (or t1); segments() only returns ones ending after t0.
+                    started = True
+                    yield from _emit_state(t0, state, last)
+            except (FileNotFoundError, zlib.error, ValueError):
+                continue   # pruned or damaged mid-query
+
+    def station(self, code: str, t0: float, t1: float) -> Dict[str, list]:
+        """train key -> [first seen, last change, route, stop] for trains listing
+        code in segments overlapping [t0, t1]."""
+        out: Dict[str, list] = {}
+        for path in self.segments(t0, t1):
+            index = self.index(path)
+            if index is None:
+                continue
+            for key, (first, changed, route, stop) in (index.stations.get(code) or {}).items():
+                prev = out.get(key)
+                if prev is None:
+                    out[key] = [first, changed, route, stop]
+                elif prev[3] != stop:
+                    out[key] = [prev[0], changed, route, stop]
+        return out
@@ -380,10 +380,10 @@ async function fetchRealtimeDirect(){
 
 async function loadData(){
   const [stops, tripmap, servicesByDate, stopEvents] = await Promise.all([
-    fetch("./data/stops.json", {cache:"no-store"}).then(r=>r.json()),
-    fetch("./data/tripmap.json", {cache:"no-store"}).then(r=>r.json()),
-    fetch("./data/services_by_date.json", {cache:"no-store"}).then(r=>r.json()),
-    fetch("./data/stop_events.json", {cache:"no-store"}).then(r=>r.json()),
+    fetch("./data/stops.json", {cache:"no-cache"}).then(r=>r.json()),
+    fetch("./data/tripmap.json", {cache:"no-cache"}).then(r=>r.json()),
+    fetch("./data/services_by_date.json", {cache:"no-cache"}).then(r=>r.json()),
+    fetch("./data/stop_events.json", {cache:"no-cache"}).then(r=>r.json()),
   ]);
   state.data = {stops, tripmap, servicesByDate, stopEvents};
 }
@@ -25,10 +25,10 @@ async function loadData(){
   const authMe = await fetch("/api/auth/me", {cache:"no-store"}).then(r=>r.ok ? r.json() : null).catch(()=>null);
   const filters = authMe?.filters || {};
   const [stops, tripmap, servicesByDate, stopEvents] = await Promise.all([
-    fetch("./data/stops.json", {cache:"no-store"}).then(r=>r.json()),
-    fetch("./data/tripmap.json", {cache:"no-store"}).then(r=>r.json()),
-    fetch("./data/services_by_date.json", {cache:"no-store"}).then(r=>r.json()),
-    fetch("./data/stop_events.json", {cache:"no-store"}).then(r=>r.json()),
+    fetch("./data/stops.json", {cache:"no-cache"}).then(r=>r.json()),
+    fetch("./data/tripmap.json", {cache:"no-cache"}).then(r=>r.json()),
+    fetch("./data/services_by_date.json", {cache:"no-cache"}).then(r=>r.json()),
+    fetch("./data/stop_events.json", {cache:"no-cache"}).then(r=>r.json()),
   ]);
   const data = {stops, tripmap, servicesByDate, stopEvents};
   // Apply NEC-only filtering
@@ -41,9 +41,9 @@ function formatServiceTime(sec, stationTimeZone(code), serviceDateISO){
 }
 async function loadData(){
   const [stops, tripmap, stopEvents] = await Promise.all([
-    fetch("./data/stops.json", {cache:"no-store"}).then(r=>r.json()),
-    fetch("./data/tripmap.json", {cache:"no-store"}).then(r=>r.json()),
-    fetch("./data/stop_events.json", {cache:"no-store"}).then(r=>r.json()),
+    fetch("./data/stops.json", {cache:"no-cache"}).then(r=>r.json()),
+    fetch("./data/tripmap.json", {cache:"no-cache"}).then(r=>r.json()),
+    fetch("./data/stop_events.json", {cache:"no-cache"}).then(r=>r.json()),
   ]);
   return {stops, tripmap, stopEvents};
 }
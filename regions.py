@@ -0,0 +1,215 @@
+"""Region profiles for accounts restricted to part of the network.
+
+regions.json maps a profile name (what accounts put in filters.region) to:
+
+  {"name": "Northeast Corridor",
+   "stations": ["BOS", "NYP", ...],                    station codes in the region
+   "routes": ["Acela", "Northeast Regional", ...],      route-name substrings, case-insensitive
+   "bboxes": [[min_lat, min_lon, max_lat, max_lon]],    optional train-position areas
+   "polygons": [[[lat, lon], [lat, lon], ...]]}         optional train-position areas
+
+A realtime train is in a region if its route name matches, it lists one of
+the region's stations, or its position falls inside one of the areas. A
+scheduled trip is in a region if its route name matches; profiles without
+routes fall back to trips that call at one of their stations.
+
+Each profile is compiled once: route names into a single regex, stations
+into a frozenset and areas into a grid index, so a train test is a few
+hash lookups plus at most a handful of shape checks.
+"""
+import json, math, re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+GRID_DEGREES = 0.5
+
+STATION_KEYS = ("station", "stationCode", "code", "from", "to", "origin", "destination",
+                "nextStation", "prevStation", "lastStation")
+STATION_LIST_KEYS = ("stations", "stops", "routeStations")
+
+def _position(obj: dict) -> Optional[Tuple[float, float]]:
+    try:
+        lat = float(obj.get("lat", obj.get("latitude")))
+        lon = float(obj.get("lon", obj.get("lng", obj.get("longitude"))))
+    except Exception:
+        return None
+    return lat, lon
+
+class _Area:
+    """A bbox, or a polygon with its bbox; contains() is exact for both."""
+
+    def __init__(self, points: List[Tuple[float, float]], polygon: bool):
+        self.points = points if polygon else None
+        lats = [p[0] for p in points]
+        lons = [p[1] for p in points]
+        self.bbox = (min(lats), min(lons), max(lats), max(lons))
+
+    def contains(self, lat: float, lon: float) -> bool:
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+            return False
+        if self.points is None:
+            return True
+        inside = False
+        pts = self.points
+        j = len(pts) - 1
+        for i in range(len(pts)):
+            (lat_i, lon_i), (lat_j, lon_j) = pts[i], pts[j]
+            if (lon_i > lon) != (lon_j > lon) and lat < (lat_j - lat_i) * (lon - lon_i) / (lon_j - lon_i) + lat_i:
+                inside = not inside
+            j = i
+        return inside
+
+def _cell(lat: float, lon: float) -> Tuple[int, int]:
+    return (math.floor(lat / GRID_DEGREES), math.floor(lon / GRID_DEGREES))
+
+class Region:
+    """One compiled profile from regions.json."""
+
+    def __init__(self, name: str, spec: dict):
+        self.name = name
+        self.label = spec.get("name") or name
+        self.stations = frozenset(str(c).upper() for c in spec.get("stations") or ())
+        routes = [str(r) for r in spec.get("routes") or () if str(r)]
+        self._route_re = re.compile("|".join(re.escape(r) for r in routes), re.IGNORECASE) if routes else None
+        areas = [_Area([(b[0], b[1]), (b[2], b[3])], polygon=False) for b in spec.get("bboxes") or ()]
+        areas += [_Area([(p[0], p[1]) for p in poly], polygon=True) for poly in spec.get("polygons") or () if len(poly) >= 3]
+        self._grid: Dict[Tuple[int, int], List[_Area]] = {}
+        for area in areas:
+            lo_lat, lo_lon = _cell(area.bbox[0], area.bbox[1])
+            hi_lat, hi_lon = _cell(area.bbox[2], area.bbox[3])
+            for i in range(lo_lat, hi_lat + 1):
+                for j in range(lo_lon, hi_lon + 1):
+                    self._grid.setdefault((i, j), []).append(area)
+
+    @property
+    def has_routes(self) -> bool:
+        return self._route_re is not None
+
+    def route_matches(self, route_name: Any) -> bool:
+        return self._route_re is not None and isinstance(route_name, str) and self._route_re.search(route_name) is not None
+
+    def contains_point(self, lat: float, lon: float) -> bool:
+        return any(a.contains(lat, lon) for a in self._grid.get(_cell(lat, lon), ()))
+
+    def _mentions_station(self, t: dict) -> bool:
+        stations = self.stations
+        for k in STATION_KEYS:
+            v = t.get(k)
+            if isinstance(v, str) and v in stations:
+                return True
+        for k in STATION_LIST_KEYS:
+            v = t.get(k)
+            if isinstance(v, list):
+                for it in v:
+                    if isinstance(it, str) and it in stations:
+                        return True
+                    if isinstance(it, dict):
+                        c = it.get("code") or it.get("stationCode") or it.get("station")
+                        if isinstance(c, str) and c in stations:
+                            return True
+        return False
+
+    # ---- realtime payloads ----
+    def keep_train(self, t: Any) -> bool:
+        if not isinstance(t, dict):
+            return False
+        if self.route_matches(t.get("routeName") or t.get("route") or t.get("service") or ""):
+            return True
+        if self.stations and self._mentions_station(t):
+            return True
+        if self._grid:
+            pos = _position(t)
+            if pos is not None and self.contains_point(*pos):
+                return True
+        return False
+
+    def filter_trains(self, payload: Any) -> Any:
+        if isinstance(payload, list):
+            out = [t for t in payload if self.keep_train(t)]
+            return out if out else payload
+        if isinstance(payload, dict):
+            for key in ("trains", "data", "results"):
+                if isinstance(payload.get(key), list):
+                    payload[key] = [t for t in payload[key] if self.keep_train(t)]
+                    return payload
+            if all(isinstance(v, list) for v in payload.values()):
+                # amtraker v3 shape: train number -> [trains]
+                out = {}
+                for num, group in payload.items():
+                    kept = [t for t in group if self.keep_train(t)]
+                    if kept:
+                        out[num] = kept
+                return out
+        return payload
+
+    def filter_stations(self, payload: Any) -> Any:
+        if isinstance(payload, list):
+            out = []
+            for s in payload:
+                if isinstance(s, dict):
+                    code = s.get("code") or s.get("stationCode") or s.get("id")
+                    if isinstance(code, str) and code in self.stations:
+                        out.append(s)
+            return out if out else payload
+        if isinstance(payload, dict):
+            for key in ("stations", "data", "results"):
+                if isinstance(payload.get(key), list):
+                    payload[key] = self.filter_stations(payload[key])
+                    return payload
+            if all(isinstance(v, dict) for v in payload.values()):
+                # amtraker v3 shape: station code -> station
+                return {k: v for k, v in payload.items() if str(k).upper() in self.stations}
+        return payload
+
+    # ---- GTFS-derived public/data ----
+    def allowed_trips(self, tripmap: dict, trips_at: Optional[Callable[[Iterable[str]], Iterable[str]]]=None) -> Tuple[frozenset, frozenset]:
+        """(tripIds, serviceIds) visible in this region.
+
+        trips_at(stations) lists trips calling at any of the stations; it is
+        only used by profiles that define no routes.
+        """
+        if self.has_routes:
+            tids = {str(tid) for tid, meta in (tripmap or {}).items()
+                    if isinstance(meta, dict) and self.route_matches(meta.get("rl") or meta.get("rs") or "")}
+        elif trips_at is not None:
+            tids = {str(tid) for tid in trips_at(self.stations) if tid in tripmap}
+        else:
+            tids = set()
+        svcs = {str(tripmap[tid]["svc"]) for tid in tids if tripmap[tid].get("svc")}
+        return frozenset(tids), frozenset(svcs)
+
+    def filter_data_file(self, relpath: str, raw_bytes: bytes, allowed: Tuple[frozenset, frozenset]) -> bytes:
+        """Filter one public/data/*.json payload; `allowed` comes from allowed_trips()."""
+        try:
+            payload = json.loads(raw_bytes.decode("utf-8"))
+        except Exception:
+            return raw_bytes
+        if not isinstance(payload, dict):
+            return raw_bytes
+        tids, svcs = allowed
+
+        # stops.json: dict keyed by station code
+        if relpath.endswith("stops.json"):
+            out = {k: v for (k, v) in payload.items() if k in self.stations}
+        # tripmap.json: dict keyed by tripId -> meta
+        elif relpath.endswith("tripmap.json"):
+            out = {tid: meta for (tid, meta) in payload.items() if tid in tids}
+        # stop_events.json: dict keyed by station code -> list of [arr, dep, tripId]
+        elif relpath.endswith("stop_events.json"):
+            out = {st: [e for e in evs if isinstance(e, list) and len(e) >= 3 and str(e[2]) in tids]
+                   for st, evs in payload.items() if st in self.stations and isinstance(evs, list)}
+        # services_by_date.json: date -> [serviceIds]
+        elif relpath.endswith("services_by_date.json"):
+            out = {d: [s for s in v if str(s) in svcs] if isinstance(v, list) else v for d, v in payload.items()}
+        else:
+            return raw_bytes
+        return json.dumps(out).encode("utf-8")
+
+def load_regions(path: str) -> Dict[str, Region]:
+    """Compile every profile in a regions.json file; a missing file means no regions."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            specs = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {str(name): Region(str(name), spec) for name, spec in specs.items()}
@@ -1,286 +1,2466 @@
 from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
-from urllib.request import urlopen, Request
 from urllib.error import URLError, HTTPError
-from urllib.parse import urlparse, parse_qs
-import json, os, time, base64, hashlib, hmac, threading, secrets
+from urllib.parse import urlparse, parse_qs, unquote
+from concurrent.futures import ThreadPoolExecutor
+import json, os, io, sys, time, base64, hashlib, hmac, threading, secrets, gzip, socket, selectors, ssl, argparse, asyncio, heapq, random
+import mmap, struct, signal, shutil, subprocess, re, mimetypes, email.utils
+import http.client
+from datetime import datetime
 from typing import Optional, List, Dict, Any, Tuple
+from collections import OrderedDict, deque
+from bisect import bisect_left
 
-AMTRAKER_BASE = "https://api-v3.amtraker.com/v3"
+import stop_store
+import regions
+import account_store
+import history_store
+
+try:
+    import brotli  # optional: enables Content-Encoding: br
+except ImportError:
+    brotli = None
+
+try:
+    import certifi  # optional: CA bundle fallback for upstream TLS
+except ImportError:
+    certifi = None
+
+try:
+    import orjson  # optional: faster parse/serialize for filtered and indexed bodies
+except ImportError:
+    orjson = None
+
+# AMTRAK_UPSTREAM_BASE points the server at another upstream (e.g. bench/fake_amtraker.py).
+AMTRAKER_BASE = os.environ.get("AMTRAK_UPSTREAM_BASE") or "https://api-v3.amtraker.com/v3"
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PUBLIC_DIR = os.path.join(BASE_DIR, "public")
+DATA_DIR = os.path.join(PUBLIC_DIR, "data")
+# Derived binary artifacts (e.g. the mmap'd stop-event store); safe to delete.
+CACHE_DIR = os.environ.get("AMTRAK_CACHE_DIR") or os.path.join(BASE_DIR, ".cache")
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+# === Realtime snapshot config ===
+# Each amtraker endpoint is polled in the background and every /rt request is
+# served from the latest in-memory snapshot (upstream load is O(1) in viewers).
+RT_POLL_INTERVALS = {
+    "trains": _env_float("AMTRAK_RT_POLL_TRAINS", 15),
+    "stations": _env_float("AMTRAK_RT_POLL_STATIONS", 300),
+    "stale": _env_float("AMTRAK_RT_POLL_STALE", 60),
+}
+# A snapshot older than this many poll intervals is refreshed on demand
+# (e.g. when the poller thread is not running or upstream was down).
+RT_MAX_AGE_FACTOR = 3
+# If that refresh fails, the last good snapshot is still served (marked stale)
+# for up to this long.
+RT_STALE_IF_ERROR_SECONDS = _env_float("AMTRAK_RT_STALE_IF_ERROR", 3600)
 
 # === Optional regional filters ===
-NEC_STATION_CODES = {"BOS","BBY","RTE","PVD","KIN","WLY","MYS","NLC","OSB","NHV","BRP","STM","NRO","NYP","NWK","EWR","MET","NBK","PJC","TRE","CWH","PHN","PHL","WIL","NRK","ABD","EDW","BWI","BAL","NCR","WAS"}
-# Rough bounding box covering the Northeast Corridor (fallback)
-NEC_BBOX = {"min_lat": 38.0, "max_lat": 43.6, "min_lon": -77.6, "max_lon": -70.5}
-NEC_ROUTE_NAME_HINTS = ('Acela', 'Northeast Regional', 'Keystone Service', 'Cardinal', 'Carolinian', 'Crescent', 'Palmetto', 'Silver Meteor', 'Silver Star', 'Vermonter')
+# Profiles live in regions.json (see regions.py); an account opts in with
+# "filters": {"region": "<profile>"}.
+REGIONS_FILE = os.environ.get("AMTRAK_REGIONS_FILE") or os.path.join(BASE_DIR, "regions.json")
+REGIONS: Dict[str, regions.Region] = regions.load_regions(REGIONS_FILE)
+
+# === Metrics (Prometheus text format) ===
+# Histogram buckets in seconds, shared by request, upstream and build timings.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bearer token for scrapers; without it /metrics needs a session allowed "/metrics".
+METRICS_TOKEN = os.environ.get("AMTRAK_METRICS_TOKEN") or None
+# Under --workers, how often each process republishes its registry for scrapes
+# answered by a sibling (the answering process always publishes fresh).
+METRICS_PUBLISH_SECONDS = _env_float("AMTRAK_METRICS_PUBLISH", 2.0)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+def _label_str(labels: tuple) -> str:
+    parts = ['%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in labels]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Metrics:
+    """In-process metric registry, rendered in Prometheus text format.
+
+    Recording is a dict lookup and a few adds under one lock (about a
+    microsecond). Values that other components already keep in their stats
+    dicts (sessions, caches, the login pool) are read by collectors at scrape
+    time instead of being recorded twice.
+
+    Under --workers each process keeps its own registry and publishes it to
+    the shared dir (see share()); a scrape on any worker renders every
+    process's samples with a stable worker="<n>" / "supervisor" label, so
+    counters never jump between processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._collectors: List = []
+        self.shared: Optional["SharedDir"] = None
+        self.label = ""
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name: str, labels: tuple=(), value: float=1.0):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: tuple, value: float):
+        key = (name, labels)
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = Histogram(LATENCY_BUCKETS)
+            h.observe(value)
+
+    def collector(self, fn):
+        """fn() -> iterable of (name, labels, value), called on every scrape."""
+        self._collectors.append(fn)
+        return fn
+
+    def share(self, shared: "SharedDir", label: str):
+        """Publish to (and render from) the supervisor's shared dir as worker=label."""
+        self.shared, self.label = shared, label
+        def loop():
+            while True:
+                try:
+                    self.publish()
+                except OSError as e:
+                    print(f"[metrics] publish failed: {e}")
+                time.sleep(METRICS_PUBLISH_SECONDS)
+        threading.Thread(target=loop, name="metrics-publish", daemon=True).start()
+
+    def publish(self):
+        if self.shared is not None:
+            self.shared.publish_metrics(self.label, self.collect())
+
+    def collect(self) -> Dict[str, list]:
+        """name -> [(sample name, labels, value)], collectors included; JSON-safe."""
+        samples: Dict[str, list] = {}
+        with self._lock:
+            for (name, labels), v in self._counters.items():
+                samples.setdefault(name, []).append((name, labels, v))
+            for (name, labels), h in self._histograms.items():
+                out = samples.setdefault(name, [])
+                cum = 0
+                for le, n in zip(h.buckets, h.counts):
+                    cum += n
+                    out.append((name + "_bucket", labels + (("le", "%g" % le),), cum))
+                out.append((name + "_bucket", labels + (("le", "+Inf"),), h.count))
+                out.append((name + "_sum", labels, round(h.sum, 6)))
+                out.append((name + "_count", labels, h.count))
+        for fn in self._collectors:
+            try:
+                for name, labels, v in fn():
+                    samples.setdefault(name, []).append((name, labels, float(v)))
+            except Exception as e:
+                print(f"[metrics] collector failed: {e}")
+        return samples
+
+    def render(self) -> bytes:
+        if self.shared is None:
+            sources = [((), self.collect())]
+        else:
+            self.publish()
+            sources = [((("worker", label),), data) for label, data in self.shared.read_metrics()]
+        merged: Dict[str, List[str]] = {}
+        for extra, data in sources:
+            for name, rows in data.items():
+                out = merged.setdefault(name, [])
+                for sample, labels, v in rows:
+                    out.append(f"{sample}{_label_str(tuple(extra) + tuple(map(tuple, labels)))} {float(v):g}")
+        lines = []
+        for name in sorted(merged):
+            kind, help_text = self._meta.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(merged[name])
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+METRICS = Metrics()
+for _name, _kind, _help in (
+    ("amtrak_http_requests_total", "counter", "Requests by route, method and status code."),
+    ("amtrak_http_request_duration_seconds", "histogram", "Request handling time by route."),
+    ("amtrak_http_response_bytes_total", "counter", "Response body bytes sent by route."),
+    ("amtrak_upstream_request_duration_seconds", "histogram", "Upstream fetch time by endpoint."),
+    ("amtrak_upstream_errors_total", "counter", "Upstream fetch failures by endpoint and error class."),
+    ("amtrak_response_build_seconds", "histogram", "Filter/serialize/compress time on response cache misses."),
+    ("amtrak_login_hash_seconds", "histogram", "PBKDF2 verification time."),
+    ("amtrak_login_wait_seconds", "histogram", "Time logins waited for a verification worker."),
+    ("amtrak_login_rejected_total", "counter", "Logins refused before hashing, by reason."),
+    ("amtrak_sessions_active", "gauge", "Sessions held in memory."),
+    ("amtrak_sessions_total", "counter", "Session lifecycle events."),
+    ("amtrak_response_cache_requests_total", "counter", "Response cache lookups by result."),
+    ("amtrak_response_cache_evictions_total", "counter", "Response cache LRU evictions."),
+    ("amtrak_response_cache_bytes", "gauge", "Bytes held by the response cache."),
+    ("amtrak_snapshot_age_seconds", "gauge", "Age of the current realtime snapshot."),
+    ("amtrak_snapshot_stale_served_total", "counter", "Realtime responses served stale-if-error."),
+    ("amtrak_upstream_circuit_state", "gauge", "Upstream breaker state: 0 closed, 1 half-open, 2 open."),
+    ("amtrak_upstream_inflight", "gauge", "Upstream calls in flight."),
+    ("amtrak_sse_subscribers", "gauge", "Connected realtime stream clients."),
+    ("amtrak_data_reloads_total", "counter", "public/data reloads by result."),
+    ("amtrak_history_written_bytes_total", "counter", "Compressed realtime history bytes written."),
+    ("amtrak_history_snapshots_total", "counter", "Realtime history snapshots by outcome."),
+):
+    METRICS.describe(_name, _kind, _help)
+
+def route_label(path: str) -> str:
+    """Bounded-cardinality route name for metric labels."""
+    p = path.split("?", 1)[0]
+    if p.startswith("/rt/"):
+        parts = p.strip("/").split("/")
+        if len(parts) == 3 and parts[1] == "trains":
+            return "/rt/trains/{num}"
+        if len(parts) == 4 and parts[1] == "stations" and parts[3] == "trains":
+            return "/rt/stations/{code}/trains"
+        return p if p in ("/rt/trains", "/rt/stations", "/rt/stale", "/rt/board", "/rt/history", "/rt/status", "/rt/stream", "/rt/ping") else "/rt/other"
+    if p.startswith("/data/shards/"):
+        return "/data/shards/{path}"
+    if p.startswith("/data/trip/"):
+        return "/data/trip/{id}"
+    if p.startswith("/data/"):
+        return "/data/{file}"
+    if p in ("/auth/login", "/auth/logout", "/auth/me", "/metrics"):
+        return p
+    return "static"
+
+# === Encoded response bodies (ETag + precompression) ===
+COMPRESS_MIN_BYTES = 1024
+PRECOMPRESS_ENCODINGS = ("gzip", "br") if brotli is not None else ("gzip",)
+_ENCODING_SUFFIX = {"gzip": "-gz", "br": "-br"}
+
+def json_loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def json_bytes(obj: Any) -> bytes:
+    """Compact JSON bytes (orjson when installed; its output is equivalent, not identical)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass   # e.g. integers beyond 64 bits; the stdlib encoder handles them
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+class EncodedBody:
+    """A response body plus its strong ETag and lazily built compressed copies.
+
+    Each encoding is compressed at most once per body, so callers should keep
+    the EncodedBody around for as long as the content is current.
+    """
+    __slots__ = ("raw", "etag", "_encoded", "_lock")
+
+    def __init__(self, raw: bytes, tag: str="", etag: Optional[str]=None, encoded: Optional[Dict[str, bytes]]=None):
+        # etag/encoded let a worker adopt a body built elsewhere (see Pack).
+        self.raw = raw
+        if etag is None:
+            digest = hashlib.blake2b(raw, digest_size=12).hexdigest()
+            etag = f'"{tag}-{digest}"' if tag else f'"{digest}"'
+        self.etag = etag
+        self._encoded: Dict[str, bytes] = dict(encoded or {})
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        if not encoding:
+            return self.raw
+        data = self._encoded.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._encoded.get(encoding)
+                if data is None:
+                    if encoding == "br":
+                        data = brotli.compress(self.raw, quality=5)
+                    else:
+                        data = gzip.compress(self.raw, compresslevel=6, mtime=0)
+                    self._encoded[encoding] = data
+        return data
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        if not encoding:
+            return self.etag
+        return self.etag[:-1] + _ENCODING_SUFFIX[encoding] + '"'
+
+def negotiate_encoding(accept: str, size: int) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header (None = identity)."""
+    if size < COMPRESS_MIN_BYTES or not accept:
+        return None
+    offered = {}
+    for part in accept.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    for enc in ("br", "gzip"):
+        if enc == "br" and brotli is None:
+            continue
+        if offered.get(enc, offered.get("*", 0.0)) > 0:
+            return enc
+    return None
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match check that ignores W/ and our per-encoding suffixes."""
+    if not if_none_match:
+        return False
+    base = etag.strip('"')
+    for tok in if_none_match.split(","):
+        tok = tok.strip()
+        if tok == "*":
+            return True
+        if tok.startswith("W/"):
+            tok = tok[2:]
+        tok = tok.strip('"')
+        for suffix in _ENCODING_SUFFIX.values():
+            if tok.endswith(suffix):
+                tok = tok[:-len(suffix)]
+                break
+        if tok == base:
+            return True
+    return False
+
+# === Response cache ===
+RESPONSE_CACHE_BYTES = int(_env_float("AMTRAK_RESPONSE_CACHE_MB", 64) * 1024 * 1024)
+
+class ResponseCache:
+    """Bounded LRU of serialized (and precompressed) response bodies.
+
+    Keys name the endpoint, the content the body is derived from (a snapshot
+    ETag or data version, so identical payloads share entries) and the filter
+    profile. Misses are single-flight: concurrent requests for one key wait
+    for a single build. Bodies are compressed before they are stored so the
+    byte budget covers everything that will be served from them.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._entries: "OrderedDict[tuple, Tuple[Optional[EncodedBody], int]]" = OrderedDict()
+        self._building: Dict[tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        return entry
+
+    def get(self, key: tuple, build) -> Optional[EncodedBody]:
+        """Cached body for key, calling build() -> Optional[EncodedBody] on a miss."""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry[0]
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry[0]
+            try:
+                t0 = time.perf_counter()
+                body = build()
+                size = 64
+                if body is not None:
+                    size += len(body.raw)
+                    if len(body.raw) >= COMPRESS_MIN_BYTES:
+                        size += sum(len(body.encoded(enc)) for enc in PRECOMPRESS_ENCODINGS)
+                METRICS.observe("amtrak_response_build_seconds", (("kind", key[0]),), time.perf_counter() - t0)
+            finally:
+                with self._lock:
+                    self._building.pop(key, None)
+            with self._lock:
+                self.stats["misses"] += 1
+                if size <= self.max_bytes:
+                    self._entries[key] = (body, size)
+                    self.bytes += size
+                    while self.bytes > self.max_bytes:
+                        _, (_, evicted) = self._entries.popitem(last=False)
+                        self.bytes -= evicted
+                        self.stats["evictions"] += 1
+        return body
+
+RESPONSE_CACHE = ResponseCache(RESPONSE_CACHE_BYTES)
+
+# === Materialized /data variants ===
+def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def session_region(session: Optional[dict]) -> Optional[str]:
+    region = ((session or {}).get("filters") or {}).get("region")
+    return str(region) if region else None
+
+def data_profile(session: Optional[dict]) -> Optional[str]:
+    """Filter profile name applied to /data responses for this session (None = unfiltered).
+
+    Sessions naming a profile that is not loaded are refused by
+    Handler.require_auth, so this never widens a restricted account.
+    """
+    region = session_region(session)
+    if region is not None and region not in REGIONS:
+        raise KeyError(f"unknown region profile {region!r}")
+    return region
+
+def warn_unknown_regions():
+    """Log accounts whose region profile is missing from REGIONS_FILE; they get 403s."""
+    missing = {}
+    for username, rec in ACCOUNTS.items():
+        region = session_region(rec if isinstance(rec, dict) else None)
+        if region is not None and region not in REGIONS:
+            missing.setdefault(region, []).append(username)
+    for region, users in sorted(missing.items()):
+        print(f"[regions] profile {region!r} is not in {REGIONS_FILE}; "
+              f"realtime and /data requests from {', '.join(sorted(users))} will be refused")
+
+# Every profile a DataVersion pre-builds bodies for.
+DATA_PROFILES = (None,) + tuple(REGIONS)
+
+# === Schedule index (departure/arrival boards) ===
+BOARD_DEFAULT_LIMIT = 50
+BOARD_MAX_LIMIT = 500
+
+def parse_board_time(v: Optional[str], default: int) -> int:
+    """Seconds after service-day midnight from "HH:MM[:SS]" or plain seconds."""
+    if v is None or v == "":
+        return default
+    if ":" in v:
+        parts = [int(x) for x in v.split(":")]
+        while len(parts) < 3:
+            parts.append(0)
+        return parts[0] * 3600 + parts[1] * 60 + parts[2]
+    return int(v)
+
+class ScheduleIndex:
+    """Board queries over the mmap'd stop-event store plus tripmap/services.
+
+    Built once per DataVersion from the documents that version parsed. Station
+    events live in a StopEventStore (see stop_store.py), already sorted by
+    departure and by arrival, so a board window is a bisect followed by a
+    short scan.
+    """
+
+    FILES = ("stop_events.json", "tripmap.json", "services_by_date.json")
+
+    def __init__(self, data_dir: str, docs: Dict[str, Any]):
+        self.data_dir = data_dir
+        self.store = stop_store.open_store(os.path.join(data_dir, "stop_events.json"), CACHE_DIR)
+        self.tripmap = docs["tripmap.json"]
+        self.services_by_date = docs["services_by_date.json"]
+        self.stops = docs.get("stops.json") or {}
+        self._active: Dict[str, frozenset] = {}
+        self._region_trips = {name: region.allowed_trips(self.tripmap, self.trips_at)
+                              for name, region in REGIONS.items()}
+        self._bodies: Dict[tuple, Any] = {}   # memoized EncodedBody / ShardSet per (kind, profile)
+        self._bodies_lock = threading.Lock()
+
+    def prime(self, key: tuple, value: Any):
+        """Install a body/ShardSet that was built elsewhere (a published DataVersion)."""
+        with self._bodies_lock:
+            self._bodies[key] = value
+
+    def _memo_body(self, key: tuple, build) -> EncodedBody:
+        body = self._bodies.get(key)
+        if body is None:
+            with self._bodies_lock:
+                body = self._bodies.get(key)
+                if body is None:
+                    body = self._bodies[key] = EncodedBody(json.dumps(build()).encode("utf-8"))
+        return body
+
+    def trips_at(self, stations) -> set:
+        return {tid for st in stations for _, _, tid in self.store.events(st)}
+
+    def region_allowed(self, profile: str) -> Tuple[frozenset, frozenset]:
+        """(tripIds, serviceIds) visible under a region profile."""
+        return self._region_trips[profile]
+
+    def trip_stops(self, tid: str, profile: Optional[str]=None) -> List[Tuple[str, int, int]]:
+        stops = self.store.trip_stops(tid)
+        if profile is not None:
+            if tid not in self._region_trips[profile][0]:
+                return []
+            stations = REGIONS[profile].stations
+            stops = [s for s in stops if s[0] in stations]
+        return stops
+
+    def trip(self, tid: str, profile: Optional[str]=None) -> Optional[dict]:
+        """Ordered stop sequence of one trip, or None if unknown/not visible."""
+        meta = self.tripmap.get(tid)
+        stops = self.trip_stops(tid, profile)
+        if meta is None or not stops:
+            return None
+        opt = lambda t: t if t != stop_store.MISSING else None
+        return {
+            "tripId": tid,
+            "meta": meta,
+            "origin": stops[0][0],
+            "terminus": stops[-1][0],
+            "stops": [{"station": st, "name": (self.stops.get(st) or {}).get("n"), "arr": opt(a), "dep": opt(d)}
+                      for st, a, d in stops],
+        }
+
+    def shards(self, profile: Optional[str]=None) -> "ShardSet":
+        key = ("shards", profile)
+        shards = self._bodies.get(key)
+        if shards is None:
+            with self._bodies_lock:
+                shards = self._bodies.get(key)
+                if shards is None:
+                    shards = self._bodies[key] = ShardSet(self, profile)
+        return shards
+
+    def trip_origins_body(self, profile: Optional[str]=None) -> EncodedBody:
+        """tripId -> origin station code for every trip visible under profile."""
+        def build():
+            if profile is None:
+                return {tid: self.store.origin(tid) for tid in self.store.trip_ids}
+            out = {}
+            for tid in sorted(self._region_trips[profile][0]):
+                stops = self.trip_stops(tid, profile)
+                if stops:
+                    out[tid] = stops[0][0]
+            return out
+        return self._memo_body(("origins", profile), build)
+
+    def has_station(self, station: str, profile: Optional[str]=None) -> bool:
+        """Known to the feed (stops or stop events) and visible under profile."""
+        if profile is not None and station not in REGIONS[profile].stations:
+            return False
+        return station in self.store.station_index or station in self.stops
+
+    def active_services(self, ymd: str) -> frozenset:
+        svcs = self._active.get(ymd)
+        if svcs is None:
+            svcs = frozenset(str(s) for s in (self.services_by_date.get(ymd) or []))
+            self._active[ymd] = svcs
+        return svcs
+
+    def board(self, station: str, ymd: str, kind: str, t_from: int, t_to: int,
+              limit: int, profile: Optional[str]=None) -> List[dict]:
+        if profile is not None and station not in REGIONS[profile].stations:
+            return []
+        allowed = self._region_trips[profile][0] if profile is not None else None
+        active = self.active_services(ymd)
+        is_dep = kind == "departures"
+        trip_ids = self.store.trip_ids
+        rows = []
+        for t, ti in self.store.window(station, kind, t_from, t_to):
+            tid = trip_ids[ti]
+            meta = self.tripmap.get(tid)
+            if not meta or str(meta.get("svc")) not in active:
+                continue
+            if allowed is not None and tid not in allowed:
+                continue
+            route = (meta.get("rl") or "").strip() or (meta.get("rs") or "").strip() or "Train"
+            if is_dep:
+                to = (meta.get("hd") or "").strip() or "--"
+            else:
+                o = self.store.origin(tid)
+                to = ((self.stops.get(o) or {}).get("n") or o) if o else "--"
+            rows.append({
+                "tripId": tid,
+                "t": t,
+                "no": (meta.get("ts") or "").strip() or (meta.get("rs") or "").strip() or "--",
+                "train": route,
+                "to": to,
+            })
+            if len(rows) >= limit:
+                break
+        return rows
+
+class ShardSet:
+    """Per-station and per-region slices of the schedule, plus a manifest.
+
+    A station shard holds that station's stop_events plus exactly the
+    tripmap, services_by_date, origin and stop entries its rows reference,
+    so a station page needs a few KB instead of every /data file. Bodies
+    carry content-hash ETags, so a schedule change only invalidates the
+    shards whose content actually changed.
+    """
+
+    def __init__(self, index: "ScheduleIndex", profile: Optional[str]):
+        self.profile = profile
+        self.bodies: Dict[str, EncodedBody] = {}
+        manifest = {"profile": profile or "all", "stations": {}, "regions": {}}
+        for st in index.store.stations:
+            if profile is not None and st not in REGIONS[profile].stations:
+                continue
+            self._add(manifest["stations"], st, f"stations/{st}.json", self._slice(index, [st], profile))
+        for name, region in REGIONS.items():
+            if profile is not None and name != profile:
+                continue
+            stations = [st for st in index.store.stations if st in region.stations]
+            self._add(manifest["regions"], name, f"regions/{name}.json", self._slice(index, stations, name))
+        self.bodies["manifest.json"] = EncodedBody(json.dumps(manifest).encode("utf-8"))
+
+    @classmethod
+    def from_bodies(cls, profile: Optional[str], bodies: Dict[str, EncodedBody]) -> "ShardSet":
+        shards = cls.__new__(cls)
+        shards.profile = profile
+        shards.bodies = bodies
+        return shards
+
+    def _add(self, table: dict, key: str, relpath: str, payload: dict):
+        body = EncodedBody(json.dumps(payload).encode("utf-8"))
+        self.bodies[relpath] = body
+        table[key] = {"path": f"/data/shards/{relpath}", "etag": body.etag, "bytes": len(body.raw)}
+
+    @staticmethod
+    def _slice(index: "ScheduleIndex", stations: List[str], profile: Optional[str]) -> dict:
+        opt = lambda t: t if t != stop_store.MISSING else None
+        stop_events, trips = {}, set()
+        allowed = index.region_allowed(profile)[0] if profile is not None else None
+        for st in stations:
+            evs = []
+            for a, d, tid in index.store.events(st):
+                if tid not in index.tripmap or (allowed is not None and tid not in allowed):
+                    continue
+                evs.append([opt(a), opt(d), tid])
+                trips.add(tid)
+            stop_events[st] = evs
+        tripmap = {tid: index.tripmap[tid] for tid in sorted(trips)}
+        svcs = {str(m.get("svc")) for m in tripmap.values()}
+        services = {}
+        for ymd, day in index.services_by_date.items():
+            active = [sv for sv in day if str(sv) in svcs] if isinstance(day, list) else []
+            if active:
+                services[ymd] = active
+        origins = {}
+        for tid in tripmap:
+            stops = index.trip_stops(tid, profile)
+            if stops:
+                origins[tid] = stops[0][0]
+        codes = set(stations) | set(origins.values())
+        return {
+            "stations": stations,
+            "stops": {c: index.stops[c] for c in sorted(codes) if c in index.stops},
+            "stop_events": stop_events,
+            "tripmap": tripmap,
+            "services_by_date": services,
+            "trip_origins": origins,
+        }
+
+    def write(self, out_dir: str):
+        for relpath, body in self.bodies.items():
+            path = os.path.join(out_dir, *relpath.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(body.raw)
+            os.replace(path + ".tmp", path)
+
+# === Data versions ===
+DATA_POLL_SECONDS = _env_float("AMTRAK_DATA_POLL", 2)
+
+def data_dir_stamp(data_dir: str) -> tuple:
+    """(name, mtime_ns, size) of every top-level *.json file in data_dir."""
+    try:
+        names = sorted(n for n in os.listdir(data_dir) if n.endswith(".json"))
+    except OSError:
+        return ()
+    out = []
+    for name in names:
+        stamp = _file_stamp(os.path.join(data_dir, name))
+        if stamp is not None:
+            out.append((name,) + stamp)
+    return tuple(out)
+
+class DataVersion:
+    """One consistent generation of public/data and everything derived from it.
+
+    All files are read, parsed and validated together, and every body a
+    request can ask for (filtered variants, compressed copies, trip origins,
+    shards) is built up front. A request that holds a DataVersion never sees
+    a mix of generations and never waits on a rebuild.
+    """
+
+    def __init__(self, data_dir: str):
+        self.stamp = data_dir_stamp(data_dir)
+        raw: Dict[str, bytes] = {}
+        for name, _, _ in self.stamp:
+            with open(os.path.join(data_dir, name), "rb") as f:
+                raw[name] = f.read()
+        docs = {name: json.loads(data) for name, data in raw.items()}
+        for name in ScheduleIndex.FILES:
+            if not isinstance(docs.get(name), dict):
+                raise ValueError(f"{name}: missing or not a JSON object")
+        h = hashlib.blake2b(digest_size=6)
+        for name in sorted(raw):
+            h.update(f"{name}:{len(raw[name])}:".encode("utf-8"))
+            h.update(raw[name])
+        self.id = h.hexdigest()
+        self.loaded_at = time.time()
+
+        self.index = ScheduleIndex(data_dir, docs)
+        stamps = {name: (mtime, size) for name, mtime, size in self.stamp}
+        if self.index.store.stamp != stamps["stop_events.json"] or data_dir_stamp(data_dir) != self.stamp:
+            raise ValueError("data files changed while loading")
+
+        self.bodies: Dict[Tuple[str, Optional[str]], EncodedBody] = {}
+        for name, data in raw.items():
+            for profile in DATA_PROFILES:
+                if profile is not None:
+                    data_for = REGIONS[profile].filter_data_file(name, data, self.index.region_allowed(profile))
+                else:
+                    data_for = data
+                self.bodies[(name, profile)] = EncodedBody(data_for)
+        for _, body in self.all_bodies():
+            if len(body.raw) >= COMPRESS_MIN_BYTES:
+                for enc in PRECOMPRESS_ENCODINGS:
+                    body.encoded(enc)
+
+    @classmethod
+    def from_pack(cls, data_dir: str, pack: "Pack") -> "DataVersion":
+        """Adopt a version another process built and published with write_pack().
+
+        Bodies are slices of the mmap'd pack, so every worker shares one copy
+        of the page cache; only the documents boards need are parsed here.
+        """
+        ver = cls.__new__(cls)
+        meta = pack.meta
+        ver.id = meta["id"]
+        ver.stamp = tuple(tuple(s) for s in meta["stamp"])
+        ver.loaded_at = time.time()
+        bodies = {key: EncodedBody(pack.get(key), etag=info["etag"],
+                                   encoded={enc: pack.get(f"{key}|{enc}") for enc in info["encodings"]})
+                  for key, info in meta["bodies"].items()}
+        docs = {name: json.loads(bytes(pack.get(f"file::{name}")))
+                for name in ("tripmap.json", "services_by_date.json", "stops.json") if f"file::{name}" in bodies}
+        for name in ScheduleIndex.FILES[1:]:
+            if name not in docs:
+                raise ValueError(f"{name}: missing from data pack")
+        ver.index = ScheduleIndex(data_dir, docs)
+        stamps = {name: (mtime, size) for name, mtime, size in ver.stamp}
+        if ver.index.store.stamp != stamps.get("stop_events.json"):
+            raise ValueError("stop_events.json on disk does not match the published version")
+        ver.bodies = {}
+        shard_bodies: Dict[Optional[str], Dict[str, EncodedBody]] = {p: {} for p in DATA_PROFILES}
+        for key, body in bodies.items():
+            kind, profile, name = key.split(":", 2)
+            profile = profile or None
+            if kind == "file":
+                ver.bodies[(name, profile)] = body
+            elif kind == "origins":
+                ver.index.prime(("origins", profile), body)
+            elif kind == "shard":
+                shard_bodies.setdefault(profile, {})[name] = body
+        for profile, sb in shard_bodies.items():
+            ver.index.prime(("shards", profile), ShardSet.from_bodies(profile, sb))
+        return ver
+
+    def all_bodies(self):
+        """(pack key, body) for everything this version serves."""
+        for (name, profile), body in self.bodies.items():
+            yield f"file:{profile or ''}:{name}", body
+        for profile in DATA_PROFILES:
+            yield f"origins:{profile or ''}:", self.index.trip_origins_body(profile)
+            for relpath, body in self.index.shards(profile).bodies.items():
+                yield f"shard:{profile or ''}:{relpath}", body
+
+    def body(self, name: str, profile: Optional[str]) -> Optional[EncodedBody]:
+        return self.bodies.get((name, profile))
+
+class DataVersionManager:
+    """Owns the current DataVersion and swaps in a fully built successor.
+
+    A watcher thread polls the data directory. Deploys replace files one at a
+    time, so a change is only loaded once the directory stamp has been stable
+    for a whole poll interval; the new version is then built off to the side
+    and published with a single reference assignment. A version that fails to
+    load or validate is logged and the current one keeps serving.
+
+    Under --workers, follow() makes a worker adopt the versions the
+    supervisor publishes instead of building its own.
+    """
+
+    def __init__(self, data_dir: str, interval: float):
+        self.data_dir = data_dir
+        self.interval = interval
+        self.current: Optional[DataVersion] = None
+        self.last_error: Optional[str] = None
+        self.stats = {"loads": 0, "failures": 0}
+        self.shared: Optional["SharedDir"] = None
+        self._failed_stamp: Optional[tuple] = None
+        self._loaded_stamp: Optional[tuple] = None
+        self._listeners: List = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def on_update(self, fn):
+        """Call fn(version) after each successful swap."""
+        self._listeners.append(fn)
+
+    def follow(self, shared: "SharedDir"):
+        self.shared = shared
+        self.interval = min(self.interval, SHARED_POLL_SECONDS)
+
+    def _source_stamp(self) -> tuple:
+        if self.shared is not None:
+            return (self.shared.data_pointer(),)
+        return data_dir_stamp(self.data_dir)
+
+    def get(self) -> DataVersion:
+        ver = self.current
+        if ver is None:
+            with self._lock:
+                if self.current is None:
+                    self._load()
+                ver = self.current
+        return ver
+
+    def _load(self):
+        stamp = self._source_stamp()
+        try:
+            if self.shared is not None:
+                ver = DataVersion.from_pack(self.data_dir, self.shared.read_data(stamp[0]))
+            else:
+                ver = DataVersion(self.data_dir)
+        except Exception as e:
+            self.stats["failures"] += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            raise
+        self.current = ver
+        self._loaded_stamp = stamp if self.shared is not None else ver.stamp
+        self.stats["loads"] += 1
+        self.last_error = None
+        for fn in self._listeners:
+            try:
+                fn(ver)
+            except Exception as e:
+                print(f"[data] listener failed for {ver.id}: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        try:
+            self.get()
+        except Exception as e:
+            print(f"[data] initial load failed: {self.last_error}")
+        self._thread = threading.Thread(target=self._run, name="data-versions", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        pending = None
+        while not self._stop.wait(self.interval):
+            stamp = self._source_stamp()
+            cur = self.current
+            if (cur is not None and stamp == self._loaded_stamp) or stamp == self._failed_stamp:
+                pending = None
+                continue
+            if stamp != pending and self.shared is None:
+                pending = stamp   # still changing; wait one more interval
+                continue
+            pending = None
+            try:
+                with self._lock:
+                    self._load()
+                self._failed_stamp = None
+                print(f"[data] now serving version {self.current.id}")
+            except Exception:
+                self._failed_stamp = stamp
+                print(f"[data] reload failed, keeping {cur.id if cur else 'no data'}: {self.last_error}")
+
+
+# === Auth config ===
+ACCOUNTS_FILE = os.path.join(BASE_DIR, "accounts.json")
+SESSION_COOKIE = "amtrak_session"
+SESSION_TTL_SECONDS = 8 * 60 * 60  # 8 hours
+
+# Session store: in memory by default (the browser only holds an HttpOnly
+# cookie). Set AMTRAK_SESSION_DB to a SQLite path to survive restarts and
+# share sessions between worker processes.
+SESSION_SHARDS = 16
+SESSION_MAX = int(_env_float("AMTRAK_SESSION_MAX", 100_000))
+SESSION_SWEEP_SECONDS = 60
+SESSION_DB = os.environ.get("AMTRAK_SESSION_DB") or None
+
+# accounts.json plus the change log add_user.py appends to; new and changed
+# users are applied incrementally (see account_store.py).
+ACCOUNTS = account_store.AccountStore(ACCOUNTS_FILE)
+
+def _b64u_decode(s: str) -> bytes:
+    pad = "=" * (-len(s) % 4)
+    return base64.urlsafe_b64decode((s + pad).encode("ascii"))
+
+def verify_password(stored: dict, password: str) -> bool:
+    # PBKDF2 SHA-256 (built-in, no extra deps)
+    if stored.get("algo") != "pbkdf2_sha256":
+        return False
+    salt = _b64u_decode(stored["salt"])
+    expected = _b64u_decode(stored["hash"])
+    iterations = int(stored.get("iter", 200_000))
+    dklen = int(stored.get("dklen", len(expected)))
+    got = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations, dklen=dklen)
+    return hmac.compare_digest(got, expected)
+
+# === Login verification pool ===
+# PBKDF2 runs in worker processes so a login burst cannot starve /rt and
+# /data of CPU; admission is bounded and repeated attempts are throttled.
+# Under --workers the supervisor divides the cores between its children
+# (AMTRAK_LOGIN_WORKERS), so hashing stays sized to the machine overall.
+LOGIN_WORKERS = max(1, int(_env_float("AMTRAK_LOGIN_WORKERS", os.cpu_count() or 1)))
+LOGIN_MAX_QUEUE = LOGIN_WORKERS * 8     # verifications queued or running
+LOGIN_TIMEOUT_SECONDS = 30
+LOGIN_RETRY_AFTER_SECONDS = 2
+LOGIN_THROTTLE_WINDOW_SECONDS = 300
+LOGIN_MAX_FAILURES_PER_USER = 10        # per window
+# Failures, not attempts: a whole station may log in from one NAT address.
+LOGIN_MAX_FAILURES_PER_IP = 50          # per window
+
+class LoginBusy(Exception):
+    """The verification queue is full; the client should retry shortly."""
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("throttled")
+        self.retry_after = retry_after
+
+def _pbkdf2_timed(password: bytes, salt: bytes, iterations: int, dklen: int) -> Tuple[bytes, float]:
+    t0 = time.perf_counter()
+    dk = hashlib.pbkdf2_hmac("sha256", password, salt, iterations, dklen=dklen)
+    return dk, time.perf_counter() - t0
+
+def _exit_with_parent(parent_pid: int):
+    """Pool initializer: leave when the owning server process is gone (even after SIGKILL)."""
+    def watch():
+        while os.getppid() == parent_pid:
+            time.sleep(5)
+        os._exit(0)
+    threading.Thread(target=watch, name="parent-watch", daemon=True).start()
+
+class LoginVerifier:
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = None
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._attempts: Dict[str, List[float]] = {}   # "ip:<addr>" / "user:<name>" -> failure times
+        self.stats = {
+            "queue_depth": 0, "queue_depth_max": 0, "submitted": 0, "rejected_busy": 0,
+            "throttled": 0, "hash_count": 0, "hash_seconds_total": 0.0, "hash_seconds_max": 0.0,
+            "wait_seconds_total": 0.0,
+        }
+
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    try:
+                        from concurrent.futures import ProcessPoolExecutor
+                        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_exit_with_parent,
+                                                         initargs=(os.getpid(),))
+                    except (OSError, NotImplementedError, ImportError) as e:
+                        # No process support (e.g. restricted sandbox): hashlib
+                        # releases the GIL, so threads are the next best thing.
+                        print(f"[login] process pool unavailable ({e}); using threads")
+                        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="login")
+        return self._pool
+
+    def _recent(self, key: str, now: float) -> List[float]:
+        hits = [t for t in self._attempts.get(key, ()) if now - t < LOGIN_THROTTLE_WINDOW_SECONDS]
+        if hits:
+            self._attempts[key] = hits
+        else:
+            self._attempts.pop(key, None)
+        return hits
+
+    def check_throttle(self, username: str, ip: str):
+        """Raise LoginThrottled if this user or address has been hammering /auth/login."""
+        now = time.time()
+        with self._lock:
+            ip_fails = self._recent("ip:" + ip, now)
+            user_fails = self._recent("user:" + username.lower(), now)
+            if len(ip_fails) >= LOGIN_MAX_FAILURES_PER_IP or len(user_fails) >= LOGIN_MAX_FAILURES_PER_USER:
+                self.stats["throttled"] += 1
+                oldest = min(ip_fails if len(ip_fails) >= LOGIN_MAX_FAILURES_PER_IP else user_fails)
+                raise LoginThrottled(max(1, int(LOGIN_THROTTLE_WINDOW_SECONDS - (now - oldest))))
+            if len(self._attempts) > 100_000:
+                # Drop keys whose windows have fully expired.
+                for key in [k for k, v in self._attempts.items() if now - v[-1] >= LOGIN_THROTTLE_WINDOW_SECONDS]:
+                    del self._attempts[key]
+
+    def record_failure(self, username: str, ip: str):
+        now = time.time()
+        with self._lock:
+            self._attempts.setdefault("user:" + username.lower(), []).append(now)
+            self._attempts.setdefault("ip:" + ip, []).append(now)
+
+    def record_success(self, username: str):
+        with self._lock:
+            self._attempts.pop("user:" + username.lower(), None)
+
+    def _release(self):
+        with self._lock:
+            self._inflight -= 1
+            self.stats["queue_depth"] = self._inflight
+
+    def verify(self, stored: dict, password: str) -> bool:
+        """verify_password() on the worker pool; raises LoginBusy when saturated."""
+        if stored.get("algo") != "pbkdf2_sha256":
+            return False
+        salt = _b64u_decode(stored["salt"])
+        expected = _b64u_decode(stored["hash"])
+        iterations = int(stored.get("iter", 200_000))
+        dklen = int(stored.get("dklen", len(expected)))
+        with self._lock:
+            if self._inflight >= self.max_queue:
+                self.stats["rejected_busy"] += 1
+                raise LoginBusy()
+            self._inflight += 1
+            self.stats["submitted"] += 1
+            self.stats["queue_depth"] = self._inflight
+            self.stats["queue_depth_max"] = max(self.stats["queue_depth_max"], self._inflight)
+        t0 = time.perf_counter()
+        try:
+            fut = self._executor().submit(_pbkdf2_timed, password.encode("utf-8"), salt, iterations, dklen)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is freed when the hash finishes, not when this request stops
+        # waiting: a timed-out hash still occupies the pool and counts toward max_queue.
+        fut.add_done_callback(lambda _: self._release())
+        got, hash_seconds = fut.result(timeout=LOGIN_TIMEOUT_SECONDS)
+        total = time.perf_counter() - t0
+        with self._lock:
+            self.stats["hash_count"] += 1
+            self.stats["hash_seconds_total"] += hash_seconds
+            self.stats["hash_seconds_max"] = max(self.stats["hash_seconds_max"], hash_seconds)
+            self.stats["wait_seconds_total"] += max(0.0, total - hash_seconds)
+        METRICS.observe("amtrak_login_hash_seconds", (), hash_seconds)
+        METRICS.observe("amtrak_login_wait_seconds", (), max(0.0, total - hash_seconds))
+        return hmac.compare_digest(got, expected)
+
+LOGIN_VERIFIER = LoginVerifier(LOGIN_WORKERS, LOGIN_MAX_QUEUE)
+
+class SessionStore:
+    """Sharded token -> session map with a heap-driven expiry sweeper.
+
+    Reads are a lock-free dict lookup in the token's shard; writes lock only
+    that shard. A min-heap of (exp, token) lets the sweeper and the memory cap
+    drop the soonest-expiring sessions without scanning every shard. With a
+    db_path, sessions are written through to SQLite (tokens stored hashed)
+    and every lookup is confirmed against the database (a primary-key read),
+    so a logout in any process revokes the session in all of them at once.
+    """
+
+    def __init__(self, shards: int=SESSION_SHARDS, max_sessions: int=SESSION_MAX, db_path: Optional[str]=None):
+        self._shards: List[Dict[str, dict]] = [{} for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._heap: List[Tuple[float, str]] = []
+        self._heap_lock = threading.Lock()
+        self._count = 0
+        self.max_sessions = max_sessions
+        self.stats = {"created": 0, "expired": 0, "evicted": 0, "destroyed": 0}
+        self._sweeper: Optional[threading.Thread] = None
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            import sqlite3
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS sessions (token_hash TEXT PRIMARY KEY, username TEXT, routes TEXT, filters TEXT, exp REAL)")
+
+    def _idx(self, token: str) -> int:
+        return hash(token) % len(self._shards)
+
+    @staticmethod
+    def _token_hash(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _put(self, token: str, sess: dict):
+        i = self._idx(token)
+        with self._locks[i]:
+            is_new = token not in self._shards[i]
+            self._shards[i][token] = sess
+        if is_new:
+            with self._heap_lock:
+                heapq.heappush(self._heap, (sess["exp"], token))
+                self._count += 1
+                over = self._count - self.max_sessions
+            if over > 0:
+                self._evict(over)
+            # Also reached from get() when a worker adopts a session another
+            # process created, so a store that never create()s still sweeps.
+            self.start_sweeper()
+
+    def _remove(self, token: str, stat: Optional[str]=None) -> bool:
+        i = self._idx(token)
+        with self._locks[i]:
+            removed = self._shards[i].pop(token, None) is not None
+        if removed:
+            with self._heap_lock:
+                self._count -= 1
+                if stat:
+                    self.stats[stat] += 1
+        return removed
+
+    def _evict(self, n: int):
+        """Drop the n soonest-expiring sessions (memory cap)."""
+        while n > 0:
+            with self._heap_lock:
+                if not self._heap:
+                    return
+                _, token = heapq.heappop(self._heap)
+            if self._remove(token, "evicted"):
+                n -= 1
+
+    def create(self, username: str, routes: List[str], filters: Optional[dict]=None) -> str:
+        token = base64.urlsafe_b64encode(secrets.token_bytes(32)).decode("ascii").rstrip("=")
+        sess = {"username": username, "routes": routes, "filters": (filters or {}), "exp": time.time() + SESSION_TTL_SECONDS}
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("INSERT OR REPLACE INTO sessions VALUES (?,?,?,?,?)",
+                                 (self._token_hash(token), username, json.dumps(routes), json.dumps(sess["filters"]), sess["exp"]))
+        self._put(token, sess)
+        with self._heap_lock:
+            self.stats["created"] += 1
+        return token
+
+    def _load(self, token: str) -> Optional[dict]:
+        with self._db_lock:
+            row = self._db.execute("SELECT username, routes, filters, exp FROM sessions WHERE token_hash=?",
+                                   (self._token_hash(token),)).fetchone()
+        if row is None:
+            return None
+        return {"username": row[0], "routes": json.loads(row[1]), "filters": json.loads(row[2]), "exp": row[3]}
+
+    def get(self, token: str) -> Optional[dict]:
+        if not token:
+            return None
+        now = time.time()
+        cached = self._shards[self._idx(token)].get(token)
+        if cached is not None and cached["exp"] < now:
+            self._remove(token, "expired")
+            return None
+        if self._db is None:
+            return cached
+        # Always ask the database: another process may have logged it out.
+        sess = self._load(token)
+        if sess is None or sess["exp"] < now:
+            self._remove(token)
+            return None
+        if cached is None:
+            self._put(token, sess)
+        return sess
+
+    def destroy(self, token: str):
+        if not token:
+            return
+        self._remove(token, "destroyed")
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM sessions WHERE token_hash=?", (self._token_hash(token),))
+
+    def sweep(self) -> int:
+        """Remove every expired session; returns how many were dropped."""
+        now = time.time()
+        dropped = 0
+        while True:
+            with self._heap_lock:
+                if not self._heap or self._heap[0][0] >= now:
+                    break
+                exp, token = heapq.heappop(self._heap)
+            sess = self._shards[self._idx(token)].get(token)
+            if sess is not None and sess["exp"] <= exp and self._remove(token, "expired"):
+                dropped += 1
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM sessions WHERE exp < ?", (now,))
+        return dropped
+
+    def start_sweeper(self):
+        if self._sweeper is not None:
+            return
+        with self._heap_lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(SESSION_SWEEP_SECONDS)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[sessions] sweep failed: {e}")
+
+SESSIONS = SessionStore(db_path=SESSION_DB)
+
+def create_session(username: str, routes: List[str], filters: Optional[dict]=None) -> str:
+    return SESSIONS.create(username, routes, filters)
+
+def get_session(token: str):
+    return SESSIONS.get(token)
+
+def destroy_session(token: str):
+    SESSIONS.destroy(token)
+
+def match_route(allowed: str, path: str) -> bool:
+    # "*" matches everything
+    if allowed == "*" or allowed == "/*":
+        return True
+    # prefix wildcard like "/rt/*"
+    if allowed.endswith("*"):
+        return path.startswith(allowed[:-1])
+    # exact
+    return path == allowed
+
+def is_authorized(session: dict, path: str) -> bool:
+    # Normalize root -> index
+    if path == "/":
+        path = "/index.html"
+    routes = session.get("routes") or []
+    return any(match_route(r, path) for r in routes)
+
+# === Upstream HTTP(S) connection pool ===
+# The pool size is also the cap on in-flight upstream calls; a call that cannot
+# get a slot within UPSTREAM_QUEUE_SECONDS fails instead of pinning its thread.
+UPSTREAM_POOL_SIZE = int(_env_float("AMTRAK_UPSTREAM_MAX_INFLIGHT", 4))
+UPSTREAM_QUEUE_SECONDS = _env_float("AMTRAK_UPSTREAM_QUEUE_WAIT", 1)
+UPSTREAM_TIMEOUT_SECONDS = _env_float("AMTRAK_UPSTREAM_TIMEOUT", 10)
+# Circuit breaker: consecutive failures that open it, then probe backoff bounds.
+UPSTREAM_BREAKER_FAILURES = 3
+UPSTREAM_BACKOFF_MIN_SECONDS = _env_float("AMTRAK_UPSTREAM_BACKOFF_MIN", 2)
+UPSTREAM_BACKOFF_MAX_SECONDS = _env_float("AMTRAK_UPSTREAM_BACKOFF_MAX", 120)
+UPSTREAM_HEADERS = {
+    "User-Agent": "amtrak-board-local-proxy",
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip",
+}
+
+_ssl_contexts: Dict[str, ssl.SSLContext] = {}
+_ssl_lock = threading.Lock()
+
+def upstream_ssl_context(fallback: bool=False) -> ssl.SSLContext:
+    """Shared SSL context, created once.
+
+    The fallback context exists for Python builds with a missing/old CA bundle
+    (common on macOS): certifi's bundle if installed, otherwise unverified
+    (acceptable for a local proxy only).
+    """
+    key = "fallback" if fallback else "default"
+    ctx = _ssl_contexts.get(key)
+    if ctx is None:
+        with _ssl_lock:
+            ctx = _ssl_contexts.get(key)
+            if ctx is None:
+                if not fallback:
+                    ctx = ssl.create_default_context()
+                elif certifi is not None:
+                    ctx = ssl.create_default_context(cafile=certifi.where())
+                else:
+                    ctx = ssl._create_unverified_context()
+                _ssl_contexts[key] = ctx
+    return ctx
+
+class UpstreamUnavailable(URLError):
+    """Refused without calling upstream: breaker open or no free pool slot."""
+
+    def __init__(self, reason: str, kind: str):
+        super().__init__(reason)
+        self.kind = kind   # "busy" | "circuit_open"
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream errors and probes for recovery.
+
+    closed:    calls go through; UPSTREAM_BREAKER_FAILURES consecutive
+               failures open the breaker.
+    open:      calls are refused until retry_at.
+    half-open: a single probe is let through. Success closes the breaker;
+               failure re-opens it with the backoff doubled (jittered, capped).
+    """
+
+    def __init__(self, name: str, threshold: int=UPSTREAM_BREAKER_FAILURES,
+                 backoff_min: float=UPSTREAM_BACKOFF_MIN_SECONDS, backoff_max: float=UPSTREAM_BACKOFF_MAX_SECONDS):
+        self.name = name
+        self.threshold = threshold
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.state = "closed"
+        self.failures = 0
+        self.backoff = 0.0
+        self.retry_at = 0.0
+        self.stats = {"opened": 0, "refused": 0, "probes": 0}
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.time() >= self.retry_at:
+                self.state = "half-open"
+                self.stats["probes"] += 1
+                return True
+            self.stats["refused"] += 1
+            return False
+
+    def success(self):
+        with self._lock:
+            if self.state != "closed":
+                print(f"[upstream] {self.name} recovered; circuit closed")
+            self.state = "closed"
+            self.failures = 0
+            self.backoff = 0.0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "closed" and self.failures < self.threshold:
+                return
+            if self.state == "closed":
+                self.stats["opened"] += 1
+            self.backoff = min(self.backoff_max, self.backoff * 2 if self.backoff else self.backoff_min)
+            self.retry_at = time.time() + self.backoff * random.uniform(0.8, 1.2)
+            self.state = "open"
+            print(f"[upstream] {self.name} failing ({self.failures} in a row); circuit open, next probe in {self.retry_in():.1f}s")
+
+    def retry_in(self) -> float:
+        return max(0.0, self.retry_at - time.time()) if self.state == "open" else 0.0
+
+    def status(self) -> dict:
+        return dict(self.stats, state=self.state, failures=self.failures, retry_in=round(self.retry_in(), 1))
+
+class UpstreamPool:
+    """Bounded pool of persistent keep-alive connections to one upstream host."""
+
+    def __init__(self, scheme: str, netloc: str, size: int=UPSTREAM_POOL_SIZE):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.size = size
+        self.inflight = 0
+        self.breaker = CircuitBreaker(netloc)
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+        self._fallback_ssl = False
+
+    def _connect(self, timeout: float) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.netloc, timeout=timeout, context=upstream_ssl_context(self._fallback_ssl))
+        return http.client.HTTPConnection(self.netloc, timeout=timeout)
+
+    def _checkout(self, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if self._idle:
+                conn = self._idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        return self._connect(timeout), False
+
+    def status(self) -> dict:
+        return dict(self.breaker.status(), inflight=self.inflight, max_inflight=self.size)
+
+    def get(self, path: str, timeout: float) -> Tuple[int, str, Any, bytes]:
+        """GET path -> (status, reason, headers, body); body already gunzipped.
+
+        Raises UpstreamUnavailable without touching the network when every slot
+        is busy or the circuit breaker is open. 5xx responses and transport
+        errors count as breaker failures.
+        """
+        if not self._slots.acquire(timeout=min(timeout, UPSTREAM_QUEUE_SECONDS)):
+            raise UpstreamUnavailable(f"upstream {self.netloc} busy ({self.size} calls in flight)", "busy")
+        try:
+            if not self.breaker.allow():
+                raise UpstreamUnavailable(f"upstream {self.netloc} circuit open; next probe in {self.breaker.retry_in():.0f}s", "circuit_open")
+            with self._lock:
+                self.inflight += 1
+            try:
+                result = self._get(path, timeout)
+            except BaseException:
+                self.breaker.failure()
+                raise
+            finally:
+                with self._lock:
+                    self.inflight -= 1
+            if result[0] >= 500:
+                self.breaker.failure()
+            else:
+                self.breaker.success()
+            return result
+        finally:
+            self._slots.release()
+
+    def _get(self, path: str, timeout: float) -> Tuple[int, str, Any, bytes]:
+        for attempt in range(3):
+            conn, reused = self._checkout(timeout)
+            try:
+                conn.request("GET", path, headers=UPSTREAM_HEADERS)
+                resp = conn.getresponse()
+                body = resp.read()
+            except ssl.SSLCertVerificationError:
+                conn.close()
+                if self._fallback_ssl:
+                    raise
+                print(f"[upstream] certificate verify failed for {self.netloc}; using fallback CA bundle")
+                self._fallback_ssl = True
+                continue
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    http.client.BadStatusLine, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused:
+                    # Keep-alive connection went stale while idle; retry on a fresh one.
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                with self._lock:
+                    self._idle.append(conn)
+            if resp.getheader("Content-Encoding", "").lower() == "gzip":
+                body = gzip.decompress(body)
+            return resp.status, resp.reason, resp.headers, body
+        raise URLError(f"could not reach {self.netloc}")
+
+_upstream_pools: Dict[Tuple[str, str], UpstreamPool] = {}
+_upstream_pools_lock = threading.Lock()
+
+def upstream_pool(scheme: str, netloc: str) -> UpstreamPool:
+    key = (scheme, netloc)
+    pool = _upstream_pools.get(key)
+    if pool is None:
+        with _upstream_pools_lock:
+            pool = _upstream_pools.setdefault(key, UpstreamPool(scheme, netloc))
+    return pool
+
+def upstream_error_class(e: BaseException) -> str:
+    if isinstance(e, URLError) and isinstance(e.reason, BaseException):
+        e = e.reason
+    if isinstance(e, TimeoutError):
+        return "timeout"
+    if isinstance(e, ssl.SSLError):
+        return "tls"
+    if isinstance(e, ConnectionError):
+        return "connection"
+    if isinstance(e, socket.gaierror):
+        return "dns"
+    if isinstance(e, http.client.HTTPException):
+        return "protocol"
+    return "other"
+
+def proxy_json(url, timeout=UPSTREAM_TIMEOUT_SECONDS):
+    """GET a JSON URL through the shared connection pool -> (body, content-type).
+
+    Raises HTTPError for 4xx/5xx, URLError for transport failures and
+    UpstreamUnavailable when the call was refused locally.
+    """
+    u = urlparse(url)
+    path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+    labels = (("endpoint", u.path.rsplit("/", 1)[-1] or "/"),)
+    t0 = time.perf_counter()
+    try:
+        status, reason, headers, body = upstream_pool(u.scheme, u.netloc).get(path, timeout)
+    except UpstreamUnavailable as e:
+        METRICS.inc("amtrak_upstream_errors_total", labels + (("class", e.kind),))
+        raise
+    except (URLError, HTTPError, OSError, http.client.HTTPException) as e:
+        METRICS.inc("amtrak_upstream_errors_total", labels + (("class", upstream_error_class(e)),))
+        if isinstance(e, (URLError, HTTPError)):
+            raise
+        raise URLError(e)
+    METRICS.observe("amtrak_upstream_request_duration_seconds", labels, time.perf_counter() - t0)
+    if status >= 400:
+        METRICS.inc("amtrak_upstream_errors_total", labels + (("class", f"http_{status // 100}xx"),))
+        raise HTTPError(url, status, reason, headers, io.BytesIO(body))
+    return body, headers.get("Content-Type", "application/json; charset=utf-8")
+
+# === Realtime snapshots ===
+class RealtimeSnapshot:
+    """One upstream payload as fetched; never mutated after creation.
+
+    (epoch, version) identifies it: versions restart with the poller, whose
+    epoch --workers children adopt from the supervisor.
+    """
+    __slots__ = ("name", "data", "ctype", "version", "fetched_at", "body", "_derived", "epoch")
+
+    def __init__(self, name: str, data: bytes, ctype: str, version: int, fetched_at: float,
+                 body: Optional[EncodedBody]=None, derived: Optional[dict]=None, epoch: str=""):
+        self.name = name
+        self.epoch = epoch
+        self.data = data
+        self.ctype = ctype
+        self.version = version
+        self.fetched_at = fetched_at
+        self.body = body or EncodedBody(data, f"{name}{version}")
+        self._derived = derived if derived is not None else {}
+
+    def age(self) -> float:
+        return max(0.0, time.time() - self.fetched_at)
+
+    def derive(self, key: str, build):
+        """Memoize build(self) for this snapshot version (e.g. parsed indexes)."""
+        val = self._derived.get(key)
+        if val is None:
+            with _derive_lock:
+                val = self._derived.get(key)
+                if val is None:
+                    val = self._derived[key] = build(self)
+        return val
+
+_derive_lock = threading.Lock()
+
+def _summarize_train(t: dict) -> dict:
+    keep = ("trainNum", "trainID", "routeName", "provider", "trainState", "trainTimely",
+            "lat", "lon", "heading", "velocity", "destName", "destCode", "origName", "origCode",
+            "eventCode", "updatedAt", "lastValTS")
+    return {k: t[k] for k in keep if k in t}
+
+class RealtimeIndex:
+    """Hash indexes over one parsed /trains snapshot.
+
+    by_train:   train number -> [train objects]
+    by_station: station code -> [train summary + that station's stop entry]
+    Serialized per-key bodies live in RESPONSE_CACHE, keyed by the snapshot's
+    content ETag.
+    """
+
+    def __init__(self, snap: RealtimeSnapshot):
+        self.version = snap.version
+        self.source = snap.body.etag
+        payload = json_loads(snap.data)
+        if isinstance(payload, dict) and not any(isinstance(payload.get(k), list) for k in ("trains", "data", "results")):
+            groups = payload
+        else:
+            if isinstance(payload, dict):
+                payload = next(payload[k] for k in ("trains", "data", "results") if isinstance(payload.get(k), list))
+            groups = {}
+            for t in payload if isinstance(payload, list) else []:
+                if isinstance(t, dict):
+                    groups.setdefault(str(t.get("trainNum", "")), []).append(t)
+
+        self.by_train: Dict[str, List[dict]] = {}
+        self.by_station: Dict[str, List[Tuple[dict, dict]]] = {}
+        for num, trains in groups.items():
+            if not isinstance(trains, list):
+                continue
+            trains = [t for t in trains if isinstance(t, dict)]
+            self.by_train[str(num)] = trains
+            for t in trains:
+                for st in t.get("stations") or ():
+                    if not isinstance(st, dict):
+                        continue
+                    code = str(st.get("code") or "").upper()
+                    if code:
+                        self.by_station.setdefault(code, []).append((t, st))
+        self._regions: Dict[str, frozenset] = {}
+
+    def region_trains(self, profile: str) -> frozenset:
+        """id() of every train object in a region; one pass per snapshot per region."""
+        kept = self._regions.get(profile)
+        if kept is None:
+            keep = REGIONS[profile].keep_train
+            kept = self._regions[profile] = frozenset(id(t) for group in self.by_train.values() for t in group if keep(t))
+        return kept
+
+    def _memo(self, key: tuple, build) -> Optional[EncodedBody]:
+        # Only keys present in the snapshot are cached, so arbitrary
+        # client-supplied numbers/codes cannot churn the cache.
+        if key[1] not in (self.by_train if key[0] == "train" else self.by_station):
+            return build()
+        return RESPONSE_CACHE.get(("rt-index", self.source) + key, build)
+
+    def train_body(self, num: str, profile: Optional[str]) -> Optional[EncodedBody]:
+        def build():
+            trains = self.by_train.get(num)
+            if trains and profile is not None:
+                kept = self.region_trains(profile)
+                trains = [t for t in trains if id(t) in kept]
+            if not trains:
+                return None
+            return EncodedBody(json_bytes({"trainNum": num, "trains": trains}), f"trains{self.version}-{profile or ''}")
+        return self._memo(("train", num, profile), build)
+
+    def station_body(self, code: str, profile: Optional[str]) -> Optional[EncodedBody]:
+        def build():
+            if profile is not None and code not in REGIONS[profile].stations:
+                return None
+            kept = self.region_trains(profile) if profile is not None else None
+            rows = []
+            for t, st in self.by_station.get(code, ()):
+                if kept is not None and id(t) not in kept:
+                    continue
+                rows.append({**_summarize_train(t), "station": st})
+            return EncodedBody(json_bytes({"station": code, "trains": rows}), f"trains{self.version}-{profile or ''}")
+        return self._memo(("station", code, profile), build)
+
+def region_snapshot_body(snap: RealtimeSnapshot, profile: str) -> EncodedBody:
+    """A snapshot filtered to one region: parsed, filtered and serialized once per payload."""
+    def build():
+        region = REGIONS[profile]
+        payload = json_loads(snap.data)
+        if snap.name == "trains":
+            payload = region.filter_trains(payload)
+        elif snap.name == "stations":
+            payload = region.filter_stations(payload)
+        return EncodedBody(json_bytes(payload), f"{snap.name}{snap.version}-{profile}")
+    return RESPONSE_CACHE.get(("rt", snap.name, snap.body.etag, profile), build)
+
+class SnapshotCache:
+    """Versioned snapshots of the amtraker endpoints.
+
+    A background thread refreshes every endpoint on its own interval. Requests
+    only ever read the current snapshot; if it is missing or too old, one
+    request refreshes it and concurrent misses wait for that same fetch.
+    The version only increases when the upstream body actually changes.
+
+    When a refresh fails (or another request is already refreshing), the last
+    good snapshot keeps being served for up to RT_STALE_IF_ERROR_SECONDS;
+    is_stale() tells handlers to mark such responses.
+
+    Under --workers, follow() turns a worker's cache into a reader of the
+    snapshots the supervisor publishes, so upstream sees one poller no
+    matter how many workers run.
+    """
+
+    def __init__(self, base: str, intervals: Dict[str, float]):
+        self.base = base
+        self.intervals = dict(intervals)
+        self._snaps: Dict[str, RealtimeSnapshot] = {}
+        self._errors: Dict[str, Exception] = {}
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List = []
+        self._fetch_listeners: List = []
+        self.shared: Optional["SharedDir"] = None
+        self.stats = {"stale_served": 0}
+        self.epoch = secrets.token_hex(4)   # replaced by the supervisor's under follow()
+
+    def on_update(self, fn):
+        """Call fn(snapshot) whenever an endpoint's version changes."""
+        self._listeners.append(fn)
+
+    def on_fetch(self, fn):
+        """Call fn(snapshot) after every successful fetch, changed or not."""
+        self._fetch_listeners.append(fn)
+
+    def follow(self, shared: "SharedDir"):
+        self.shared = shared
+
+    def max_age(self, name: str) -> float:
+        return self.intervals.get(name, 15) * RT_MAX_AGE_FACTOR
+
+    def is_stale(self, snap: RealtimeSnapshot) -> bool:
+        return snap.age() > self.max_age(snap.name)
+
+    def upstream(self) -> UpstreamPool:
+        u = urlparse(self.base)
+        return upstream_pool(u.scheme, u.netloc)
+
+    def peek(self, name: str) -> Optional[RealtimeSnapshot]:
+        with self._lock:
+            return self._snaps.get(name)
+
+    def get(self, name: str) -> RealtimeSnapshot:
+        """Current snapshot for an endpoint; fetches (single-flight) on a miss."""
+        snap = self.peek(name)
+        if snap is not None and snap.age() <= self.max_age(name):
+            return snap
+        usable = snap is not None and snap.age() <= RT_STALE_IF_ERROR_SECONDS
+        if usable and self.shared is None:
+            with self._lock:
+                refreshing = name in self._inflight
+            if refreshing:
+                # Don't queue behind a possibly slow upstream call.
+                self.stats["stale_served"] += 1
+                return snap
+        try:
+            return self.refresh(name)
+        except Exception:
+            if not usable:
+                raise
+            self.stats["stale_served"] += 1
+            return self.peek(name) or snap
+
+    def refresh(self, name: str) -> RealtimeSnapshot:
+        if self.shared is not None:
+            return self._load_shared(name)
+        with self._lock:
+            ev = self._inflight.get(name)
+            leader = ev is None
+            if leader:
+                ev = self._inflight[name] = threading.Event()
+        if not leader:
+            # Someone else is already fetching this endpoint; share their result.
+            ev.wait()
+            with self._lock:
+                snap = self._snaps.get(name)
+                err = self._errors.get(name)
+            if err is not None or snap is None:
+                raise err or URLError(f"no snapshot for {name}")
+            return snap
+
+        try:
+            data, ctype = proxy_json(f"{self.base}/{name}")
+        except Exception as e:
+            with self._lock:
+                self._errors[name] = e
+                self._inflight.pop(name, None)
+            ev.set()
+            raise
+        now = time.time()
+        with self._lock:
+            prev = self._snaps.get(name)
+            changed = prev is None or prev.data != data
+            if not changed:
+                # Unchanged upstream: keep version and already-compressed bodies.
+                snap = RealtimeSnapshot(name, prev.data, ctype, prev.version, now, prev.body, prev._derived, self.epoch)
+            else:
+                version = (prev.version + 1) if prev is not None else 1
+                snap = RealtimeSnapshot(name, data, ctype, version, now, epoch=self.epoch)
+            self._snaps[name] = snap
+            self._errors.pop(name, None)
+            self._inflight.pop(name, None)
+        ev.set()
+        self._notify(snap, changed)
+        return snap
+
+    def _notify(self, snap: RealtimeSnapshot, changed: bool):
+        for fn in (self._fetch_listeners + self._listeners) if changed else self._fetch_listeners:
+            try:
+                fn(snap)
+            except Exception as e:
+                print(f"[rt-snapshots] listener failed for {snap.name}: {e}")
+
+    def _load_shared(self, name: str) -> RealtimeSnapshot:
+        """Adopt the supervisor's latest snapshot, keeping its version and ETag."""
+        pack = self.shared.read_snapshot(name)
+        if pack is None:
+            raise URLError(f"no snapshot published for {name} yet")
+        meta = pack.meta
+        with self._lock:
+            self.epoch = meta.get("epoch", self.epoch)
+            prev = self._snaps.get(name)
+            changed = prev is None or prev.version != meta["version"] or prev.epoch != self.epoch
+            if not changed:
+                snap = RealtimeSnapshot(name, prev.data, prev.ctype, prev.version, meta["fetched_at"], prev.body, prev._derived, self.epoch)
+            else:
+                body = EncodedBody(pack.get("raw"), etag=meta["etag"],
+                                   encoded={enc: pack.get(enc) for enc in meta["encodings"]})
+                snap = RealtimeSnapshot(name, bytes(body.raw), meta["ctype"], meta["version"], meta["fetched_at"], body,
+                                        epoch=self.epoch)
+            self._snaps[name] = snap
+        if changed:
+            self._notify(snap, True)
+        if snap.age() > self.max_age(name):
+            raise URLError(f"published {name} snapshot is {int(snap.age())}s old")
+        return snap
+
+    # ---- Background poller ----
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="rt-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        if self.shared is not None:
+            return self._run_shared()
+        due = {name: 0.0 for name in self.intervals}
+        while not self._stop.is_set():
+            now = time.time()
+            for name, at in due.items():
+                if at > now:
+                    continue
+                try:
+                    self.refresh(name)
+                    due[name] = time.time() + self.intervals[name]
+                except Exception as e:
+                    if not isinstance(e, UpstreamUnavailable):
+                        print(f"[rt-poller] {name}: {e}")
+                    # Retry when the breaker next allows a probe, so recovery
+                    # is noticed within its backoff rather than a full interval.
+                    retry = max(UPSTREAM_QUEUE_SECONDS, self.upstream().breaker.retry_in())
+                    due[name] = time.time() + min(self.intervals[name], retry)
+            self._stop.wait(max(0.05, min(due.values()) - time.time()))
+
+    def _run_shared(self):
+        seen: Dict[str, Optional[tuple]] = {}
+        while not self._stop.is_set():
+            for name in self.intervals:
+                stamp = self.shared.snapshot_stamp(name)
+                if stamp is None or stamp == seen.get(name):
+                    continue
+                seen[name] = stamp
+                try:
+                    self._load_shared(name)
+                except Exception as e:
+                    print(f"[rt-follower] {name}: {e}")
+            self._stop.wait(SHARED_POLL_SECONDS)
+
+# === Realtime push (Server-Sent Events) ===
+SSE_BACKLOG_EVENTS = 256      # deltas kept for Last-Event-ID resume
+SSE_MAX_SUBSCRIBERS = 5000
+SSE_MAX_BUFFER_BYTES = 4 * 1024 * 1024  # a client this far behind is dropped
+SSE_HEARTBEAT_SECONDS = 15
+# Sent on an already-open stream when the hub refuses the subscription, so
+# EventSource backs off for the same 30s as the pre-check's Retry-After.
+SSE_FULL_FRAME = b'retry: 30000\nevent: error\ndata: {"error":"too_many_streams"}\n\n'
+
+def _train_key(t: dict) -> str:
+    return f"{t.get('trainNum', '')}|{t.get('trainID', '')}"
+
+def _train_fingerprint(t: dict) -> tuple:
+    """The fields whose change makes a train part of a delta."""
+    stops = tuple(
+        (st.get("code"), st.get("arr"), st.get("dep"), st.get("status"))
+        for st in (t.get("stations") or ()) if isinstance(st, dict)
+    )
+    return (t.get("lat"), t.get("lon"), t.get("trainState"), t.get("trainTimely"), t.get("eventCode"), stops)
+
+def scope_matches(scope: tuple, t: dict) -> bool:
+    """scope = (station codes, train numbers, region profile); empty sets match all."""
+    stations, trains, profile = scope
+    if trains and str(t.get("trainNum", "")) not in trains:
+        return False
+    if stations and not any(
+        isinstance(st, dict) and str(st.get("code") or "").upper() in stations
+        for st in (t.get("stations") or ())
+    ):
+        return False
+    if profile is not None and not REGIONS[profile].keep_train(t):
+        return False
+    return True
+
+class StreamEvent:
+    """One snapshot-to-snapshot delta; serialized lazily once per scope."""
+
+    def __init__(self, epoch: str, version: int, changed: List[dict], removed: List[dict]):
+        self.epoch = epoch
+        self.version = version
+        self.changed = changed
+        self.removed = removed
+        self._encoded: Dict[tuple, bytes] = {}
+
+    def encode(self, scope: tuple) -> bytes:
+        data = self._encoded.get(scope)
+        if data is None:
+            changed = [t for t in self.changed if scope_matches(scope, t)]
+            removed = [{"trainNum": t.get("trainNum"), "trainID": t.get("trainID")} for t in self.removed if scope_matches(scope, t)]
+            if changed or removed:
+                payload = json.dumps({"version": self.version, "changed": changed, "removed": removed})
+                data = f"id: {self.epoch}-{self.version}\nevent: delta\ndata: {payload}\n\n".encode("utf-8")
+            else:
+                data = b""
+            self._encoded[scope] = data
+        return data
+
+class SSEHub:
+    """Turns /trains snapshots into deltas and fans them out to subscribers.
+
+    Subscribers only need send(bytes) and close(); the hub serializes each
+    delta once per distinct scope, never per connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: Dict[tuple, set] = {}
+        self._count = 0
+        self._events: List[StreamEvent] = []
+        # Event IDs are "<snapshot epoch>-<snapshot version>", which every
+        # --workers child shares. A client may resume from a version this hub
+        # ingested itself; otherwise (another run, or a version this worker
+        # skipped) it gets the full state.
+        self.epoch = ""
+        self._version = 0
+        self._seen: deque = deque(maxlen=SSE_BACKLOG_EVENTS)
+        self._trains: Dict[str, dict] = {}
+        self._fingerprints: Dict[str, tuple] = {}
+        self._full: Dict[tuple, bytes] = {}
+
+    def ingest(self, snap: RealtimeSnapshot):
+        if snap.name != "trains":
+            return
+        index = snap.derive("index", RealtimeIndex)
+        trains, fps = {}, {}
+        for group in index.by_train.values():
+            for t in group:
+                k = _train_key(t)
+                trains[k] = t
+                fps[k] = _train_fingerprint(t)
+        with self._lock:
+            if snap.epoch != self.epoch:
+                self.epoch, self._version = snap.epoch, 0
+                self._events, self._trains, self._fingerprints = [], {}, {}
+                self._seen.clear()
+            if snap.version <= self._version:
+                return
+            changed = [trains[k] for k, fp in fps.items() if self._fingerprints.get(k) != fp]
+            removed = [t for k, t in self._trains.items() if k not in trains]
+            first = self._version == 0
+            self._version = snap.version
+            self._seen.append(snap.version)
+            self._trains, self._fingerprints, self._full = trains, fps, {}
+            if first or not (changed or removed):
+                return
+            ev = StreamEvent(self.epoch, snap.version, changed, removed)
+            self._events.append(ev)
+            while self._events[0].version < self._seen[0]:
+                self._events.pop(0)
+            subs = [(scope, list(group)) for scope, group in self._subs.items()]
+        for scope, group in subs:
+            data = ev.encode(scope)
+            if data:
+                for sub in group:
+                    sub.send(data)
+
+    def _full_state(self, scope: tuple) -> bytes:
+        data = self._full.get(scope)
+        if data is None:
+            trains = [t for t in self._trains.values() if scope_matches(scope, t)]
+            payload = json.dumps({"version": self._version, "trains": trains})
+            data = self._full[scope] = f"id: {self.epoch}-{self._version}\nevent: snapshot\ndata: {payload}\n\n".encode("utf-8")
+        return data
+
+    def subscribe(self, sub, scope: tuple, last_event_id: Optional[str]) -> bool:
+        """Register sub and queue its catch-up data; False if the hub is full."""
+        if self._version == 0:
+            snap = SNAPSHOTS.peek("trains")
+            if snap is not None:
+                self.ingest(snap)
+        with self._lock:
+            if self._count >= SSE_MAX_SUBSCRIBERS:
+                return False
+            last = self._parse_event_id(last_event_id)
+            if last is not None and last in self._seen:
+                # Resume: every delta after a version this hub ingested is
+                # still in _events (they are trimmed together).
+                backlog = b"".join(ev.encode(scope) for ev in self._events if ev.version > last)
+            else:
+                backlog = self._full_state(scope)
+            sub.send(b"retry: 5000\n\n" + backlog)
+            self._subs.setdefault(scope, set()).add(sub)
+            self._count += 1
+        return True
+
+    def _parse_event_id(self, value: Optional[str]) -> Optional[int]:
+        """The snapshot version in an ID of this epoch; None for other epochs or junk."""
+        epoch, _, n = (value or "").partition("-")
+        if epoch != self.epoch:
+            return None
+        try:
+            return int(n)
+        except ValueError:
+            return None
+
+    def unsubscribe(self, sub, scope: tuple):
+        with self._lock:
+            group = self._subs.get(scope)
+            if group is not None and sub in group:
+                group.discard(sub)
+                self._count -= 1
+                if not group:
+                    del self._subs[scope]
+
+    def subscriber_count(self) -> int:
+        return self._count
+
+class SocketSubscriber:
+    """SSE client on a raw socket handed over from a finished request thread."""
+
+    def __init__(self, sock, scope: tuple, pump: "SocketPump"):
+        self.sock = sock
+        self.scope = scope
+        self.pump = pump
+        self.buf = bytearray()
+        self.closed = False
+
+    def send(self, data: bytes):
+        if self.closed:
+            return
+        with self.pump.lock:
+            self.buf += data
+            overflow = len(self.buf) > SSE_MAX_BUFFER_BYTES
+        self.pump.wake(self, drop=overflow)
+
+class SocketPump:
+    """One selector thread that writes to every idle SSE socket.
+
+    Request threads hand their socket over and return, so a connected but
+    idle board costs a buffer and a selector registration, not a thread.
+    """
+
+    def __init__(self, hub: SSEHub):
+        self.hub = hub
+        self.lock = threading.Lock()
+        self._sel = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ, None)
+        self._pending: Dict[SocketSubscriber, bool] = {}
+        self._subs: set = set()
+        self._sockets: set = set()
+        self._thread: Optional[threading.Thread] = None
+
+    def owns(self, sock) -> bool:
+        return sock in self._sockets
+
+    def attach(self, sock, scope: tuple, last_event_id: Optional[str]) -> bool:
+        sub = SocketSubscriber(sock, scope, self)
+        with self.lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sse-pump", daemon=True)
+                self._thread.start()
+            self._sockets.add(sock)
+        sock.setblocking(False)
+        if not self.hub.subscribe(sub, scope, last_event_id):
+            with self.lock:
+                self._sockets.discard(sock)
+            sock.setblocking(True)
+            return False
+        with self.lock:
+            self._pending[sub] = self._pending.get(sub, False)
+        self._poke()
+        return True
+
+    def wake(self, sub: SocketSubscriber, drop: bool=False):
+        with self.lock:
+            self._pending[sub] = self._pending.get(sub, False) or drop
+        self._poke()
+
+    def _poke(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _drop(self, sub: SocketSubscriber):
+        if sub.closed:
+            return
+        sub.closed = True
+        self.hub.unsubscribe(sub, sub.scope)
+        self._subs.discard(sub)
+        try:
+            self._sel.unregister(sub.sock)
+        except (KeyError, ValueError):
+            pass
+        with self.lock:
+            self._sockets.discard(sub.sock)
+        try:
+            sub.sock.close()
+        except OSError:
+            pass
+
+    def _flush(self, sub: SocketSubscriber):
+        with self.lock:
+            data = bytes(sub.buf)
+        if not data:
+            return
+        try:
+            sent = sub.sock.send(data)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            return self._drop(sub)
+        with self.lock:
+            del sub.buf[:sent]
+            remaining = bool(sub.buf)
+        mask = selectors.EVENT_READ | (selectors.EVENT_WRITE if remaining else 0)
+        self._sel.modify(sub.sock, mask, sub)
+
+    def _run(self):
+        next_beat = time.time() + SSE_HEARTBEAT_SECONDS
+        while True:
+            for key, mask in self._sel.select(timeout=1.0):
+                if key.data is None:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                    continue
+                sub = key.data
+                if mask & selectors.EVENT_READ:
+                    try:
+                        if not sub.sock.recv(4096):
+                            self._drop(sub)
+                            continue
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                    except OSError:
+                        self._drop(sub)
+                        continue
+                if mask & selectors.EVENT_WRITE:
+                    self._flush(sub)
+
+            with self.lock:
+                pending, self._pending = self._pending, {}
+            for sub, drop in pending.items():
+                if sub.closed:
+                    continue
+                if drop:
+                    self._drop(sub)
+                    continue
+                if sub not in self._subs:
+                    self._subs.add(sub)
+                    self._sel.register(sub.sock, selectors.EVENT_READ, sub)
+                self._flush(sub)
+
+            if time.time() >= next_beat:
+                next_beat = time.time() + SSE_HEARTBEAT_SECONDS
+                for sub in list(self._subs):
+                    with self.lock:
+                        sub.buf += b": ping\n\n"
+                    self._flush(sub)
+
+SNAPSHOTS = SnapshotCache(AMTRAKER_BASE, RT_POLL_INTERVALS)
+SSE_HUB = SSEHub()
+SSE_PUMP = SocketPump(SSE_HUB)
+SNAPSHOTS.on_update(SSE_HUB.ingest)
+DATA_VERSIONS = DataVersionManager(DATA_DIR, DATA_POLL_SECONDS)
+
+# === Realtime history ===
+# Changed /trains snapshots are recorded as compressed deltas (history_store.py)
+# by the process that polls upstream; AMTRAK_HISTORY_DAYS=0 turns recording off.
+# Queries read the files directly, so --workers children answer them too.
+HISTORY_DIR = os.environ.get("AMTRAK_HISTORY_DIR") or os.path.join(CACHE_DIR, "history")
+HISTORY_RETENTION_DAYS = _env_float("AMTRAK_HISTORY_DAYS", 14)
+HISTORY_MAX_BYTES = int(_env_float("AMTRAK_HISTORY_MAX_MB", 2048) * 1024 * 1024)
+HISTORY_DEFAULT_RANGE_SECONDS = 6 * 3600
+HISTORY_MAX_RANGE_SECONDS = 7 * 86400
+HISTORY_MAX_POINTS = 5000
+HISTORY_DAY_SLACK_SECONDS = 6 * 3600   # a service day's trains run past midnight
 
-def _in_bbox(obj):
+HISTORY = history_store.HistoryRecorder(HISTORY_DIR, HISTORY_RETENTION_DAYS * 86400, HISTORY_MAX_BYTES)
+HISTORY_READER = history_store.HistoryReader(HISTORY_DIR)
+
+def record_history(snap: RealtimeSnapshot):
+    if snap.name == "trains":
+        HISTORY.submit(snap.fetched_at, snap.derive("index", RealtimeIndex).by_train)
+
+def start_history():
+    """Record /trains history from this process; call where the poller runs."""
+    if HISTORY_RETENTION_DAYS > 0:
+        SNAPSHOTS.on_update(record_history)
+        HISTORY.start()
+
+def parse_history_time(v: Optional[str], default: float) -> float:
+    """Unix seconds from a number or ISO 8601 (local time unless it has an offset)."""
+    if v is None or v == "":
+        return default
     try:
-        lat = float(obj.get("lat", obj.get("latitude")))
-        lon = float(obj.get("lon", obj.get("lng", obj.get("longitude"))))
-    except Exception:
-        return False
-    return (NEC_BBOX["min_lat"] <= lat <= NEC_BBOX["max_lat"]) and (NEC_BBOX["min_lon"] <= lon <= NEC_BBOX["max_lon"])
+        return float(v)
+    except ValueError:
+        return datetime.fromisoformat(v).timestamp()
 
-def _mentions_nec_station(obj):
-    for k in ("station", "stationCode", "code", "from", "to", "origin", "destination", "nextStation", "prevStation", "lastStation"):
-        v = obj.get(k)
-        if isinstance(v, str) and v in NEC_STATION_CODES:
-            return True
-    for k in ("stations", "stops", "routeStations"):
-        v = obj.get(k)
-        if isinstance(v, list):
-            for it in v:
-                if isinstance(it, str) and it in NEC_STATION_CODES:
-                    return True
-                if isinstance(it, dict):
-                    c = it.get("code") or it.get("stationCode") or it.get("station")
-                    if isinstance(c, str) and c in NEC_STATION_CODES:
-                        return True
-    return False
+# === Static files ===
+# Small files are held in memory with their ETag and compressed copies; larger
+# ones are sent from disk with socket.sendfile() and support Range requests.
+STATIC_MEMORY_MAX_FILE = 256 * 1024
+STATIC_MEMORY_MAX_BYTES = int(_env_float("AMTRAK_STATIC_CACHE_MB", 32) * 1024 * 1024)
+STATIC_RECHECK_SECONDS = 1.0      # how often a cached file is re-stat'ed for changes
+STATIC_COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# /assets/ URLs carrying ?v=<content hash> never change, so browsers may keep them forever.
+STATIC_IMMUTABLE = "public, max-age=31536000, immutable"
+# Quoted "assets/..." references in HTML/JS/CSS get ?v=<hash> appended when served.
+_ASSET_REF = re.compile(r"""(["'`(])(/?assets/[^"'`()?#\n]+)""")
 
-def filter_nec_stations(payload):
-    if isinstance(payload, list):
-        out = []
-        for s in payload:
-            if isinstance(s, dict):
-                code = s.get("code") or s.get("stationCode") or s.get("id")
-                if isinstance(code, str) and code in NEC_STATION_CODES:
-                    out.append(s)
-        return out if out else payload
-    if isinstance(payload, dict):
-        for key in ("stations", "data", "results"):
-            if isinstance(payload.get(key), list):
-                payload[key] = filter_nec_stations(payload[key])
-                return payload
-    return payload
-
-def filter_nec_trains(payload):
-    def keep_train(t):
-        if not isinstance(t, dict):
-            return False
-        rn = t.get("routeName") or t.get("route") or t.get("service") or ""
-        if isinstance(rn, str) and any(h.lower() in rn.lower() for h in NEC_ROUTE_NAME_HINTS):
-            return True
-        if _mentions_nec_station(t):
-            return True
-        if _in_bbox(t):
-            return True
-        return False
+def has_dot_segment(url_path: str) -> bool:
+    """True if a decoded URL path has a "." or ".." segment (either separator)."""
+    return any(seg in (".", "..") for seg in url_path.replace("\\", "/").split("/"))
 
-    if isinstance(payload, list):
-        out = [t for t in payload if keep_train(t)]
-        return out if out else payload
-    if isinstance(payload, dict):
-        for key in ("trains", "data", "results"):
-            if isinstance(payload.get(key), list):
-                payload[key] = [t for t in payload[key] if keep_train(t)]
-                return payload
-    return payload
-
-def filter_nec_data_file(relpath: str, raw_bytes: bytes) -> bytes:
-    """Filter GTFS-derived ./data/*.json payloads for NEC-only users."""
+def _stamp(path: str) -> Optional[Tuple[int, int]]:
     try:
-        payload = json.loads(raw_bytes.decode("utf-8"))
-    except Exception:
-        return raw_bytes
-
-    # stops.json: dict keyed by station code
-    if relpath.endswith("stops.json") and isinstance(payload, dict):
-        payload = {k:v for (k,v) in payload.items() if k in NEC_STATION_CODES}
-        return json.dumps(payload).encode("utf-8")
-
-    # tripmap.json: dict keyed by tripId -> meta
-    if relpath.endswith("tripmap.json") and isinstance(payload, dict):
-        def keep_trip(meta: dict) -> bool:
-            if not isinstance(meta, dict): 
-                return False
-            rn = (meta.get("rl") or meta.get("rs") or "")
-            if isinstance(rn, str) and any(h.lower() in rn.lower() for h in NEC_ROUTE_NAME_HINTS):
-                return True
-            return False
-        payload = {tid:meta for (tid,meta) in payload.items() if keep_trip(meta)}
-        return json.dumps(payload).encode("utf-8")
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size) if os.path.isfile(path) else None
 
-    # stop_events.json: dict keyed by station code -> list of [arr, dep, tripId]
-    if relpath.endswith("stop_events.json") and isinstance(payload, dict):
-        # Need allowed tripIds from (already-filtered) tripmap
-        try:
-            tripmap_path = os.path.join(os.path.dirname(__file__), "data", "tripmap.json")
-            tripmap_all = json.load(open(tripmap_path, "r", encoding="utf-8"))
-            allowed_tripids = set()
-            for tid, meta in (tripmap_all or {}).items():
-                rn = (meta.get("rl") or meta.get("rs") or "")
-                if isinstance(rn, str) and any(h.lower() in rn.lower() for h in NEC_ROUTE_NAME_HINTS):
-                    allowed_tripids.add(str(tid))
-        except Exception:
-            allowed_tripids = None
+class StaticFile:
+    __slots__ = ("path", "stamp", "size", "ctype", "hash", "etag", "last_modified", "body", "deps", "checked")
 
-        out = {}
-        for st, evs in payload.items():
-            if st not in NEC_STATION_CODES: 
-                continue
-            if not isinstance(evs, list):
-                continue
-            if allowed_tripids is None:
-                out[st] = evs
-            else:
-                out[st] = [e for e in evs if isinstance(e, list) and len(e) >= 3 and str(e[2]) in allowed_tripids]
-        return json.dumps(out).encode("utf-8")
+    def __init__(self, path: str, stamp: Tuple[int, int], ctype: str):
+        self.path = path
+        self.stamp = stamp
+        self.size = stamp[1]
+        self.ctype = ctype
+        self.last_modified = email.utils.formatdate(stamp[0] / 1e9, usegmt=True)
+        self.body: Optional[EncodedBody] = None   # in-memory copy, small files only
+        self.deps: List[Tuple[str, Tuple[int, int]]] = []   # assets referenced via ?v=
+        self.checked = time.monotonic()
 
-    # services_by_date.json: date -> [serviceIds]
-    if relpath.endswith("services_by_date.json") and isinstance(payload, dict):
-        # allowed services from NEC trips (based on tripmap)
-        try:
-            tripmap_path = os.path.join(os.path.dirname(__file__), "data", "tripmap.json")
-            tripmap_all = json.load(open(tripmap_path, "r", encoding="utf-8"))
-            allowed_svcs = set()
-            for meta in (tripmap_all or {}).values():
-                if not isinstance(meta, dict): 
-                    continue
-                rn = (meta.get("rl") or meta.get("rs") or "")
-                if isinstance(rn, str) and any(h.lower() in rn.lower() for h in NEC_ROUTE_NAME_HINTS):
-                    svc = meta.get("svc")
-                    if svc:
-                        allowed_svcs.add(str(svc))
-        except Exception:
-            allowed_svcs = None
-
-        if allowed_svcs is None:
-            return raw_bytes
-        out = {}
-        for d, svcs in payload.items():
-            if isinstance(svcs, list):
-                out[d] = [s for s in svcs if str(s) in allowed_svcs]
-            else:
-                out[d] = svcs
-        return json.dumps(out).encode("utf-8")
+    @property
+    def compressible(self) -> bool:
+        return self.ctype.startswith(STATIC_COMPRESSIBLE)
 
-    return raw_bytes
+class StaticFiles:
+    """Cache of files under PUBLIC_DIR, keyed by URL path."""
 
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+        self.memory_bytes = 0
+        self.stats = {"memory_hits": 0, "sendfile": 0, "loads": 0}
+        self._files: Dict[str, StaticFile] = {}
+        self._lock = threading.Lock()
 
+    def _resolve(self, url_path: str) -> Optional[str]:
+        rel = url_path.lstrip("/")
+        if not rel or rel.endswith("/"):
+            rel += "index.html"
+        path = os.path.realpath(os.path.join(self.root, rel))
+        if not path.startswith(self.root + os.sep):
+            return None
+        return path
 
+    def _fresh(self, f: StaticFile) -> bool:
+        now = time.monotonic()
+        if now - f.checked < STATIC_RECHECK_SECONDS:
+            return True
+        if _stamp(f.path) != f.stamp or any(_stamp(p) != st for p, st in f.deps):
+            return False
+        f.checked = now
+        return True
 
-# === Auth config ===
-ACCOUNTS_FILE = os.path.join(os.path.dirname(__file__), "accounts.json")
-SESSION_COOKIE = "amtrak_session"
-SESSION_TTL_SECONDS = 8 * 60 * 60  # 8 hours
+    def get(self, url_path: str) -> Optional[StaticFile]:
+        """The current version of a regular file, or None (missing, directory, outside root).
 
-# In-memory session store (not persisted to disk; not stored in the browser beyond an HttpOnly cookie)
-_sessions = {}  # token -> {"username": str, "routes": [str], "exp": float}
-_sessions_lock = threading.Lock()
+        url_path is already percent-decoded; paths with "." or ".." segments
+        are never served.
+        """
+        if has_dot_segment(url_path):
+            return None
+        f = self._files.get(url_path)
+        if f is not None and self._fresh(f):
+            return f
+        path = self._resolve(url_path)
+        stamp = _stamp(path) if path else None
+        if stamp is None:
+            self._drop(url_path)
+            return None
+        f = self._load(path, stamp)
+        with self._lock:
+            old = self._files.get(url_path)
+            if old is not None and old.body is not None:
+                self.memory_bytes -= len(old.body.raw)
+            if f.body is not None and self.memory_bytes + f.size > STATIC_MEMORY_MAX_BYTES:
+                # Over budget: serve this one from disk, and validate it by the
+                # disk bytes rather than the (possibly rewritten) body.
+                f.body = None
+                f.hash = _disk_hash(f.path)
+                f.etag = f'"{f.hash}"'
+            if f.body is not None:
+                self.memory_bytes += len(f.body.raw)
+            self._files[url_path] = f
+            self.stats["loads"] += 1
+        return f
 
-# Cache accounts.json for fast reloads
-_accounts_cache = {"mtime": 0, "data": {}}
-_accounts_lock = threading.Lock()
+    def _drop(self, url_path: str):
+        with self._lock:
+            old = self._files.pop(url_path, None)
+            if old is not None and old.body is not None:
+                self.memory_bytes -= len(old.body.raw)
 
-def _b64u_decode(s: str) -> bytes:
-    pad = "=" * (-len(s) % 4)
-    return base64.urlsafe_b64decode((s + pad).encode("ascii"))
+    def _load(self, path: str, stamp: Tuple[int, int]) -> StaticFile:
+        ctype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        f = StaticFile(path, stamp, ctype)
+        if f.size <= STATIC_MEMORY_MAX_FILE:
+            with open(path, "rb") as fh:
+                raw = fh.read()
+            if ctype.startswith(("text/html", "text/css", "application/javascript", "text/javascript")):
+                raw = self._version_refs(path, raw, f.deps)
+            f.body = EncodedBody(raw)
+            f.hash = f.body.etag.strip('"')
+            if f.compressible and len(raw) >= COMPRESS_MIN_BYTES:
+                for enc in PRECOMPRESS_ENCODINGS:
+                    f.body.encoded(enc)
+        else:
+            f.hash = _disk_hash(path)
+        f.etag = f'"{f.hash}"'
+        return f
 
-def load_accounts():
-    """Load accounts.json; auto-reload if file changed."""
-    try:
-        mtime = os.path.getmtime(ACCOUNTS_FILE)
-    except FileNotFoundError:
-        return {}
-    with _accounts_lock:
-        if mtime != _accounts_cache["mtime"]:
-            with open(ACCOUNTS_FILE, "r", encoding="utf-8") as f:
-                _accounts_cache["data"] = json.load(f)
-            _accounts_cache["mtime"] = mtime
-        return _accounts_cache["data"]
+    def _version_refs(self, path: str, raw: bytes, deps: list) -> bytes:
+        try:
+            text = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            return raw
+        base = os.path.dirname(path)
+        def sub(m):
+            ref = m.group(2)
+            target = os.path.join(self.root, ref.lstrip("/")) if ref.startswith("/") else os.path.join(base, ref)
+            url = "/" + os.path.relpath(os.path.realpath(target), self.root).replace(os.sep, "/")
+            asset = self.get(url) if url.startswith("/assets/") else None
+            if asset is None:
+                return m.group(0)
+            deps.append((asset.path, asset.stamp))
+            return m.group(1) + ref + "?v=" + asset.hash
+        return _ASSET_REF.sub(sub, text).encode("utf-8")
 
-def verify_password(stored: dict, password: str) -> bool:
-    # PBKDF2 SHA-256 (built-in, no extra deps)
-    if stored.get("algo") != "pbkdf2_sha256":
-        return False
-    salt = _b64u_decode(stored["salt"])
-    expected = _b64u_decode(stored["hash"])
-    iterations = int(stored.get("iter", 200_000))
-    dklen = int(stored.get("dklen", len(expected)))
-    got = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations, dklen=dklen)
-    return hmac.compare_digest(got, expected)
+def _disk_hash(path: str) -> str:
+    with open(path, "rb") as fh:
+        return hashlib.file_digest(fh, "blake2b").hexdigest()[:24]
 
-def create_session(username: str, routes: List[str], filters: Optional[dict]=None) -> str:
-    token = base64.urlsafe_b64encode(secrets.token_bytes(32)).decode("ascii").rstrip("=")
-    exp = time.time() + SESSION_TTL_SECONDS
-    with _sessions_lock:
-        _sessions[token] = {"username": username, "routes": routes, "filters": (filters or {}), "exp": exp}
-    return token
+STATIC_FILES = StaticFiles(PUBLIC_DIR)
 
-def get_session(token: str):
-    if not token:
-        return None
-    with _sessions_lock:
-        s = _sessions.get(token)
-        if not s:
-            return None
-        if s["exp"] < time.time():
-            _sessions.pop(token, None)
-            return None
-        return s
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """A single "bytes=a-b" range -> (start, end inclusive); None = serve the whole file.
 
-def destroy_session(token: str):
-    if not token:
-        return
-    with _sessions_lock:
-        _sessions.pop(token, None)
+    Malformed ranges are ignored (None), as RFC 9110 asks; ValueError means a
+    valid range that cannot be satisfied (416).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None   # multipart ranges are optional; send the full body
+    first, _, last = spec.strip().partition("-")
+    if not (first or last) or not all(p.isascii() and p.isdigit() for p in (first, last) if p):
+        return None
+    if not first:
+        n = int(last)
+        if n == 0:
+            raise ValueError(header)
+        return (max(0, size - n), size - 1)
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None   # last-pos before first-pos is invalid syntax, not unsatisfiable
+    if start >= size:
+        raise ValueError(header)
+    return (start, end)
 
-def match_route(allowed: str, path: str) -> bool:
-    # "*" matches everything
-    if allowed == "*" or allowed == "/*":
-        return True
-    # prefix wildcard like "/rt/*"
-    if allowed.endswith("*"):
-        return path.startswith(allowed[:-1])
-    # exact
-    return path == allowed
+@METRICS.collector
+def _collect_state():
+    yield "amtrak_sessions_active", (), len(SESSIONS)
+    for event, n in SESSIONS.stats.items():
+        yield "amtrak_sessions_total", (("event", event),), n
+    for result in ("hits", "misses"):
+        yield "amtrak_response_cache_requests_total", (("result", result),), RESPONSE_CACHE.stats[result]
+    yield "amtrak_response_cache_evictions_total", (), RESPONSE_CACHE.stats["evictions"]
+    yield "amtrak_response_cache_bytes", (), RESPONSE_CACHE.bytes
+    for reason in ("rejected_busy", "throttled"):
+        yield "amtrak_login_rejected_total", (("reason", reason),), LOGIN_VERIFIER.stats[reason]
+    for name in RT_POLL_INTERVALS:
+        snap = SNAPSHOTS.peek(name)
+        if snap is not None:
+            yield "amtrak_snapshot_age_seconds", (("endpoint", name),), snap.age()
+    yield "amtrak_snapshot_stale_served_total", (), SNAPSHOTS.stats["stale_served"]
+    upstream = SNAPSHOTS.upstream()
+    yield "amtrak_upstream_circuit_state", (), ("closed", "half-open", "open").index(upstream.breaker.state)
+    yield "amtrak_upstream_inflight", (), upstream.inflight
+    yield "amtrak_sse_subscribers", (), SSE_HUB.subscriber_count()
+    for result, n in (("ok", DATA_VERSIONS.stats["loads"]), ("failed", DATA_VERSIONS.stats["failures"])):
+        yield "amtrak_data_reloads_total", (("result", result),), n
+    yield "amtrak_history_written_bytes_total", (), HISTORY.stats["bytes"]
+    for outcome, key in (("recorded", "snapshots"), ("merged", "merged"), ("failed", "failures")):
+        yield "amtrak_history_snapshots_total", (("outcome", outcome),), HISTORY.stats[key]
 
-def is_authorized(session: dict, path: str) -> bool:
-    # Normalize root -> index
-    if path == "/":
-        path = "/index.html"
-    routes = session.get("routes") or []
-    return any(match_route(r, path) for r in routes)
+class _DiscardBody:
+    """Stands in for wfile after a HEAD response's headers are sent."""
 
-def proxy_json(url, timeout=25):
-    req = Request(url, headers={
-        "User-Agent": "amtrak-board-local-proxy",
-        "Accept": "application/json",
-    })
+    def __init__(self, wfile):
+        self.raw = wfile
 
-    def _open(ctx=None):
-        if ctx is None:
-            with urlopen(req, timeout=timeout) as resp:
-                return resp.read(), resp.headers.get("Content-Type","application/json; charset=utf-8")
-        else:
-            with urlopen(req, timeout=timeout, context=ctx) as resp:
-                return resp.read(), resp.headers.get("Content-Type","application/json; charset=utf-8")
+    def write(self, data) -> int:
+        return len(data)
 
-    try:
-        return _open()
-    except Exception as e:
-        # Common on some macOS Python builds: missing/old CA bundle -> CERTIFICATE_VERIFY_FAILED
-        msg = str(e)
-        if "CERTIFICATE_VERIFY_FAILED" in msg or "certificate verify failed" in msg:
-            try:
-                if certifi:
-                    ctx = ssl.create_default_context(cafile=certifi.where())
-                else:
-                    ctx = ssl._create_unverified_context()
-                return _open(ctx)
-            except Exception:
-                # final fallback: unverified (local proxy only)
-                ctx = ssl._create_unverified_context()
-                return _open(ctx)
-        raise
+    def flush(self):
+        self.raw.flush()
 
 class Handler(SimpleHTTPRequestHandler):
+    _data_version: Optional[DataVersion] = None
+    _started: Optional[float] = None
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("directory", PUBLIC_DIR)
+        super().__init__(*args, **kwargs)
+
+    def parse_request(self):
+        # Timed from here, not from the wait for the request line, so idle
+        # keep-alive time is not counted as latency.
+        self._started = time.perf_counter()
+        self._status = 0
+        self._bytes_out = 0
+        self._data_version = None
+        return super().parse_request()
+
+    def handle_one_request(self):
+        self._started = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._started is not None and self._status:
+                route = route_label(self.path)
+                METRICS.inc("amtrak_http_requests_total", (("route", route), ("method", self.command or "-"), ("code", self._status)))
+                METRICS.observe("amtrak_http_request_duration_seconds", (("route", route),), time.perf_counter() - self._started)
+                if self._bytes_out:
+                    METRICS.inc("amtrak_http_response_bytes_total", (("route", route),), self._bytes_out)
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if keyword == "Content-Length" and self.command != "HEAD":
+            self._bytes_out = int(value)
+        super().send_header(keyword, value)
+
+    def data_version(self) -> DataVersion:
+        """The DataVersion this request reads from, pinned on first use."""
+        if self._data_version is None:
+            self._data_version = DATA_VERSIONS.get()
+        return self._data_version
+
+    def end_headers(self):
+        ver = self._data_version or DATA_VERSIONS.current
+        if ver is not None:
+            self.send_header("X-Data-Version", ver.id)
+        super().end_headers()
+        if self.command == "HEAD":
+            self.wfile = _DiscardBody(self.wfile)
+
     # ---- Helpers ----
     def send_json(self, code: int, obj: dict, extra_headers: Optional[dict]=None):
         body = json.dumps(obj).encode("utf-8")
         self.send_response(code)
         self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
         self.send_header("Cache-Control", "no-store")
         if extra_headers:
             for k,v in extra_headers.items():
@@ -323,8 +2503,320 @@ class Handler(SimpleHTTPRequestHandler):
             return None, "not_logged_in"
         if not is_authorized(session, path):
             return None, "forbidden"
+        region = session_region(session)
+        if region is not None and region not in REGIONS:
+            # Fail closed: a restricted account never sees unfiltered data.
+            return None, "forbidden"
         return session, None
 
+    def snapshot_headers(self, snap: RealtimeSnapshot) -> dict:
+        headers = {
+            "Age": str(int(snap.age())),
+            "X-Snapshot-Version": str(snap.version),
+            "X-Snapshot-Age": f"{snap.age():.1f}",
+        }
+        if SNAPSHOTS.is_stale(snap):
+            # Served stale-if-error: upstream is failing or still being refreshed.
+            headers["X-Snapshot-Stale"] = "1"
+            headers["Warning"] = '110 - "Response is Stale"'
+        return headers
+
+    def send_metrics(self):
+        auth = self.headers.get("Authorization", "").encode("utf-8", "replace")
+        if not (METRICS_TOKEN and hmac.compare_digest(auth, b"Bearer " + METRICS_TOKEN.encode("utf-8"))):
+            session, err = self.require_auth("/metrics")
+            if err == "not_logged_in":
+                return self.send_json(401, {"error":"not_logged_in"})
+            if err == "forbidden":
+                return self.send_json(403, {"error":"forbidden"})
+        body = METRICS.render()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_upstream_unavailable(self, e: UpstreamUnavailable):
+        retry = max(1, int(SNAPSHOTS.upstream().breaker.retry_in()))
+        return self.send_json(503, {"error":"upstream_unavailable","message":str(e.reason)}, {"Retry-After": str(retry)})
+
+    def send_rt_snapshot(self, name: str, profile: Optional[str]=None):
+        try:
+            snap = SNAPSHOTS.get(name)
+        except UpstreamUnavailable as e:
+            return self.send_upstream_unavailable(e)
+        except Exception as e:
+            code = getattr(e, "code", None)
+            body = ""
+            try:
+                if hasattr(e, "read"):
+                    body = e.read().decode("utf-8","ignore")[:500]
+            except Exception:
+                pass
+            return self.send_json(502, {"error":"proxy_failed","upstream_status":code,"message":str(e),"body":body})
+
+        body, ctype = snap.body, snap.ctype
+        # Apply optional regional filter (built once per snapshot version and region)
+        if profile is not None:
+            try:
+                body = region_snapshot_body(snap, profile)
+                ctype = "application/json; charset=utf-8"
+            except Exception:
+                pass
+        self.send_body(body, ctype, extra_headers=self.snapshot_headers(snap))
+
+    def send_rt_indexed(self, kind: str, key: str, session: dict):
+        try:
+            snap = SNAPSHOTS.get("trains")
+            index = snap.derive("index", RealtimeIndex)
+        except UpstreamUnavailable as e:
+            return self.send_upstream_unavailable(e)
+        except (URLError, HTTPError, OSError) as e:
+            return self.send_json(502, {"error":"proxy_failed","message":str(e)})
+        except ValueError as e:
+            return self.send_json(502, {"error":"bad_upstream_payload","message":str(e)})
+        profile = data_profile(session)
+        body = index.train_body(key, profile) if kind == "train" else index.station_body(key, profile)
+        if body is None:
+            return self.send_json(404, {"error":"not_found"})
+        self.send_body(body, "application/json; charset=utf-8", extra_headers=self.snapshot_headers(snap))
+
+    def start_stream(self, query: str, session: dict):
+        """SSE: full state (or missed deltas), then one event per changed snapshot."""
+        qs = parse_qs(query)
+        split = lambda k: frozenset(c.strip().upper() for v in qs.get(k, []) for c in v.split(",") if c.strip())
+        scope = (split("station"), split("train"), data_profile(session))
+        last_id = self.headers.get("Last-Event-ID") or (qs.get("lastEventId") or [None])[0]
+        try:
+            SNAPSHOTS.get("trains")
+        except Exception as e:
+            return self.send_json(502, {"error":"proxy_failed","message":str(e)})
+        if SSE_HUB.subscriber_count() >= SSE_MAX_SUBSCRIBERS:
+            return self.send_json(503, {"error":"too_many_streams"}, {"Retry-After": "30"})
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("X-Accel-Buffering", "no")
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+        if self.command != "HEAD":
+            self.attach_stream(scope, last_id)
+
+    def attach_stream(self, scope: tuple, last_id: Optional[str]):
+        # Hand the socket to the pump thread; this request thread is done.
+        if not SSE_PUMP.attach(self.connection, scope, last_id):
+            # The 200 is already out (the hub filled up since the pre-check).
+            self.wfile.write(SSE_FULL_FRAME)
+            self.wfile.flush()
+
+    def send_shard(self, relpath: str, session: dict):
+        try:
+            shards = self.data_version().index.shards(data_profile(session))
+        except (OSError, ValueError) as e:
+            return self.send_json(500, {"error":"data_read_failed","message":str(e)})
+        body = shards.bodies.get(relpath)
+        if body is None:
+            return self.send_json(404, {"error":"not_found"})
+        return self.send_body(body, "application/json; charset=utf-8")
+
+    def send_trip_data(self, path_only: str, session: dict):
+        try:
+            index = self.data_version().index
+        except (OSError, ValueError) as e:
+            return self.send_json(500, {"error":"data_read_failed","message":str(e)})
+        profile = data_profile(session)
+        if path_only == "/data/trip_origins.json":
+            return self.send_body(index.trip_origins_body(profile), "application/json; charset=utf-8")
+        trip = index.trip(path_only[len("/data/trip/"):], profile)
+        if trip is None:
+            return self.send_json(404, {"error":"not_found"})
+        return self.send_body(EncodedBody(json.dumps(trip).encode("utf-8")), "application/json; charset=utf-8")
+
+    def send_board(self, query: str, session: dict):
+        qs = parse_qs(query)
+        arg = lambda k, d=None: (qs.get(k) or [d])[0]
+        station = (arg("station") or "").strip().upper()
+        kind = arg("type", "departures")
+        if not station or kind not in ("departures", "arrivals"):
+            return self.send_json(400, {"error":"bad_request"})
+        ymd = (arg("date") or time.strftime("%Y-%m-%d")).replace("-", "")
+        try:
+            time.strptime(ymd, "%Y%m%d")
+            t_from = parse_board_time(arg("from"), 0)
+            t_to = parse_board_time(arg("to"), 2 * 86400)
+            limit = max(1, min(int(arg("limit", BOARD_DEFAULT_LIMIT)), BOARD_MAX_LIMIT))
+        except ValueError:
+            return self.send_json(400, {"error":"bad_request"})
+        try:
+            ver = self.data_version()
+        except (OSError, ValueError) as e:
+            return self.send_json(500, {"error":"data_read_failed","message":str(e)})
+        profile = data_profile(session)
+        if not ver.index.has_station(station, profile):
+            return self.send_json(404, {"error":"unknown_station"})
+        def build():
+            rows = ver.index.board(station, ymd, kind, t_from, t_to, limit, profile)
+            return EncodedBody(json_bytes({"station": station, "date": ymd, "type": kind, "from": t_from, "to": t_to, "rows": rows}))
+        # Only the default window of a scheduled date is cached (and precompressed);
+        # custom from/to/limit combinations are built per request so arbitrary
+        # query strings cannot fill RESPONSE_CACHE.
+        if (arg("from"), arg("to"), arg("limit")) != (None, None, None) or ymd not in ver.index.services_by_date:
+            return self.send_body(build(), "application/json; charset=utf-8")
+        body = RESPONSE_CACHE.get(("board", ver.id, station, ymd, kind, profile), build)
+        return self.send_body(body, "application/json; charset=utf-8")
+
+    def send_history(self, query: str, session: dict):
+        """/rt/history?train=N[&from=&to=] or /rt/history?station=CODE[&date=YYYY-MM-DD]."""
+        qs = parse_qs(query)
+        arg = lambda k, d=None: (qs.get(k) or [d])[0]
+        train = (arg("train") or "").strip()
+        station = (arg("station") or "").strip().upper()
+        date = arg("date") or time.strftime("%Y-%m-%d")
+        try:
+            if train:
+                t_to = parse_history_time(arg("to"), time.time())
+                t_from = parse_history_time(arg("from"), t_to - HISTORY_DEFAULT_RANGE_SECONDS)
+                if not 0 <= t_to - t_from <= HISTORY_MAX_RANGE_SECONDS:
+                    raise ValueError("range")
+            elif station:
+                day = time.mktime(time.strptime(date, "%Y-%m-%d"))
+            else:
+                raise ValueError("train or station")
+        except ValueError:
+            return self.send_json(400, {"error":"bad_request"})
+        profile = data_profile(session)
+
+        if train:
+            keep = REGIONS[profile].keep_train if profile is not None else None
+            points, stations, shown, truncated = [], {}, set(), False
+            for ts, key, t in HISTORY_READER.train(train, t_from, t_to):
+                train_id = key.split("|", 1)[1]
+                if t is None:
+                    if key in shown:
+                        points.append({"t": ts, "trainID": train_id, "removed": True})
+                    continue
+                if keep is not None and not keep(t):
+                    continue
+                if len(points) >= HISTORY_MAX_POINTS:
+                    truncated = True
+                    break
+                shown.add(key)
+                points.append({"t": ts, **_summarize_train(t)})
+                stations[train_id] = t.get("stations") or []
+            payload = {"train": train, "from": t_from, "to": t_to, "points": points,
+                       "stations": stations, "truncated": truncated}
+        else:
+            rows = []
+            if profile is None or station in REGIONS[profile].stations:
+                seen = HISTORY_READER.station(station, day - HISTORY_DAY_SLACK_SECONDS, day + 86400 + HISTORY_DAY_SLACK_SECONDS)
+                for key, (first, changed, route, stop) in seen.items():
+                    # Scheduled times carry the station's local date.
+                    sched = str(stop.get("schDep") or stop.get("schArr") or "")
+                    on_date = sched[:10] == date if sched else day <= first < day + 86400
+                    if not on_date:
+                        continue
+                    num, train_id = key.split("|", 1)
+                    rows.append({"trainNum": num, "trainID": train_id, "routeName": route,
+                                 "firstSeen": first, "lastChange": changed, "stop": stop})
+            rows.sort(key=lambda r: str(r["stop"].get("schDep") or r["stop"].get("schArr") or ""))
+            payload = {"station": station, "date": date, "trains": rows}
+        return self.send_body(EncodedBody(json_bytes(payload)), "application/json; charset=utf-8")
+
+    def send_body(self, body: EncodedBody, ctype: str, cache_control: str="private, no-cache", extra_headers: Optional[dict]=None,
+                  compress: bool=True):
+        """Send a cached body with ETag/If-None-Match and Accept-Encoding handling."""
+        encoding = negotiate_encoding(self.headers.get("Accept-Encoding", ""), len(body.raw)) if compress else None
+        etag = body.etag_for(encoding)
+        if etag_matches(self.headers.get("If-None-Match", ""), body.etag):
+            self.send_response(304)
+            data = b""
+        else:
+            self.send_response(200)
+            data = body.encoded(encoding)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+        self.send_header("ETag", etag)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Cache-Control", cache_control)
+        if extra_headers:
+            for k,v in extra_headers.items():
+                self.send_header(k, v)
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    def send_static(self, path_only: str, query: str, is_public: bool) -> bool:
+        """Serve a file from STATIC_FILES; False leaves it to SimpleHTTPRequestHandler (directories, 404s)."""
+        f = STATIC_FILES.get(path_only)
+        if f is None:
+            return False
+        if path_only.startswith("/assets/"):
+            versioned = parse_qs(query).get("v", [""])[0] == f.hash
+            cache_control = STATIC_IMMUTABLE if versioned else "public, no-cache"
+        else:
+            cache_control = "no-cache" if is_public else "private, no-cache"
+        if f.body is not None:
+            STATIC_FILES.stats["memory_hits"] += 1
+            self.send_body(f.body, f.ctype, cache_control, {"Last-Modified": f.last_modified}, compress=f.compressible)
+            return True
+        self.send_file(f, cache_control)
+        return True
+
+    def send_file(self, f: StaticFile, cache_control: str):
+        """Large static file: validators, single Range, zero-copy body."""
+        span = None
+        if etag_matches(self.headers.get("If-None-Match", ""), f.etag):
+            status = 304
+        else:
+            status = 200
+            if_range = self.headers.get("If-Range")
+            if self.headers.get("Range") and (not if_range or if_range.strip() == f.etag):
+                try:
+                    span = parse_range(self.headers["Range"], f.size)
+                except ValueError:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{f.size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if span is not None:
+                    status = 206
+        self.send_response(status)
+        if status != 304:
+            start, end = span or (0, f.size - 1)
+            self.send_header("Content-Type", f.ctype)
+            self.send_header("Content-Length", str(end - start + 1))
+            if span is not None:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{f.size}")
+        self.send_header("ETag", f.etag)
+        self.send_header("Last-Modified", f.last_modified)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Cache-Control", cache_control)
+        self.end_headers()
+        if status == 304 or self.command == "HEAD":
+            return
+        STATIC_FILES.stats["sendfile"] += 1
+        with open(f.path, "rb") as fh:
+            conn = getattr(self, "connection", None)
+            if isinstance(conn, socket.socket):
+                # Zero-copy: the kernel moves file pages straight to the socket.
+                conn.sendfile(fh, start, end - start + 1)
+            else:
+                fh.seek(start)
+                self.wfile.write(fh.read(end - start + 1))
+
+    def do_HEAD(self):
+        """do_GET's routing, auth and headers; end_headers() drops the body."""
+        wfile = self.wfile
+        try:
+            self.do_GET()
+        finally:
+            self.wfile = wfile
+
     # ---- POST endpoints (login/logout) ----
     def do_POST(self):
         if self.path.startswith("/auth/login"):
@@ -333,19 +2825,33 @@ class Handler(SimpleHTTPRequestHandler):
                 return self.send_json(400, {"error":"bad_request"})
             username = str(body["username"]).strip()
             password = str(body["password"])
-            accounts = load_accounts()
-            rec = accounts.get(username)
-            if not rec or not verify_password(rec, password):
+            try:
+                LOGIN_VERIFIER.check_throttle(username, self.client_address[0])
+            except LoginThrottled as e:
+                return self.send_json(429, {"error":"too_many_attempts"}, {"Retry-After": str(e.retry_after)})
+            rec = ACCOUNTS.get(username)
+            try:
+                ok = bool(rec) and LOGIN_VERIFIER.verify(rec, password)
+            except LoginBusy:
+                return self.send_json(503, {"error":"login_busy"}, {"Retry-After": str(LOGIN_RETRY_AFTER_SECONDS)})
+            except Exception as e:
+                print(f"[login] verification failed: {e!r}")
+                return self.send_json(503, {"error":"login_unavailable"}, {"Retry-After": str(LOGIN_RETRY_AFTER_SECONDS)})
+            if not ok:
+                LOGIN_VERIFIER.record_failure(username, self.client_address[0])
                 return self.send_json(401, {"error":"invalid_credentials"})
+            LOGIN_VERIFIER.record_success(username)
 
             token = create_session(username, rec.get("routes", []), rec.get("filters"))
             # Set cookie + return basic info
+            body = json.dumps({"ok": True, "username": username, "routes": rec.get("routes", [])}).encode("utf-8")
             self.send_response(200)
             self.set_session_cookie(token)
             self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
             self.send_header("Cache-Control", "no-store")
             self.end_headers()
-            self.wfile.write(json.dumps({"ok": True, "username": username, "routes": rec.get("routes", [])}).encode("utf-8"))
+            self.wfile.write(body)
             return
 
         if self.path.startswith("/auth/logout"):
@@ -354,6 +2860,7 @@ class Handler(SimpleHTTPRequestHandler):
             self.send_response(200)
             self.set_session_cookie(None)
             self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", "11")
             self.send_header("Cache-Control", "no-store")
             self.end_headers()
             self.wfile.write(b'{"ok":true}')
@@ -380,14 +2887,22 @@ class Handler(SimpleHTTPRequestHandler):
         if self.path.startswith("/rt/ping"):
             self.send_response(200)
             self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", "11")
             self.send_header("Cache-Control", "no-store")
             self.end_headers()
             self.wfile.write(b'{"ok":true}')
             return
 
-        # Normalize just the path part (strip query)
+        # Normalize just the path part (strip query). Every check below and the
+        # file that is served use this same decoded path; dot segments are
+        # refused rather than resolved, as translate_path() would drop them.
         parsed = urlparse(self.path)
-        path_only = parsed.path
+        path_only = unquote(parsed.path)
+        if has_dot_segment(path_only):
+            return self.send_json(404, {"error":"not_found"})
+
+        if path_only == "/metrics":
+            return self.send_metrics()
 
         # Force start on login page
         if path_only in ("/", "/index.html"):
@@ -396,6 +2911,7 @@ class Handler(SimpleHTTPRequestHandler):
             if not session:
                 self.send_response(302)
                 self.send_header("Location", "/login.html")
+                self.send_header("Content-Length", "0")
                 self.end_headers()
                 return
 
@@ -418,68 +2934,48 @@ class Handler(SimpleHTTPRequestHandler):
                 return self.send_json(401, {"error":"not_logged_in"})
             if err == "forbidden":
                 return self.send_json(403, {"error":"forbidden"})
-            # Proxy routes
+            if path_only == "/rt/stream":
+                return self.start_stream(parsed.query, session)
+
+            if path_only == "/rt/status":
+                return self.send_json(200, {
+                    "login": dict(LOGIN_VERIFIER.stats, workers=LOGIN_VERIFIER.workers, max_queue=LOGIN_VERIFIER.max_queue),
+                    "snapshots": {name: {"version": snap.version, "age": round(snap.age(), 1)}
+                                  for name in RT_POLL_INTERVALS for snap in [SNAPSHOTS.peek(name)] if snap is not None},
+                    "upstream": dict(SNAPSHOTS.upstream().status(), **SNAPSHOTS.stats),
+                    "streams": SSE_HUB.subscriber_count(),
+                    "sessions": dict(SESSIONS.stats, active=len(SESSIONS)),
+                    "history": dict(HISTORY.status(), **HISTORY_READER.stats),
+                    "accounts": dict(ACCOUNTS.stats, count=len(ACCOUNTS)),
+                    "static": dict(STATIC_FILES.stats, memory_bytes=STATIC_FILES.memory_bytes),
+                    "response_cache": dict(RESPONSE_CACHE.stats, entries=len(RESPONSE_CACHE), bytes=RESPONSE_CACHE.bytes,
+                                           max_bytes=RESPONSE_CACHE.max_bytes, codec="orjson" if orjson is not None else "json"),
+                    "data": dict(DATA_VERSIONS.stats, version=DATA_VERSIONS.current.id if DATA_VERSIONS.current else None,
+                                 error=DATA_VERSIONS.last_error),
+                })
+
+            if path_only == "/rt/board":
+                return self.send_board(parsed.query, session)
+
+            if path_only == "/rt/history":
+                return self.send_history(parsed.query, session)
+
+            # Indexed realtime lookups: /rt/trains/<number>, /rt/stations/<code>/trains
+            parts = path_only.strip("/").split("/")
+            if len(parts) == 3 and parts[1] == "trains" and parts[2]:
+                return self.send_rt_indexed("train", parts[2], session)
+            if len(parts) == 4 and parts[1] == "stations" and parts[3] == "trains" and parts[2]:
+                return self.send_rt_indexed("station", parts[2].upper(), session)
+
+            # Realtime routes, served from the shared snapshot
             if path_only.startswith("/rt/trains"):
-                try:
-                    data, ctype = proxy_json(f"{AMTRAKER_BASE}/trains")
-                    # Apply optional regional filter
-                    if session.get("filters", {}).get("region") == "nec":
-                        try:
-                            payload = json.loads(data.decode("utf-8"))
-                            payload = filter_nec_trains(payload)
-                            data = json.dumps(payload).encode("utf-8")
-                            ctype = "application/json; charset=utf-8"
-                        except Exception:
-                            pass
-                    self.send_response(200)
-                    self.send_header("Content-Type", ctype)
-                    self.send_header("Cache-Control", "no-store")
-                    self.end_headers()
-                    self.wfile.write(data)
-                except (URLError, HTTPError) as e:
-                    msg = str(e)
-                    code = getattr(e, "code", None)
-                    body = ""
-                    try:
-                        if hasattr(e, "read"):
-                            body = e.read().decode("utf-8","ignore")[:500]
-                    except Exception:
-                        pass
-                    self.send_json(502, {"error":"proxy_failed","upstream_status":code,"message":msg,"body":body})
-                return
+                return self.send_rt_snapshot("trains", data_profile(session))
 
             if path_only.startswith("/rt/stations"):
-                try:
-                    data, ctype = proxy_json(f"{AMTRAKER_BASE}/stations")
-                    # Apply optional regional filter
-                    if session.get("filters", {}).get("region") == "nec":
-                        try:
-                            payload = json.loads(data.decode("utf-8"))
-                            payload = filter_nec_stations(payload)
-                            data = json.dumps(payload).encode("utf-8")
-                            ctype = "application/json; charset=utf-8"
-                        except Exception:
-                            pass
-                    self.send_response(200)
-                    self.send_header("Content-Type", ctype)
-                    self.send_header("Cache-Control", "no-store")
-                    self.end_headers()
-                    self.wfile.write(data)
-                except (URLError, HTTPError) as e:
-                    self.send_json(502, {"error":"proxy_failed","message":str(e)})
-                return
+                return self.send_rt_snapshot("stations", data_profile(session))
 
             if path_only.startswith("/rt/stale"):
-                try:
-                    data, ctype = proxy_json(f"{AMTRAKER_BASE}/stale")
-                    self.send_response(200)
-                    self.send_header("Content-Type", ctype)
-                    self.send_header("Cache-Control", "no-store")
-                    self.end_headers()
-                    self.wfile.write(data)
-                except (URLError, HTTPError) as e:
-                    self.send_json(502, {"error":"proxy_failed","message":str(e)})
-                return
+                return self.send_rt_snapshot("stale")
 
             return self.send_json(404, {"error":"not_found"})
 
@@ -492,14 +2988,17 @@ class Handler(SimpleHTTPRequestHandler):
                 next_q = base64.urlsafe_b64encode(path_only.encode("utf-8")).decode("ascii").rstrip("=")
                 self.send_response(302)
                 self.send_header("Location", f"/login.html?next={next_q}")
+                self.send_header("Content-Length", "0")
                 self.end_headers()
                 return
             if not is_authorized(session, path_only):
+                body = b"<!doctype html><meta charset='utf-8'><title>Forbidden</title><h1>403 Forbidden</h1><p>Your account does not have access to this page.</p>"
                 self.send_response(403)
                 self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
                 self.send_header("Cache-Control", "no-store")
                 self.end_headers()
-                self.wfile.write(b"<!doctype html><meta charset='utf-8'><title>Forbidden</title><h1>403 Forbidden</h1><p>Your account does not have access to this page.</p>")
+                self.wfile.write(body)
                 return
 
         # Protect JS (and any other non-public paths) similarly
@@ -511,36 +3010,448 @@ class Handler(SimpleHTTPRequestHandler):
             if not is_authorized(session, path_only):
                 return self.send_json(403, {"error":"forbidden"})
 
-        # Serve /data/* with auth + optional NEC filtering
+        # Serve /data/* with auth + optional region filtering
         if path_only.startswith("/data/"):
             session, err = self.require_auth(path_only)
             if err == "not_logged_in":
                 return self.send_json(401, {"error":"not_logged_in"})
             if err == "forbidden":
                 return self.send_json(403, {"error":"forbidden"})
+            if path_only == "/data/trip_origins.json" or path_only.startswith("/data/trip/"):
+                return self.send_trip_data(path_only, session)
+            if path_only.startswith("/data/shards/"):
+                return self.send_shard(path_only[len("/data/shards/"):], session)
             try:
-                relpath = path_only.lstrip("/")
-                fs_path = self.translate_path(path_only)
-                if not os.path.isfile(fs_path):
-                    return self.send_json(404, {"error":"not_found"})
-                with open(fs_path, "rb") as f:
-                    raw = f.read()
-                if session.get("filters", {}).get("region") == "nec" and relpath.endswith(".json"):
-                    raw = filter_nec_data_file(relpath, raw)
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json; charset=utf-8")
-                self.send_header("Cache-Control", "no-store")
-                self.end_headers()
-                self.wfile.write(raw)
-                return
-            except Exception as e:
+                body = self.data_version().body(path_only[len("/data/"):], data_profile(session))
+            except (OSError, ValueError) as e:
                 return self.send_json(500, {"error":"data_read_failed","message":str(e)})
+            if body is None:
+                return self.send_json(404, {"error":"not_found"})
+            return self.send_body(body, "application/json; charset=utf-8")
 
+        if self.send_static(path_only, parsed.query, is_public):
+            return
         return super().do_GET()
 
+class BoardHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def shutdown_request(self, request):
+        # SSE sockets outlive their request thread; the pump closes them.
+        if SSE_PUMP.owns(request):
+            return
+        super().shutdown_request(request)
+
+# === asyncio serving mode ===
+# The event loop owns every connection (HTTP/1.1 keep-alive, SSE streams);
+# request handling itself runs the regular Handler against buffered I/O on a
+# bounded worker pool, so routes, auth gating and /data behave identically.
+ASYNC_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+ASYNC_MAX_CONNECTIONS = 10000
+ASYNC_MAX_PENDING = 512          # requests queued for a worker before we answer 503
+ASYNC_KEEPALIVE_SECONDS = 30
+ASYNC_MAX_HEADER_BYTES = 64 * 1024
+ASYNC_MAX_BODY_BYTES = 1024 * 1024
+
+def _simple_response(code: int, reason: str, extra: str="") -> bytes:
+    body = json.dumps({"error": reason}).encode("utf-8")
+    return (f"HTTP/1.1 {code} {reason}\r\nContent-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n{extra}\r\n").encode("latin-1") + body
+
+class BufferedHandler(Handler):
+    """Handler over an already-read request; the response is collected in memory."""
+    protocol_version = "HTTP/1.1"
+
+    def __init__(self, raw: bytes, client_address, server):
+        # Skip StreamRequestHandler.setup()/handle(); there is no socket here.
+        self.rfile = io.BytesIO(raw)
+        self.wfile = io.BytesIO()
+        self.client_address = client_address
+        self.server = server
+        self.request = None
+        self.directory = PUBLIC_DIR
+        self.stream = None
+
+    def attach_stream(self, scope: tuple, last_id: Optional[str]):
+        self.stream = (scope, last_id)
+
+class AsyncSubscriber:
+    """SSE subscriber feeding an asyncio queue from the hub's thread."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.queued = 0
+
+    def send(self, data: bytes):
+        self.loop.call_soon_threadsafe(self._put, data)
+
+    def _put(self, data: bytes):
+        self.queued += len(data)
+        # A client this far behind is dropped rather than buffered forever.
+        self.queue.put_nowait(None if self.queued > SSE_MAX_BUFFER_BYTES else data)
+
+class AsyncBoardServer:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.connections = 0
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(ASYNC_WORKERS, thread_name_prefix="board-req")
+
+    async def serve(self, sock: Optional[socket.socket]=None):
+        if sock is not None:
+            server = await asyncio.start_server(self._client, sock=sock, limit=ASYNC_MAX_HEADER_BYTES)
+        else:
+            server = await asyncio.start_server(self._client, self.host, self.port,
+                                                limit=ASYNC_MAX_HEADER_BYTES, backlog=1024, reuse_address=True)
+        async with server:
+            await server.serve_forever()
+
+    def _dispatch(self, raw: bytes, peer) -> BufferedHandler:
+        handler = BufferedHandler(raw, peer, self)
+        handler.handle_one_request()
+        return handler
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.connections >= ASYNC_MAX_CONNECTIONS:
+            writer.write(_simple_response(503, "too_many_connections", "Retry-After: 5\r\n"))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+            return
+        self.connections += 1
+        peer = writer.get_extra_info("peername") or ("", 0)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), ASYNC_KEEPALIVE_SECONDS)
+                except asyncio.LimitOverrunError:
+                    writer.write(_simple_response(431, "headers_too_large"))
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+
+                length = 0
+                lower = head.lower()
+                if b"\r\ntransfer-encoding:" in lower:
+                    writer.write(_simple_response(501, "chunked_not_supported"))
+                    break
+                idx = lower.find(b"\r\ncontent-length:")
+                if idx >= 0:
+                    try:
+                        length = int(lower[idx + 17:lower.find(b"\r\n", idx + 2)].strip())
+                    except ValueError:
+                        length = -1
+                if length < 0 or length > ASYNC_MAX_BODY_BYTES:
+                    writer.write(_simple_response(413, "body_too_large"))
+                    break
+                try:
+                    body = await reader.readexactly(length) if length else b""
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                if self.pending >= ASYNC_MAX_PENDING:
+                    writer.write(_simple_response(503, "server_busy", "Retry-After: 1\r\n"))
+                    await writer.drain()
+                    break
+                self.pending += 1
+                try:
+                    handler = await loop.run_in_executor(self._executor, self._dispatch, head + body, peer)
+                finally:
+                    self.pending -= 1
+
+                out = handler.wfile.getvalue()
+                writer.write(out)
+                await writer.drain()
+                if handler.stream is not None:
+                    await self._stream(writer, *handler.stream)
+                    break
+                # Without a length we can only delimit the body by closing.
+                end = out.find(b"\r\n\r\n")
+                framed = b"\r\ncontent-length:" in out[:end].lower() or out.startswith(b"HTTP/1.1 304")
+                if handler.close_connection or not framed:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def _stream(self, writer: asyncio.StreamWriter, scope: tuple, last_id: Optional[str]):
+        sub = AsyncSubscriber(asyncio.get_running_loop())
+        if not SSE_HUB.subscribe(sub, scope, last_id):
+            writer.write(SSE_FULL_FRAME)
+            await writer.drain()
+            return
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(sub.queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    data = b": ping\n\n"
+                if data is None:
+                    break
+                sub.queued = max(0, sub.queued - len(data))
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            SSE_HUB.unsubscribe(sub, scope)
+
+# === Multi-process serving (--workers) ===
+# The supervisor process owns the listening socket, the upstream poller and
+# data-version builds. It publishes every snapshot and data version as a pack
+# file in a private directory, and N worker processes (fresh interpreters
+# sharing the inherited socket) mmap those packs instead of fetching or
+# building anything themselves. Sessions are shared through SQLite.
+SHARED_POLL_SECONDS = 0.5
+WORKER_RESTART_DELAY_SECONDS = 1.0
+PACK_MAGIC = b"AMTPACK1"
+PACK_HEADER = struct.Struct("<8sQ")  # magic, index length
+
+def write_pack(path: str, meta: dict, blobs: Dict[str, bytes]) -> None:
+    """Atomically write blobs plus a JSON index (and meta) that Pack can mmap."""
+    index, off = {}, 0
+    for key, blob in blobs.items():
+        index[key] = (off, len(blob))
+        off += len(blob)
+    head = json.dumps({"meta": meta, "index": index}).encode("utf-8")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(PACK_HEADER.pack(PACK_MAGIC, len(head)))
+        f.write(head)
+        for blob in blobs.values():
+            f.write(blob)
+    os.replace(tmp, path)
+
+class Pack:
+    """Read-only mmap of a write_pack() file; get() returns zero-copy slices."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n = PACK_HEADER.unpack_from(self._mm, 0)
+        if magic != PACK_MAGIC:
+            raise ValueError(f"{path}: not a pack file")
+        doc = json.loads(self._mm[PACK_HEADER.size:PACK_HEADER.size + n])
+        self.meta: dict = doc["meta"]
+        self._index: Dict[str, list] = doc["index"]
+        self._base = PACK_HEADER.size + n
+        self._view = memoryview(self._mm)
+
+    def get(self, key: str) -> Optional[memoryview]:
+        loc = self._index.get(key)
+        if loc is None:
+            return None
+        start = self._base + loc[0]
+        return self._view[start:start + loc[1]]
+
+class SharedDir:
+    """Where the supervisor publishes snapshots and data versions for workers."""
+
+    DATA_POINTER = "data.current"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _snapshot_path(self, name: str) -> str:
+        return os.path.join(self.path, f"rt-{name}.pack")
+
+    def publish_snapshot(self, snap: RealtimeSnapshot):
+        blobs = {"raw": snap.body.raw}
+        if len(snap.body.raw) >= COMPRESS_MIN_BYTES:
+            for enc in PRECOMPRESS_ENCODINGS:
+                blobs[enc] = snap.body.encoded(enc)
+        meta = {"version": snap.version, "epoch": snap.epoch, "fetched_at": snap.fetched_at, "ctype": snap.ctype,
+                "etag": snap.body.etag, "encodings": [e for e in blobs if e != "raw"]}
+        write_pack(self._snapshot_path(snap.name), meta, blobs)
+
+    def snapshot_stamp(self, name: str) -> Optional[Tuple[int, int]]:
+        return _file_stamp(self._snapshot_path(name))
+
+    def read_snapshot(self, name: str) -> Optional[Pack]:
+        try:
+            return Pack(self._snapshot_path(name))
+        except FileNotFoundError:
+            return None
+
+    def publish_metrics(self, label: str, samples: Dict[str, list]):
+        path = os.path.join(self.path, f"metrics-{label}.json")
+        with open(path + f".{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+            json.dump(samples, f, separators=(",", ":"))
+        os.replace(path + f".{os.getpid()}.tmp", path)
+
+    def read_metrics(self) -> List[Tuple[str, Dict[str, list]]]:
+        """(label, samples) for every process that has published, supervisor first."""
+        out = []
+        for name in sorted(os.listdir(self.path), key=lambda n: (not n.startswith("metrics-supervisor"), n)):
+            if name.startswith("metrics-") and name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.path, name), "r", encoding="utf-8") as f:
+                        out.append((name[len("metrics-"):-len(".json")], json.load(f)))
+                except (OSError, ValueError):
+                    continue
+        return out
+
+    def publish_data(self, ver: DataVersion):
+        blobs: Dict[str, bytes] = {}
+        bodies = {}
+        for key, body in ver.all_bodies():
+            blobs[key] = body.raw
+            encs = [enc for enc in PRECOMPRESS_ENCODINGS if len(body.raw) >= COMPRESS_MIN_BYTES]
+            for enc in encs:
+                blobs[f"{key}|{enc}"] = body.encoded(enc)
+            bodies[key] = {"etag": body.etag, "encodings": encs}
+        write_pack(os.path.join(self.path, f"data-{ver.id}.pack"), {"id": ver.id, "stamp": ver.stamp, "bodies": bodies}, blobs)
+        tmp = os.path.join(self.path, f"{self.DATA_POINTER}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(ver.id)
+        os.replace(tmp, os.path.join(self.path, self.DATA_POINTER))
+        # Workers still serving an older version keep their mapping after unlink.
+        for name in os.listdir(self.path):
+            if name.startswith("data-") and name.endswith(".pack") and name != f"data-{ver.id}.pack":
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+    def data_pointer(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, self.DATA_POINTER), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def read_data(self, version_id: Optional[str]) -> Pack:
+        if not version_id:
+            raise ValueError("no data version published yet")
+        return Pack(os.path.join(self.path, f"data-{version_id}.pack"))
+
+def run_workers(args) -> None:
+    """Supervise args.workers worker processes on one inherited listening socket."""
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    sock.set_inheritable(True)
+    shared = SharedDir(os.path.join(CACHE_DIR, f"shared-{os.getpid()}"))
+    os.makedirs(shared.path, exist_ok=True)
+    # Workers only see each other's logins and logouts through a shared session
+    # store; every request confirms its session there, so a logout is immediate.
+    os.environ.setdefault("AMTRAK_SESSION_DB", os.path.join(CACHE_DIR, "sessions.db"))
+    # Each child runs its own PBKDF2 pool and queue; split the cores between them.
+    os.environ.setdefault("AMTRAK_LOGIN_WORKERS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+
+    SNAPSHOTS.on_fetch(shared.publish_snapshot)
+    DATA_VERSIONS.on_update(shared.publish_data)
+    METRICS.share(shared, "supervisor")
+    start_history()
+    DATA_VERSIONS.start()
+    SNAPSHOTS.start()
+
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker-fd", str(sock.fileno()), "--shared-dir", shared.path]
+    if args.use_async:
+        cmd.append("--async")
+    procs: Dict[int, subprocess.Popen] = {}
+    def spawn(i: int):
+        procs[i] = subprocess.Popen(cmd + ["--worker-index", str(i)], pass_fds=(sock.fileno(),))
+
+    stopping = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.set())
+    for i in range(args.workers):
+        spawn(i)
+    print(f"[workers] {args.workers} workers, sessions in {os.environ['AMTRAK_SESSION_DB']} (checked per request), "
+          f"{os.environ['AMTRAK_LOGIN_WORKERS']} login hashers each")
+    try:
+        while not stopping.wait(WORKER_RESTART_DELAY_SECONDS):
+            for i, p in list(procs.items()):
+                if p.poll() is not None:
+                    print(f"[workers] worker {i} (pid {p.pid}) exited with {p.returncode}; restarting")
+                    spawn(i)
+    finally:
+        for p in procs.values():
+            p.terminate()
+        for p in procs.values():
+            try:
+                p.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        sock.close()
+        shutil.rmtree(shared.path, ignore_errors=True)
+
+def run_worker(args) -> None:
+    """One --workers child: serve the inherited socket from published state."""
+    sock = socket.socket(fileno=args.worker_fd)
+    # Exit through the interpreter (not the default SIGTERM kill) so the login
+    # process pool is shut down instead of being orphaned.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    shared = SharedDir(args.shared_dir)
+    SNAPSHOTS.follow(shared)
+    DATA_VERSIONS.follow(shared)
+    METRICS.share(shared, str(args.worker_index))
+    DATA_VERSIONS.start()
+    SNAPSHOTS.start()
+    if args.use_async:
+        asyncio.run(AsyncBoardServer(args.host, args.port).serve(sock))
+        return
+    srv = BoardHTTPServer(sock.getsockname()[:2], Handler, bind_and_activate=False)
+    srv.socket.close()
+    srv.socket = sock
+    srv.server_name, srv.server_port = socket.getfqdn(), sock.getsockname()[1]
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass   # Ctrl-C reaches the whole group; the supervisor handles it
+
+def main():
+    ap = argparse.ArgumentParser(description="Amtrak board server")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--async", dest="use_async", action="store_true",
+                    help="asyncio core with HTTP/1.1 keep-alive instead of a thread per connection")
+    ap.add_argument("--build-shards", metavar="DIR",
+                    help="write per-station/per-region shard files (all/ and per-profile) to DIR and exit")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="serve from N worker processes sharing one socket and one upstream poller")
+    ap.add_argument("--worker-fd", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--shared-dir", help=argparse.SUPPRESS)
+    ap.add_argument("--worker-index", type=int, default=0, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker_fd is not None:
+        return run_worker(args)
+    if args.workers and os.name != "posix":
+        ap.error("--workers needs a POSIX system")
+
+    if args.build_shards:
+        index = DATA_VERSIONS.get().index
+        for profile in DATA_PROFILES:
+            out = os.path.join(args.build_shards, profile or "all")
+            shards = index.shards(profile)
+            shards.write(out)
+            print(f"Wrote {len(shards.bodies)} shard files to {out}")
+        return
+
+    print(f"Serving on http://localhost:{args.port}" + (" (asyncio)" if args.use_async else ""))
+    print(f"Login:   http://localhost:{args.port}/login.html")
+    print(f"Health:  http://localhost:{args.port}/rt/ping")
+    print(f"Realtime (auth): http://localhost:{args.port}/rt/trains")
+    warn_unknown_regions()
+    if args.workers:
+        return run_workers(args)
+    start_history()
+    DATA_VERSIONS.start()
+    SNAPSHOTS.start()
+    if args.use_async:
+        asyncio.run(AsyncBoardServer(args.host, args.port).serve())
+    else:
+        BoardHTTPServer((args.host, args.port), Handler).serve_forever()
+
 if __name__ == "__main__":
-    print("Serving on http://localhost:8000")
-    print("Login:   http://localhost:8000/login.html")
-    print("Health:  http://localhost:8000/rt/ping")
-    print("Realtime (auth): http://localhost:8000/rt/trains")
-    ThreadingHTTPServer(("0.0.0.0", 8000), Handler).serve_forever()
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""Compact, memory-mapped store for public/data/stop_events.json.
+
+stop_events.json maps station -> [[arr, dep, tripId], ...]. Loaded as JSON
+that is hundreds of thousands of small Python objects; this module converts it
+once into a columnar binary file that can be mmap'd and queried in place.
+
+Usage:
+  python stop_store.py public/data/stop_events.json stop_events.bin
+
+File layout (little-endian, every section 4-byte aligned):
+  header         HEADER struct (magic, counts, blob sizes, source stamp)
+  station blob   station codes, "\\n"-joined UTF-8
+  trip blob      trip ids, "\\n"-joined UTF-8
+  offsets        int32[n_stations + 1]  event range of each station
+  dep, arr, trip int32[n_events]        per station, sorted by departure
+  arr_sorted     int32[n_events]        per station, arrival times sorted
+  arr_trip       int32[n_events]        trip index matching arr_sorted
+  trip_origin    int32[n_trips]         station index of each trip's first stop
+  trip_offsets   int32[n_trips + 1]     range of each trip in trip_events
+  trip_events    int32[n_events]        event indices grouped by trip, in stop order
+Missing times are stored as -1.
+"""
+import sys, os, json, mmap, struct, glob, tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Optional, Tuple, Iterator, List
+
+FORMAT_VERSION = 2
+MAGIC = b"SEVT" + struct.pack("<I", FORMAT_VERSION)
+HEADER = struct.Struct("<8sIIIIIqq")  # magic, n_st, n_ev, n_trips, st_blob, trip_blob, src_mtime_ns, src_size
+MISSING = -1
+
+def _pad4(n: int) -> int:
+    return (n + 3) & ~3
+
+def source_stamp(json_path: str) -> Tuple[int, int]:
+    st = os.stat(json_path)
+    return (st.st_mtime_ns, st.st_size)
+
+def build(json_path: str, out_path: str) -> None:
+    """Convert stop_events.json into the binary layout described above."""
+    stamp = source_stamp(json_path)
+    with open(json_path, "r", encoding="utf-8") as f:
+        payload = json.load(f)
+
+    stations: List[str] = []
+    trip_ids: List[str] = []
+    trip_index = {}
+    offsets = array("i", [0])
+    dep, arr, trip = array("i"), array("i"), array("i")
+    arr_sorted, arr_trip = array("i"), array("i")
+    origin_t: List[int] = []
+    origin_st: List[int] = []
+
+    for st in payload:
+        evs = payload[st]
+        if not isinstance(evs, list):
+            continue
+        si = len(stations)
+        stations.append(st)
+        rows = []
+        for e in evs:
+            if not isinstance(e, list) or len(e) < 3:
+                continue
+            a = e[0] if isinstance(e[0], int) else MISSING
+            d = e[1] if isinstance(e[1], int) else MISSING
+            tid = str(e[2])
+            ti = trip_index.get(tid)
+            if ti is None:
+                ti = trip_index[tid] = len(trip_ids)
+                trip_ids.append(tid)
+                origin_t.append(1 << 31)
+                origin_st.append(MISSING)
+            t = min(x for x in (a, d, 1 << 31) if x != MISSING)
+            if t < origin_t[ti]:
+                origin_t[ti], origin_st[ti] = t, si
+            rows.append((d, a, ti))
+        rows.sort()
+        for d, a, ti in rows:
+            dep.append(d)
+            arr.append(a)
+            trip.append(ti)
+        for a, ti in sorted((a, ti) for (_, a, ti) in rows):
+            arr_sorted.append(a)
+            arr_trip.append(ti)
+        offsets.append(len(dep))
+
+    # Trip-centric inverse: each trip's events ordered by time at the stop.
+    per_trip: List[List[Tuple[int, int]]] = [[] for _ in trip_ids]
+    for i in range(len(dep)):
+        t = min(x for x in (arr[i], dep[i], 1 << 31) if x != MISSING)
+        per_trip[trip[i]].append((t, i))
+    trip_offsets, trip_events = array("i", [0]), array("i")
+    for evs in per_trip:
+        evs.sort()
+        trip_events.extend(i for _, i in evs)
+        trip_offsets.append(len(trip_events))
+
+    st_blob = "\n".join(stations).encode("utf-8")
+    trip_blob = "\n".join(trip_ids).encode("utf-8")
+    sections = [offsets, dep, arr, trip, arr_sorted, arr_trip, array("i", origin_st), trip_offsets, trip_events]
+    if sys.byteorder != "little":
+        for a in sections:
+            a.byteswap()
+
+    # A unique temp name per build: --workers children (or a CLI run) may build
+    # the same out_path at once, and must not write into each other's file.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(out_path) or ".", prefix=os.path.basename(out_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(stations), len(dep), len(trip_ids), len(st_blob), len(trip_blob), stamp[0], stamp[1]))
+            for blob in (st_blob, trip_blob):
+                f.write(blob)
+                f.write(b"\0" * (_pad4(len(blob)) - len(blob)))
+            for a in sections:
+                a.tofile(f)
+        os.replace(tmp, out_path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+class StopEventStore:
+    """Read-only view over a built stop-event file.
+
+    Time columns are memoryviews into the mmap, so opening costs a header parse
+    plus decoding the station/trip id lists; nothing else is copied.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_st, n_ev, n_trips, st_len, trip_len, mtime_ns, size = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a stop-event store")
+        self.stamp = (mtime_ns, size)
+        pos = HEADER.size
+        self.stations: List[str] = self._mm[pos:pos + st_len].decode("utf-8").split("\n") if n_st else []
+        pos += _pad4(st_len)
+        self.trip_ids: List[str] = self._mm[pos:pos + trip_len].decode("utf-8").split("\n") if n_trips else []
+        pos += _pad4(trip_len)
+        self.station_index = {s: i for i, s in enumerate(self.stations)}
+        self.trip_index = {t: i for i, t in enumerate(self.trip_ids)}
+
+        mv = memoryview(self._mm)
+        def column(n):
+            nonlocal pos
+            col = mv[pos:pos + 4 * n]
+            pos += 4 * n
+            if sys.byteorder != "little":
+                a = array("i", col)
+                a.byteswap()
+                return a
+            return col.cast("i")
+        self.offsets = column(n_st + 1)
+        self.dep = column(n_ev)
+        self.arr = column(n_ev)
+        self.trip = column(n_ev)
+        self.arr_sorted = column(n_ev)
+        self.arr_trip = column(n_ev)
+        self.trip_origin = column(n_trips)
+        self.trip_offsets = column(n_trips + 1)
+        self.trip_events = column(n_ev)
+
+    def close(self):
+        for name in ("offsets", "dep", "arr", "trip", "arr_sorted", "arr_trip", "trip_origin", "trip_offsets", "trip_events"):
+            col = getattr(self, name, None)
+            if isinstance(col, memoryview):
+                col.release()
+        self._mm.close()
+        self._f.close()
+
+    def __len__(self) -> int:
+        return len(self.dep)
+
+    def span(self, station: str) -> Tuple[int, int]:
+        si = self.station_index.get(station)
+        if si is None:
+            return (0, 0)
+        return (self.offsets[si], self.offsets[si + 1])
+
+    def events(self, station: str) -> Iterator[Tuple[int, int, str]]:
+        """(arr, dep, tripId) for a station, in departure order; -1 = missing."""
+        lo, hi = self.span(station)
+        for i in range(lo, hi):
+            yield (self.arr[i], self.dep[i], self.trip_ids[self.trip[i]])
+
+    def window(self, station: str, kind: str, t_from: int, t_to: int) -> Iterator[Tuple[int, int]]:
+        """(time, trip index) for departures/arrivals with t_from <= time <= t_to."""
+        lo, hi = self.span(station)
+        times, trips = (self.dep, self.trip) if kind == "departures" else (self.arr_sorted, self.arr_trip)
+        i = bisect_left(times, max(t_from, 0), lo, hi)
+        end = bisect_right(times, t_to, lo, hi)
+        for j in range(i, end):
+            yield (times[j], trips[j])
+
+    def _station_of(self, event: int) -> str:
+        return self.stations[bisect_right(self.offsets, event) - 1]
+
+    def trip_stops(self, trip_id: str) -> List[Tuple[str, int, int]]:
+        """(station, arr, dep) for every stop of a trip, in stop order; -1 = missing."""
+        ti = self.trip_index.get(trip_id)
+        if ti is None:
+            return []
+        return [(self._station_of(i), self.arr[i], self.dep[i])
+                for i in self.trip_events[self.trip_offsets[ti]:self.trip_offsets[ti + 1]]]
+
+    def origin(self, trip_id: str) -> Optional[str]:
+        ti = self.trip_index.get(trip_id)
+        if ti is None:
+            return None
+        si = self.trip_origin[ti]
+        return self.stations[si] if si != MISSING else None
+
+def open_store(json_path: str, cache_dir: str) -> StopEventStore:
+    """Open the store for json_path, (re)building it in cache_dir if stale.
+
+    The file name carries the source stamp, so a rebuild never replaces a file
+    another process (or an older index) may still have mapped.
+    """
+    mtime_ns, size = source_stamp(json_path)
+    base = os.path.splitext(os.path.basename(json_path))[0]
+    path = os.path.join(cache_dir, f"{base}-v{FORMAT_VERSION}-{mtime_ns}-{size}.bin")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        build(json_path, path)
+        for old in glob.glob(os.path.join(cache_dir, f"{base}-*.bin")):
+            if old != path:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+    return StopEventStore(path)
+
+def main():
+    if len(sys.argv) != 3:
+        print(__doc__.strip())
+        sys.exit(1)
+    build(sys.argv[1], sys.argv[2])
+    store = StopEventStore(sys.argv[2])
+    print(f"Wrote {sys.argv[2]}: {len(store.stations)} stations, {len(store)} events, {len(store.trip_ids)} trips")
+    store.close()
+
+if __name__ == "__main__":
+    main()
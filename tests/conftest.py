@@ -0,0 +1,26 @@
+import os, sys, threading, http.client
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import server
+
+@pytest.fixture(scope="session")
+def addr():
+    """A threaded server on an ephemeral port (no upstream poller)."""
+    server.Handler.log_message = lambda *a: None
+    srv = server.BoardHTTPServer(("127.0.0.1", 0), server.Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv.server_address
+    srv.shutdown()
+
+@pytest.fixture
+def fetch(addr):
+    """fetch(path, cookie=None) -> (status, body); the path is sent as-is."""
+    def fetch(path, cookie=None):
+        conn = http.client.HTTPConnection(*addr, timeout=10)
+        conn.request("GET", path, headers={"Cookie": f"{server.SESSION_COOKIE}={cookie}"} if cookie else {})
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp.status, body
+    return fetch
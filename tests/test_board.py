@@ -0,0 +1,40 @@
+"""/rt/board validates its query before anything reaches RESPONSE_CACHE."""
+import json
+import pytest
+import server
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(server, "DATA_PROFILES", (None,))
+    monkeypatch.setattr(server.Handler, "_data_version", None)
+    token = server.create_session("alexjs", ["*"])
+    yield token
+    server.destroy_session(token)
+
+def test_default_window_is_cached(fetch, token):
+    status, body = fetch("/rt/board?station=alb&date=2026-03-02", token)
+    assert status == 200 and json.loads(body)["station"] == "ALB"
+    hits = server.RESPONSE_CACHE.stats["hits"]
+    assert fetch("/rt/board?station=ALB&date=20260302", token)[0] == 200
+    assert server.RESPONSE_CACHE.stats["hits"] == hits + 1
+
+@pytest.mark.parametrize("query, status", [
+    ("station=NOPE", 404),
+    ("station=ALB&date=2026-13-40", 400),
+    ("station=ALB&date=tomorrow", 400),
+    ("station=ALB&limit=x", 400),
+])
+def test_bad_queries_are_refused(fetch, token, query, status):
+    entries = len(server.RESPONSE_CACHE)
+    assert fetch("/rt/board?" + query, token)[0] == status
+    assert len(server.RESPONSE_CACHE) == entries
+
+@pytest.mark.parametrize("query", [
+    "station=ALB&date=2026-03-02&from=08:00&to=09:00",
+    "station=ALB&date=2026-03-02&limit=7",
+    "station=ALB&date=1999-01-01",
+])
+def test_custom_windows_are_not_cached(fetch, token, query):
+    entries = len(server.RESPONSE_CACHE)
+    assert fetch("/rt/board?" + query, token)[0] == 200
+    assert len(server.RESPONSE_CACHE) == entries
@@ -0,0 +1,58 @@
+"""build_gtfs.py against the tiny feed in tests/fixtures/gtfs."""
+import os, json, shutil, zipfile
+import build_gtfs
+
+FEED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "gtfs")
+
+def _load(out, name):
+    with open(os.path.join(out, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def test_builds_all_outputs(tmp_path):
+    out = str(tmp_path / "data")
+    results = build_gtfs.build(FEED, out, str(tmp_path / "state.json"), jobs=1)
+    assert results == {"stops.json": 3, "tripmap.json": 2, "services_by_date.json": 8, "stop_events.json": 4}
+
+    assert sorted(_load(out, "stops.json")) == ["NYP", "PHL", "WAS"]
+    assert _load(out, "tripmap.json")["T2150"] == {"svc": "WKND", "rs": "", "rl": "Acela",
+                                                   "ts": "2150", "hd": "New York", "dir": "1"}
+    services = _load(out, "services_by_date.json")
+    assert sorted(services) == [f"202601{d:02d}" for d in range(5, 13)]
+    assert services["20260105"] == ["WKND"]      # calendar_dates swaps Monday's service
+    assert services["20260106"] == ["WKDY"]
+    assert services["20260110"] == ["WKND"]
+    assert services["20260112"] == ["WKDY"]      # added past calendar.txt's end_date
+    assert _load(out, "stop_events.json") == {
+        "NYP": [[29100, 29100, "T171"], [92400, 92400, "T2150"]],
+        "PHL": [[34200, 34380, "T171"]],
+        "WAS": [[87000, 87120, "T2150"]],
+    }
+
+def test_explicit_window(tmp_path):
+    out = str(tmp_path / "data")
+    build_gtfs.build(FEED, out, str(tmp_path / "state.json"), start="20260109", days=2, jobs=1)
+    assert _load(out, "services_by_date.json") == {"20260109": ["WKDY"], "20260110": ["WKND"], "20260111": ["WKND"]}
+
+def test_skips_unchanged_outputs(tmp_path):
+    feed, out, state = str(tmp_path / "feed"), str(tmp_path / "data"), str(tmp_path / "state.json")
+    shutil.copytree(FEED, feed)
+    build_gtfs.build(feed, out, state, jobs=1)
+    assert set(build_gtfs.build(feed, out, state, jobs=1).values()) == {None}
+
+    with open(os.path.join(feed, "stop_times.txt"), "a", encoding="utf-8") as f:
+        f.write("T2150,26:00:00,26:00:00,PHL,3\n")
+    results = build_gtfs.build(feed, out, state, jobs=1)
+    assert results == {"stops.json": None, "tripmap.json": None, "services_by_date.json": None, "stop_events.json": 5}
+
+    os.remove(os.path.join(out, "stops.json"))   # a missing output is rebuilt even if its inputs are not
+    assert build_gtfs.build(feed, out, state, jobs=1)["stops.json"] == 3
+    assert build_gtfs.build(feed, out, state, jobs=1, force=True)["tripmap.json"] == 2
+
+def test_zip_with_top_level_folder(tmp_path):
+    path = str(tmp_path / "feed.zip")
+    with zipfile.ZipFile(path, "w") as z:
+        for name in os.listdir(FEED):
+            z.write(os.path.join(FEED, name), f"amtrak/{name}")
+    out, state = str(tmp_path / "data"), str(tmp_path / "state.json")
+    assert build_gtfs.build(path, out, state, jobs=1)["stop_events.json"] == 4
+    assert set(build_gtfs.build(path, out, state, jobs=1).values()) == {None}
@@ -0,0 +1,31 @@
+"""HistoryReader.train reports a train's state as of the start of the range."""
+import history_store
+
+T = 1_700_000_000
+
+def train(num, lat):
+    return {"trainNum": num, "trainID": f"{num}-1", "lat": lat, "stations": []}
+
+def record(tmp_path, segment_seconds=3600):
+    rec = history_store.HistoryRecorder(str(tmp_path), 86400 * 365 * 10, 1 << 30, segment_seconds=segment_seconds)
+    a0, a1 = train("1", 40.0), train("1", 41.0)
+    for dt, lat_b in ((0, 1.0), (60, 2.0), (120, 3.0)):
+        rec.record(T + dt, {"1|1-1": a0, "2|2-1": train("2", lat_b)})
+    rec.record(T + 180, {"1|1-1": a1, "2|2-1": train("2", 3.0)})
+    rec._close()
+    return history_store.HistoryReader(str(tmp_path)), a0, a1
+
+def test_unchanged_train_is_reported_at_range_start(tmp_path):
+    reader, a0, _ = record(tmp_path)
+    assert list(reader.train("1", T + 70, T + 170)) == [(T + 70, "1|1-1", a0)]
+
+def test_state_at_start_then_changes(tmp_path):
+    reader, a0, a1 = record(tmp_path)
+    assert list(reader.train("1", T + 30, T + 200)) == [(T + 30, "1|1-1", a0), (T + 180, "1|1-1", a1)]
+    assert list(reader.train("1", T - 100, T - 10)) == []
+
+def test_range_inside_a_later_segment(tmp_path):
+    reader, a0, a1 = record(tmp_path, segment_seconds=100)   # second segment opens at T+120
+    assert len(reader.segments(T, T + 200)) == 2
+    assert list(reader.train("1", T + 130, T + 170)) == [(T + 130, "1|1-1", a0)]
+    assert list(reader.train("1", T + 90, T + 200)) == [(T + 90, "1|1-1", a0), (T + 180, "1|1-1", a1)]
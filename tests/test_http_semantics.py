@@ -0,0 +1,53 @@
+"""Range parsing and HEAD requests on the static/auth path."""
+import http.client
+import pytest
+import server
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=50-500", (50, 99)),
+    ("bytes=abc", None),
+    ("bytes=1-x", None),
+    ("bytes=-", None),
+    ("bytes=9-3", None),
+    ("bytes=²-3", None),
+    ("items=0-9", None),
+    ("bytes=0-1,5-6", None),
+])
+def test_parse_range(header, expected):
+    assert server.parse_range(header, 100) == expected
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-300", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(ValueError):
+        server.parse_range(header, 100)
+
+def head(addr, path):
+    conn = http.client.HTTPConnection(*addr, timeout=10)
+    conn.request("HEAD", path)
+    resp = conn.getresponse()
+    body = resp.read()
+    conn.close()
+    return resp, body
+
+def test_head_goes_through_auth(addr):
+    resp, body = head(addr, "/app.js")
+    assert resp.status == 401 and body == b""
+
+def test_head_matches_get_headers(addr, fetch):
+    resp, body = head(addr, "/login.js")
+    status, get_body = fetch("/login.js")
+    assert resp.status == status == 200
+    assert body == b""
+    assert int(resp.headers["Content-Length"]) == len(get_body)
+    assert resp.headers["ETag"] == server.STATIC_FILES.get("/login.js").etag
+    # the connection's wfile is restored: a GET on a kept-alive connection still works
+    conn = http.client.HTTPConnection(*addr, timeout=10)
+    conn.request("HEAD", "/login.js")
+    conn.getresponse().read()
+    conn.request("GET", "/login.js")
+    assert conn.getresponse().read() == get_body
+    conn.close()
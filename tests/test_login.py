@@ -0,0 +1,22 @@
+"""LoginVerifier admission: a timed-out hash keeps its slot until it finishes."""
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import pytest
+import add_user
+import server
+
+def test_timed_out_hash_still_counts_against_the_queue(monkeypatch):
+    verifier = server.LoginVerifier(1, 1)
+    verifier._pool = ThreadPoolExecutor(1)
+    slow = add_user.pbkdf2_hash("secret", iterations=1_000_000)
+    monkeypatch.setattr(server, "LOGIN_TIMEOUT_SECONDS", 0.01)
+    with pytest.raises(TimeoutError):
+        verifier.verify(slow, "secret")
+    with pytest.raises(server.LoginBusy):
+        verifier.verify(slow, "secret")
+    deadline = time.monotonic() + 30
+    while verifier.stats["queue_depth"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    monkeypatch.setattr(server, "LOGIN_TIMEOUT_SECONDS", 30)
+    assert verifier.verify(add_user.pbkdf2_hash("secret", iterations=1000), "secret")
+    verifier._pool.shutdown()
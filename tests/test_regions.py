@@ -0,0 +1,21 @@
+"""Region-restricted accounts fail closed when their profile is not loaded."""
+import server
+
+def test_unknown_region_is_refused(fetch, monkeypatch):
+    monkeypatch.setattr(server, "REGIONS", {})
+    token = server.create_session("necoperations", ["*"], {"region": "nec"})
+    try:
+        assert fetch("/data/stops.json", token)[0] == 403
+        assert fetch("/rt/board?station=NYP", token)[0] == 403
+    finally:
+        server.destroy_session(token)
+
+def test_unrestricted_account_unaffected(fetch, monkeypatch):
+    monkeypatch.setattr(server, "REGIONS", {})
+    monkeypatch.setattr(server, "DATA_PROFILES", (None,))
+    monkeypatch.setattr(server.Handler, "_data_version", None)
+    token = server.create_session("alexjs", ["*"])
+    try:
+        assert fetch("/data/stops.json", token)[0] == 200
+    finally:
+        server.destroy_session(token)
@@ -0,0 +1,25 @@
+"""SessionStore behaviour when sessions are shared through the database."""
+import multiprocessing
+import server
+
+def test_sweeper_starts_for_sessions_loaded_from_db(tmp_path):
+    db = str(tmp_path / "sessions.db")
+    creator, worker = server.SessionStore(db_path=db), server.SessionStore(db_path=db)
+    token = creator.create("alexjs", ["*"])
+    assert worker._sweeper is None
+    assert worker.get(token)["username"] == "alexjs"
+    assert worker._sweeper is not None and worker._sweeper.is_alive()
+
+def _logout(db: str, token: str):
+    server.SessionStore(db_path=db).destroy(token)
+
+def test_logout_in_another_process_revokes_immediately(tmp_path):
+    db = str(tmp_path / "sessions.db")
+    worker = server.SessionStore(db_path=db)
+    token = worker.create("alexjs", ["*"])
+    assert worker.get(token)["username"] == "alexjs"   # now cached in this process
+    proc = multiprocessing.get_context("fork").Process(target=_logout, args=(db, token))
+    proc.start()
+    proc.join(10)
+    assert proc.exitcode == 0
+    assert worker.get(token) is None
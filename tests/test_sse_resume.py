@@ -0,0 +1,70 @@
+"""Last-Event-ID resume only replays deltas for IDs this hub issued."""
+import json, time
+import server
+
+class Sub:
+    def __init__(self):
+        self.data = b""
+    def send(self, data):
+        self.data += data
+    def close(self):
+        pass
+
+def snap(version, lat, epoch="e1"):
+    trains = {"1": [{"trainNum": "1", "trainID": "1-1", "lat": lat, "lon": 0}]}
+    return server.RealtimeSnapshot("trains", json.dumps(trains).encode(), "application/json", version, time.time(),
+                                   epoch=epoch)
+
+def events(sub):
+    return [line.split(": ", 1)[1] for line in sub.data.decode().splitlines() if line.startswith("event: ")]
+
+def ids(sub):
+    return [line.split(": ", 1)[1] for line in sub.data.decode().splitlines() if line.startswith("id: ")]
+
+def hub_with_history(epoch="e1", versions=(1, 2, 3)):
+    hub = server.SSEHub()
+    for v in versions:
+        hub.ingest(snap(v, float(v), epoch))
+    return hub
+
+SCOPE = (frozenset(), frozenset(), None)
+
+def test_resume_within_epoch_replays_missed_deltas():
+    hub = hub_with_history()
+    first = Sub()
+    hub.subscribe(first, SCOPE, None)
+    assert events(first) == ["snapshot"]
+    hub.ingest(snap(4, 4.0))
+    hub.ingest(snap(5, 5.0))
+    last = ids(first)[-2]   # missed the last delta
+    again = Sub()
+    hub.subscribe(again, SCOPE, last)
+    assert events(again) == ["delta"]
+    assert ids(again) == ids(first)[-1:]
+
+def test_id_from_another_run_gets_full_state():
+    hub = hub_with_history(epoch="e2")   # restarted poller: same versions, new epoch
+    sub = Sub()
+    hub.subscribe(sub, SCOPE, "e1-1")
+    assert events(sub) == ["snapshot"]
+
+def test_ids_agree_across_workers():
+    # Two workers following one supervisor; the second never saw version 2.
+    a = hub_with_history(versions=(1, 2, 3))
+    b = hub_with_history(versions=(1, 3))
+    sub = Sub()
+    b.subscribe(sub, SCOPE, "e1-1")
+    assert events(sub) == ["delta"] and ids(sub) == ["e1-3"]
+    sub = Sub()
+    b.subscribe(sub, SCOPE, "e1-2")   # only a's deltas lead from 2
+    assert events(sub) == ["snapshot"] and ids(sub) == ["e1-3"]
+    sub = Sub()
+    a.subscribe(sub, SCOPE, "e1-2")
+    assert events(sub) == ["delta"] and ids(sub) == ["e1-3"]
+
+def test_malformed_id_gets_full_state():
+    hub = hub_with_history()
+    for bad in ("2", "nonsense", "e1-x", "e1-99"):
+        sub = Sub()
+        hub.subscribe(sub, SCOPE, bad)
+        assert events(sub) == ["snapshot"]
@@ -0,0 +1,13 @@
+"""/rt/stream tells the client to back off when the hub refuses it late."""
+import server
+
+def test_refused_subscription_sends_retry_frame(fetch, monkeypatch):
+    monkeypatch.setattr(server.SNAPSHOTS, "get", lambda name: None)
+    monkeypatch.setattr(server.SSE_HUB, "subscribe", lambda sub, scope, last_id: False)
+    token = server.create_session("alexjs", ["*"])
+    try:
+        status, body = fetch("/rt/stream", token)
+    finally:
+        server.destroy_session(token)
+    assert status == 200
+    assert body == server.SSE_FULL_FRAME
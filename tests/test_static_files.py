@@ -0,0 +1,21 @@
+"""StaticFiles validators match the bytes that are actually sent."""
+import hashlib
+import server
+
+def _site(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "assets" / "site.css").write_text("body{margin:0}\n")
+    (tmp_path / "index.html").write_text('<link rel="stylesheet" href="/assets/site.css">\n')
+    return server.StaticFiles(str(tmp_path))
+
+def test_in_memory_body_is_rewritten(tmp_path):
+    f = _site(tmp_path).get("/index.html")
+    assert b"/assets/site.css?v=" in f.body.raw
+    assert f.etag == f.body.etag
+
+def test_over_budget_file_validates_disk_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "STATIC_MEMORY_MAX_BYTES", 0)
+    f = _site(tmp_path).get("/index.html")
+    assert f.body is None
+    disk = (tmp_path / "index.html").read_bytes()
+    assert f.etag == '"%s"' % hashlib.blake2b(disk).hexdigest()[:24]
@@ -0,0 +1,18 @@
+"""Percent-encoded dot segments must not reach files outside the public route."""
+import pytest
+
+@pytest.mark.parametrize("path", [
+    "/assets/%2e%2e/data/tripmap.json",
+    "/assets/%2e%2e/app%2ejs",
+    "/assets/%2e%2e/station_detail%2ehtml",
+    "/assets/%2E%2E/%2E%2E/server.py",
+    "/assets/..%2fapp.js",
+    "/assets/%2e/../app.js",
+])
+def test_dot_segments_are_refused(fetch, path):
+    assert fetch(path)[0] == 404
+
+def test_protected_files_still_need_login(fetch):
+    assert fetch("/app.js")[0] == 401
+    assert fetch("/data/tripmap.json")[0] == 401
+    assert fetch("/login.js")[0] == 200